@@ -1,4 +1,4 @@
-# Runs the flask app
+# Runs the flask app (development server; production: python -m finance_app.server)
 from finance_app import create_app
 
 app = create_app()
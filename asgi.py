@@ -0,0 +1,5 @@
+# Runs the app under an ASGI server: uvicorn asgi:app
+from finance_app import create_app
+from finance_app.asgi import ASGIApp
+
+app = ASGIApp(create_app())
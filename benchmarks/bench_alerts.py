@@ -0,0 +1,75 @@
+"""
+Nightly budget-alert evaluation time against the number of users.
+
+Each user gets a budget for every category this month and `expenses`
+expenses this month. Reports the set-based `alerts.evaluate_all` pass and,
+for comparison, one `get_budget_status` call per budget (what the dashboard
+did per request), per user count.
+
+    python -m benchmarks.bench_alerts [user counts] [expenses per user]
+"""
+import random
+import sqlite3
+import sys
+import time
+from datetime import date
+
+from benchmarks.common import DESCRIPTIONS, make_app
+
+CATEGORIES = sorted({category for _, category in DESCRIPTIONS})
+
+
+def seed(db_path, users, expenses, seed=42):
+    rng = random.Random(seed)
+    today = date.today()
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT INTO user (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+                     [(user_id, f'user{user_id}', f'user{user_id}@example.com', '-')
+                      for user_id in range(1, users + 1)])
+    conn.executemany('INSERT INTO budget (user_id, category, amount, month, year) VALUES (?, ?, ?, ?, ?)',
+                     [(user_id, category, rng.choice((50, 200, 500)), today.month, today.year)
+                      for user_id in range(1, users + 1) for category in CATEGORIES])
+    conn.executemany('INSERT INTO expense (user_id, description, amount, category, date) VALUES (?, ?, ?, ?, ?)',
+                     [(user_id, description, round(rng.uniform(2, 120), 2), category,
+                       today.replace(day=rng.randint(1, today.day)).isoformat())
+                      for user_id in range(1, users + 1)
+                      for description, category in rng.choices(DESCRIPTIONS, k=expenses)])
+    conn.commit()
+    conn.close()
+
+
+def run(users, expenses):
+    app, db_path = make_app()
+    seed(db_path, users, expenses)
+    from finance_app import alerts
+    from finance_app.database import connect
+    from finance_app.utils import get_budget_status
+
+    conn = connect(db_path)
+    conn.isolation_level = None
+    started = time.perf_counter()
+    _, alert_count = alerts.evaluate_all(conn)
+    batch = time.perf_counter() - started
+
+    today = date.today()
+    budgets = conn.execute('SELECT user_id, category FROM budget').fetchall()
+    conn.close()
+    with app.app_context():
+        started = time.perf_counter()
+        for user_id, category in budgets:
+            get_budget_status(user_id, category, today.month, today.year)
+        per_budget = time.perf_counter() - started
+
+    print(f'  {users:>7} users {alert_count:>8} alerts  set-based {batch:8.3f} s'
+          f' ({batch / users * 1e6:6.1f} µs/user)   per budget {per_budget:8.3f} s')
+
+
+def main(user_counts=(1000, 5000, 20000), expenses=20):
+    print(f'{len(CATEGORIES)} budgets and {expenses} expenses per user this month')
+    for users in user_counts:
+        run(users, expenses)
+
+
+if __name__ == '__main__':
+    main([int(count) for count in sys.argv[1].split(',')] if len(sys.argv) > 1 else (1000, 5000, 20000),
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,94 @@
+"""
+Fast reads next to slow exports: WSGI (gunicorn gthread) against the ASGI
+front end (uvicorn + asgi.py lanes), with the same number of handler threads.
+
+`fast` clients request /api/dashboard while `slow` clients repeatedly export
+a user with `rows` expenses. Under WSGI the exports can take every thread;
+under ASGI they queue in the slow lane. Reports dashboard req/s and latency,
+and the number of exports completed.
+
+    python -m benchmarks.bench_asgi [fast] [slow] [duration] [rows]
+
+Needs gunicorn and uvicorn installed; a missing server is skipped.
+"""
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+from benchmarks.common import seed_expenses
+from benchmarks.load_test import EXPENSES_PER_USER, Client, free_port, report, run_mix, wait_until_up
+
+# Handler threads given to both servers; ASGI splits them between its lanes
+THREADS = 8
+SLOW_THREADS = 2
+
+
+def server_command(mode, port, directory):
+    """(argv, extra env) starting the server for mode, or None if it is not installed"""
+    if mode == 'wsgi':
+        if importlib.util.find_spec('gunicorn') is None:
+            return None
+        return [sys.executable, '-m', 'finance_app.server'], {
+            'WEB_CONCURRENCY': '1', 'WEB_THREADS': str(THREADS), 'BIND': f'127.0.0.1:{port}',
+            'PIDFILE': os.path.join(directory, 'server.pid'),
+        }
+    if importlib.util.find_spec('uvicorn') is None:
+        return None
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning',
+            '--timeout-graceful-shutdown', '5'], {
+        'ASGI_THREADS': str(THREADS - SLOW_THREADS), 'ASGI_SLOW_THREADS': str(SLOW_THREADS),
+    }
+
+
+def run(mode, fast_count, slow_count, duration, rows):
+    directory = tempfile.mkdtemp(prefix=f'mbh-{mode}-')
+    db_path = os.path.join(directory, 'bench.db')
+    port = free_port()
+    command = server_command(mode, port, directory)
+    if command is None:
+        print(f'  {mode:8} skipped, server not installed')
+        return
+    argv, extra = command
+    server = subprocess.Popen(argv, env=dict(os.environ, DATABASE_URL=db_path, **extra),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up('127.0.0.1', port)
+        fast = [Client('127.0.0.1', port, f'fast-{i}') for i in range(fast_count)]
+        for client in fast:
+            seed_expenses(db_path, client.user_id, EXPENSES_PER_USER, seed=client.user_id)
+        # Every slow client exports the same large account
+        slow = [Client('127.0.0.1', port, 'exporter') for _ in range(slow_count)]
+        seed_expenses(db_path, slow[0].user_id, rows)
+
+        results = {}
+
+        def exports():
+            results['slow'] = run_mix(slow, duration, mix=[('GET', '/api/export', 1)])
+
+        exporter = threading.Thread(target=exports)
+        exporter.start()
+        latencies, errors = run_mix(fast, duration, mix=[('GET', '/api/dashboard', 1)])
+        exporter.join()
+        report(mode, latencies, errors, duration)
+        print(f'  {"":8} {len(results["slow"][0])} exports of {rows} rows')
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main(fast_count=16, slow_count=8, duration=20, rows=100000):
+    print(f'{fast_count} dashboard clients, {slow_count} export clients, {duration}s, '
+          f'{THREADS} handler threads')
+    for mode in ('wsgi', 'asgi'):
+        run(mode, fast_count, slow_count, duration, rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 20,
+         int(sys.argv[4]) if len(sys.argv) > 4 else 100000)
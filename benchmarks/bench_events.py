@@ -0,0 +1,63 @@
+"""
+Cost of the live-update polls against the dashboard reloads they replace.
+
+An open dashboard polls `/api/events` every `events.POLL_INTERVAL_MS`; a
+poll with nothing new reads two rows by primary key. Reports the time per
+idle poll, per poll delivering one expense write, and per `/api/dashboard`
+reload (what a client without live updates repeats), then the share of one
+CPU that `dashboards` open dashboards cost at the poll interval.
+
+    python -m benchmarks.bench_events [expenses] [dashboards]
+"""
+import sys
+import time
+from datetime import date
+
+from benchmarks.common import make_app, login_client, seed_expenses
+
+
+def per_request(client, path, count, **kwargs):
+    started = time.perf_counter()
+    for _ in range(count):
+        response = client.get(path, **kwargs)
+        response.get_data()
+    return (time.perf_counter() - started) / count
+
+
+def main(expenses=20000, dashboards=1000):
+    app, db_path = make_app()
+    client, user_id = login_client(app)
+    seed_expenses(db_path, user_id, expenses)
+    from finance_app import events
+
+    version = client.get('/api/dashboard').get_json()['version']
+    idle = per_request(client, f'/api/events?since={version}', 2000)
+
+    writer, _ = login_client(app)
+    today = date.today().isoformat()
+    started = time.perf_counter()
+    delivered = 0
+    for _ in range(300):
+        writer.post('/api/expenses', json={'description': 'Coffee', 'amount': 3.5, 'category': 'Food', 'date': today})
+        poll_started = time.perf_counter()
+        body = client.get('/api/events', headers={'Last-Event-ID': str(version)}).get_data(as_text=True)
+        delivered += time.perf_counter() - poll_started
+        version += 1
+        assert 'event: expense' in body, body
+    changed = delivered / 300
+    writes = time.perf_counter() - started
+
+    reload = per_request(client, '/api/dashboard', 50)
+    polls_per_second = dashboards * 1000 / events.POLL_INTERVAL_MS
+    print(f'{expenses} expenses, poll every {events.POLL_INTERVAL_MS} ms')
+    print(f'  idle poll             {idle * 1e6:8.0f} µs')
+    print(f'  poll with a write     {changed * 1e6:8.0f} µs   ({writes / 300 * 1e3:.2f} ms per write and poll)')
+    print(f'  dashboard reload      {reload * 1e6:8.0f} µs')
+    print(f'  {dashboards} open dashboards: {polls_per_second:.0f} polls/s, '
+          f'{polls_per_second * idle:.1%} of one CPU when idle '
+          f'(reloading at the same interval: {polls_per_second * reload:.0%})')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
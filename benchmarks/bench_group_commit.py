@@ -0,0 +1,59 @@
+"""
+Concurrent single-expense inserts with one commit per request and with
+WRITE_BATCHING (group commit).
+
+`writers` users each POST expenses from their own thread for `duration`
+seconds, like clients flushing queued entries. Reports inserts/sec and
+latency per run.
+
+    python -m benchmarks.bench_group_commit [writers] [duration]
+"""
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks.common import make_app, login_client
+
+
+def run(batching, writer_count, duration):
+    app, db_path = make_app(WRITE_BATCHING=int(batching))
+    clients = [login_client(app, f'writer{i}')[0] for i in range(writer_count)]
+    stop_at = time.monotonic() + duration
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def write(client):
+        local, failed = [], 0
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            response = client.post('/api/expenses', json={
+                'description': 'Coffee', 'amount': 3.5, 'category': 'Food', 'date': '2024-01-15'})
+            local.append(time.perf_counter() - started)
+            failed += response.status_code != 201
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=write, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    q = statistics.quantiles(sorted(latencies), n=100)
+    label = 'batched' if batching else 'per-request'
+    print(f'  {label:12} {len(latencies) / duration:8.1f} inserts/s'
+          f'  p50 {q[49] * 1000:7.1f} ms  p99 {q[98] * 1000:7.1f} ms  errors {sum(errors)}')
+
+
+def main(writer_count=16, duration=10):
+    print(f'{writer_count} writers, {duration}s per run')
+    run(False, writer_count, duration)
+    run(True, writer_count, duration)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,120 @@
+"""
+Statement import throughput per format and, for CSV, per worker count.
+
+Generates statements of random rows (CSV, OFX, QIF and XLSX) and imports
+each into a fresh user, reporting rows/sec. Fresh users keep the
+fingerprint index from turning rows into duplicates.
+
+    python -m benchmarks.bench_import [row_count] [max_workers]
+"""
+import io
+import os
+import random
+import sys
+import zipfile
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from benchmarks.common import DESCRIPTIONS, make_app, login_client
+
+
+def make_transactions(count, seed=42):
+    """count (description, amount, category, day) tuples"""
+    rng = random.Random(seed)
+    today = date.today()
+    transactions = []
+    for _ in range(count):
+        description, category = rng.choice(DESCRIPTIONS)
+        day = today - timedelta(days=rng.randrange(730))
+        # Leave some categories empty so categorize_transaction runs
+        transactions.append((description, rng.uniform(2, 200), category if rng.random() < 0.5 else '', day))
+    return transactions
+
+
+def make_csv(transactions):
+    lines = ['description,amount,category,date']
+    for description, amount, category, day in transactions:
+        lines.append(f'{description},{amount:.2f},{category},{day.isoformat()}')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def make_ofx(transactions):
+    """OFX 1.x (SGML) bank statement, debits as negative TRNAMT"""
+    parts = ['OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n']
+    for i, (description, amount, _, day) in enumerate(transactions):
+        parts.append(
+            f'<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>{day.strftime("%Y%m%d")}120000.000[-5:EST]\n'
+            f'<TRNAMT>-{amount:.2f}\n<FITID>{i}\n<NAME>{escape(description)}\n</STMTTRN>\n'
+        )
+    parts.append('</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def make_qif(transactions):
+    parts = ['!Type:Bank\n']
+    for description, amount, category, day in transactions:
+        parts.append(f'D{day.strftime("%m/%d/%Y")}\nT-{amount:,.2f}\nP{description}\n')
+        if category:
+            parts.append(f'L{category}\n')
+        parts.append('^\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def make_xlsx(transactions):
+    """Minimal workbook: shared strings for text, serial day numbers for dates"""
+    strings = ['description', 'amount', 'category', 'date']
+    index = {value: i for i, value in enumerate(strings)}
+
+    def shared(value):
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    epoch = date(1899, 12, 30)
+    rows = ['<row r="1">' + ''.join(f'<c r="{col}1" t="s"><v>{i}</v></c>' for i, col in enumerate('ABCD')) + '</row>']
+    for n, (description, amount, category, day) in enumerate(transactions, start=2):
+        category_cell = f'<c r="C{n}" t="s"><v>{shared(category)}</v></c>' if category else ''
+        rows.append(
+            f'<row r="{n}"><c r="A{n}" t="s"><v>{shared(description)}</v></c><c r="B{n}"><v>{amount:.2f}</v></c>'
+            f'{category_cell}<c r="D{n}"><v>{(day - epoch).days}</v></c></row>'
+        )
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('xl/worksheets/sheet1.xml',
+                         f'<?xml version="1.0"?><worksheet {ns}><sheetData>{"".join(rows)}</sheetData></worksheet>')
+        archive.writestr('xl/sharedStrings.xml',
+                         f'<?xml version="1.0"?><sst {ns}>'
+                         + ''.join(f'<si><t>{escape(value)}</t></si>' for value in strings) + '</sst>')
+    return buffer.getvalue()
+
+
+FORMATS = [('csv', make_csv), ('ofx', make_ofx), ('qif', make_qif), ('xlsx', make_xlsx)]
+
+
+def main(count=200000, max_workers=None):
+    app, _ = make_app()
+    from finance_app.database import get_db
+    from finance_app.importer import import_file
+
+    transactions = make_transactions(count)
+    max_workers = max_workers or os.cpu_count() or 1
+    runs = [('csv', 1)] + [('csv', workers) for workers in sorted({2, max_workers}) if max_workers > 1]
+    runs += [(extension, 1) for extension, _ in FORMATS[1:]]
+    files = {extension: make(transactions) for extension, make in FORMATS}
+
+    print(f'{count} transactions')
+    for extension, workers in runs:
+        data = files[extension]
+        _, user_id = login_client(app, username=f'bench-{extension}-{workers}')
+        with app.app_context():
+            result = import_file(get_db(), user_id, f'statement.{extension}', io.BytesIO(data),
+                                 workers=workers, parallel_min_size=0)
+        print(f'  {extension:4} workers={workers:2}  {len(data) / 1024 / 1024:6.1f} MB  {result.seconds:6.2f} s'
+              f'  {result.rows_per_second:9,} rows/s  (imported {result.imported_count})')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,51 @@
+"""
+Serialization share of /api/expenses latency per JSON backend.
+
+Times the full request, then the encoding of the same payload alone, for
+Flask's stdlib encoder (the old path) and for RecordJSONProvider with each
+available backend, buffered and streamed.
+
+    python -m benchmarks.bench_json [expense_count]
+"""
+import sys
+
+from benchmarks.common import make_app, login_client, seed_expenses, timed
+
+
+def main(count=50000):
+    app, db_path = make_app()
+    client, user_id = login_client(app)
+    seed_expenses(db_path, user_id, count)
+
+    from flask.json.provider import DefaultJSONProvider
+    from finance_app.json_provider import RecordJSONProvider, orjson
+    from finance_app.models import Expense
+
+    with app.test_request_context():
+        from finance_app.database import get_db
+        rows = get_db().execute('SELECT * FROM expense WHERE user_id = ? ORDER BY date DESC', (user_id,)).fetchall()
+    dicts = [dict(row) for row in rows]
+    records = Expense.from_rows(rows)
+
+    request_time = timed(lambda: client.get('/api/expenses').get_data(), repeat=3)
+    print(f'{count} expenses, GET /api/expenses ({app.json.backend}): {request_time * 1000:.1f} ms')
+
+    backends = ['json'] + (['orjson'] if orjson is not None else [])
+    cases = [('flask default, dicts', DefaultJSONProvider(app), dicts, False)]
+    for backend in backends:
+        app.config['JSON_BACKEND'] = backend
+        provider = RecordJSONProvider(app)
+        cases.append((f'{backend}, records', provider, records, False))
+        cases.append((f'{backend}, records, streamed', provider, records, True))
+
+    for label, provider, payload, streamed in cases:
+        if streamed:
+            encode = lambda: ''.join(provider.iter_object({'expenses': payload}, 'expenses'))
+        else:
+            encode = lambda: provider.dumps({'expenses': payload})
+        seconds = timed(encode, repeat=3)
+        print(f'  encode [{label:30}] {seconds * 1000:8.1f} ms  ({seconds / request_time:5.1%} of request)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
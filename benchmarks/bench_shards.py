@@ -0,0 +1,83 @@
+"""
+Small writes during a large import, with everything in one database and
+with DB_SHARDS files.
+
+One user uploads a `rows`-row CSV (committed in batches) while
+`writers` other users keep adding single expenses. Reports the upload time
+and the latency of the small writes, split by whether the writer shares the
+importing user's shard. Requests that fail (e.g. "database is locked" after
+SQLite's 5s busy timeout) are counted as errors.
+
+    python -m benchmarks.bench_shards [rows] [writers] [shards]
+"""
+import io
+import sys
+import threading
+import time
+
+from benchmarks.bench_import import make_csv, make_transactions
+from benchmarks.common import make_app, login_client
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def run(shards, rows, writer_count):
+    app, _ = make_app(DB_SHARDS=shards)
+    importer, importer_id = login_client(app, 'importer')
+    writers = [login_client(app, f'writer{i}') for i in range(writer_count)]
+    data = make_csv(make_transactions(rows))
+    importing = threading.Event()
+    done = threading.Event()
+    results = {}
+
+    def upload():
+        importing.set()
+        started = time.perf_counter()
+        response = importer.post('/api/upload', data={'file': (io.BytesIO(data), 'statement.csv')})
+        results['upload'] = (time.perf_counter() - started, response.status_code)
+        done.set()
+
+    def write(client, user_id):
+        importing.wait()
+        latencies, errors = [], 0
+        while not done.is_set():
+            started = time.perf_counter()
+            response = client.post('/api/expenses', json={
+                'description': 'Coffee', 'amount': 3.5, 'category': 'Food', 'date': '2024-01-15'})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 201
+        same = shards and user_id % shards == importer_id % shards
+        results.setdefault('same' if not shards or same else 'other', []).append((latencies, errors))
+
+    threads = [threading.Thread(target=upload)] + [
+        threading.Thread(target=write, args=writer) for writer in writers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    seconds, status = results['upload']
+    print(f'  shards={shards}  upload {seconds:5.2f} s (HTTP {status})')
+    for group, label in (('same', 'same file as the import'), ('other', 'other shards')):
+        if group not in results:
+            continue
+        latencies = [value for values, _ in results[group] for value in values]
+        errors = sum(errors for _, errors in results[group])
+        print(f'    {len(results[group])} writers on {label:23} {len(latencies):5} writes'
+              f'  p50 {percentile(latencies, 0.5):7.1f} ms  p99 {percentile(latencies, 0.99):7.1f} ms'
+              f'  max {max(latencies) * 1000:7.1f} ms  errors {errors}'
+              if latencies else f'    {label}: no writes')
+
+
+def main(rows=100000, writer_count=6, shards=4):
+    print(f'{rows}-row upload alongside {writer_count} writers')
+    run(0, rows, writer_count)
+    run(shards, rows, writer_count)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 6,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 4)
@@ -0,0 +1,78 @@
+"""
+Process startup cost: imports, create_app on a new and on a current database.
+
+Each measurement runs in a fresh interpreter, as a restarted worker would.
+Also times re-running every migration step on a current database holding
+row_count expenses, which is what startup did before schema versioning.
+
+    python -m benchmarks.bench_startup [runs] [row_count]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import seed_expenses
+
+PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+from finance_app import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'heavy_modules': [name for name in ('numpy', 'multiprocessing', 'xml.etree.ElementTree')
+                      if name in sys.modules],
+}))
+'''
+
+
+def probe(db_path):
+    env = dict(os.environ, DATABASE_URL=db_path)
+    output = subprocess.run([sys.executable, '-c', PROBE], env=env, check=True,
+                            capture_output=True, text=True, cwd=os.getcwd()).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def rerun_migrations(db_path, repeat=20):
+    """Median ms to run every migration step again, ignoring the version"""
+    from finance_app.database import connect
+    from finance_app.migrations import MIGRATIONS
+    conn = connect(db_path)
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        for step in MIGRATIONS:
+            step(cursor)
+        conn.commit()
+        times.append((time.perf_counter() - started) * 1000)
+    conn.close()
+    return statistics.median(times)
+
+
+def main(runs=5, rows=200000):
+    directory = tempfile.mkdtemp(prefix='mbh-startup-')
+    fresh = [probe(os.path.join(directory, f'fresh{i}.db')) for i in range(runs)]
+    current_db = os.path.join(directory, 'fresh0.db')
+    seed_expenses(current_db, 1, rows)
+    current = [probe(current_db) for _ in range(runs)]
+
+    print(f'{rows} expenses in the current database')
+    for label, results in (('new database', fresh), ('current database', current)):
+        print(f'{label:17} import {statistics.median(r["import_ms"] for r in results):6.1f} ms'
+              f'  create_app {statistics.median(r["create_app_ms"] for r in results):6.1f} ms'
+              f'  heavy modules loaded: {", ".join(results[0]["heavy_modules"]) or "none"}')
+    print(f're-running all DDL on a current database (pre-versioning startup): '
+          f'{rerun_migrations(current_db):.1f} ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
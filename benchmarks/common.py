@@ -0,0 +1,75 @@
+"""
+Shared helpers for the benchmark scripts: a throwaway app, a seeded user and
+a logged-in test client. Run benchmarks from the repository root, e.g.
+``python -m benchmarks.bench_json``.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+DESCRIPTIONS = [
+    ('Grocery Store', 'Food'), ('Starbucks Coffee', 'Food'), ('Uber Ride', 'Transport'),
+    ('Shell Gas Station', 'Transport'), ('Netflix Subscription', 'Entertainment'),
+    ('Spotify Premium', 'Entertainment'), ('Amazon Purchase', 'Shopping'),
+    ('Electric Bill', 'Utilities'), ('CVS Pharmacy', 'Health'), ('Monthly Rent', 'Rent'),
+]
+
+
+def make_app(db_path=None, **config):
+    """Create the app against a temporary database and return (app, db_path)"""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='mbh-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = db_path
+    for key, value in config.items():
+        os.environ[key] = str(value)
+    from finance_app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app, db_path
+
+
+def login_client(app, username='bench'):
+    """Register (or log in) a benchmark user and return (client, user_id)"""
+    client = app.test_client()
+    password = 'benchmark'
+    response = client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com',
+        'password': password, 'confirm_password': password,
+    })
+    if response.status_code != 201:
+        response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    return client, response.get_json()['user']['id']
+
+
+def seed_expenses(db_path, user_id, count, days=730, seed=42):
+    """Insert count random expenses spread over the last `days` days"""
+    rng = random.Random(seed)
+    today = date.today()
+    from finance_app.recurring import merchant_hash
+    hashes = {description: merchant_hash(description) for description, _ in DESCRIPTIONS}
+    rows = []
+    for _ in range(count):
+        description, category = rng.choice(DESCRIPTIONS)
+        day = today - timedelta(days=rng.randrange(days))
+        rows.append((user_id, description, round(rng.uniform(2, 250), 2), category, day.isoformat(),
+                     hashes[description]))
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO expense (user_id, description, amount, category, date, merchant_hash) VALUES (?, ?, ?, ?, ?, ?)',
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat=5):
+    """Run fn repeat times and return the best wall time in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,193 @@
+"""
+Local load test of the production server, for choosing WEB_CONCURRENCY and
+WEB_THREADS.
+
+For each WORKERSxTHREADS configuration a server is started with
+``python -m finance_app.server`` on a throwaway database, one user per
+client is registered and seeded, and the clients replay a dashboard-heavy
+request mix for `duration` seconds. Reports requests/sec and latency
+percentiles per configuration.
+
+    python -m benchmarks.load_test [configs] [clients] [duration]
+    python -m benchmarks.load_test 1x8,3x8,3x16,5x4 32 20
+
+Set LOAD_TEST_URL to run the mix once against a server that is already up.
+"""
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from benchmarks.common import DESCRIPTIONS, seed_expenses
+
+# (method, path, weight): mostly dashboard reads with some writes, like the UI
+REQUEST_MIX = [
+    ('GET', '/api/dashboard', 50),
+    ('GET', '/api/charts/monthly', 15),
+    ('GET', '/api/budgets', 10),
+    ('GET', '/api/expenses?category=Food', 10),
+    ('POST', '/api/expenses', 15),
+]
+EXPENSES_PER_USER = 500
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/api/auth/check')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start within {timeout}s')
+
+
+class Client:
+    """One user with a keep-alive connection and its session cookie"""
+
+    def __init__(self, host, port, username):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookie = None
+        password = 'loadtest'
+        status, body = self.request('POST', '/api/auth/register', {
+            'username': username, 'email': f'{username}@example.com',
+            'password': password, 'confirm_password': password,
+        })
+        if status != 201:
+            status, body = self.request('POST', '/api/auth/login', {'username': username, 'password': password})
+        self.user_id = json.loads(body)['user']['id']
+
+    def request(self, method, path, payload=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect after the server closed a keep-alive connection
+            self.conn.close()
+            raise
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status, data
+
+
+def run_mix(clients, duration, mix=REQUEST_MIX, seed=42):
+    """Replay a request mix from one thread per client, returning (latencies, errors)"""
+    paths = [(method, path) for method, path, weight in mix for _ in range(weight)]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(client, rng):
+        local = []
+        failed = 0
+        while time.monotonic() < stop_at:
+            method, path = rng.choice(paths)
+            payload = None
+            if method == 'POST':
+                description, category = rng.choice(DESCRIPTIONS)
+                payload = {'description': description, 'amount': round(rng.uniform(2, 200), 2),
+                           'category': category, 'date': (date.today() - timedelta(days=rng.randrange(60))).isoformat()}
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, payload)
+            except (OSError, http.client.HTTPException):
+                status = None
+            local.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(client, random.Random(seed + i)))
+               for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors)
+
+
+def report(label, latencies, errors, duration):
+    latencies = sorted(latencies)
+    if not latencies:
+        print(f'  {label:8} no requests completed')
+        return
+    q = statistics.quantiles(latencies, n=100)
+    print(f'  {label:8} {len(latencies) / duration:8.1f} req/s'
+          f'  p50 {q[49] * 1000:7.1f} ms  p95 {q[94] * 1000:7.1f} ms  p99 {q[98] * 1000:7.1f} ms'
+          f'  errors {errors}')
+
+
+def load(host, port, client_count, duration, db_path=None, prefix='load'):
+    clients = [Client(host, port, f'{prefix}-{i}') for i in range(client_count)]
+    if db_path is not None:
+        for client in clients:
+            seed_expenses(db_path, client.user_id, EXPENSES_PER_USER, seed=client.user_id)
+    return run_mix(clients, duration)
+
+
+def run_config(workers, threads, client_count, duration):
+    directory = tempfile.mkdtemp(prefix='mbh-load-')
+    db_path = os.path.join(directory, 'load.db')
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=db_path, WEB_CONCURRENCY=str(workers), WEB_THREADS=str(threads),
+               BIND=f'127.0.0.1:{port}', PIDFILE=os.path.join(directory, 'server.pid'))
+    server = subprocess.Popen([sys.executable, '-m', 'finance_app.server'], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up('127.0.0.1', port)
+        return load('127.0.0.1', port, client_count, duration, db_path)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main(configs='1x8,3x8,3x16', client_count=32, duration=20):
+    url = os.environ.get('LOAD_TEST_URL')
+    print(f'{client_count} clients, {duration}s per run, {os.cpu_count()} CPUs')
+    if url:
+        parts = urlsplit(url)
+        latencies, errors = load(parts.hostname, parts.port or 80, client_count, duration,
+                                 prefix=f'load-{int(time.time())}')
+        report(parts.netloc, latencies, errors, duration)
+        return
+    for config in configs.split(','):
+        workers, threads = (int(n) for n in config.lower().split('x'))
+        latencies, errors = run_config(workers, threads, client_count, duration)
+        report(config, latencies, errors, duration)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else '1x8,3x8,3x16',
+         int(sys.argv[2]) if len(sys.argv) > 2 else 32,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 20)
@@ -1,22 +1,83 @@
 # Creates Flask app, connects DB
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_login import LoginManager
-from finance_app.database import init_db, close_db
+from finance_app.database import init_db, close_db, start_snapshot_refresher
 from finance_app.models import User
+from finance_app.json_provider import RecordJSONProvider
+from finance_app.admission import init_admission
+from finance_app.compression import init_compression
+from finance_app.static_assets import init_static
 import os
 
 
 def create_app():
     """Initialize Flask application with database and authentication"""
-    app = Flask(__name__, static_folder='../static', static_url_path='')
+    # Static files are served from an in-memory manifest, not Flask's static route
+    app = Flask(__name__, static_folder=None)
+    app.static_folder = '../static'
     
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    # Background jobs (snapshots, maintenance) report through app.logger
+    app.logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024  # max file size
+    app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')  # auto, orjson or json
+    app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))  # bytes
+    
+    # Serialize records with the fastest available JSON encoder
+    app.json = RecordJSONProvider(app)
     
     # Set database URL for sqlite3
     os.environ.setdefault('DATABASE_URL', 'finance_app.db')
+    # Per-user data spread over this many files next to DATABASE_URL (0 keeps everything in it)
+    app.config['DB_SHARDS'] = int(os.environ.get('DB_SHARDS', 0))
+    # Idle connections kept open per database file and process (0 opens one per request)
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 8))
+    # Read-only connections for GET requests, writer connection for mutations
+    app.config['DB_READ_ROUTING'] = os.environ.get('DB_READ_ROUTING', '0') == '1'
+    # Optional backup-API snapshot that analytics queries read instead of the live file
+    app.config['DB_SNAPSHOT_PATH'] = os.environ.get('DB_SNAPSHOT_PATH', '')
+    app.config['DB_SNAPSHOT_INTERVAL'] = int(os.environ.get('DB_SNAPSHOT_INTERVAL', 60))  # seconds
+    # Expenses older than this many months can be moved to the archive files (0 never archives)
+    app.config['ARCHIVE_AFTER_MONTHS'] = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 0))
+    # Background ANALYZE/optimize and incremental vacuum every this many seconds (0 disables it)
+    app.config['DB_MAINTENANCE_INTERVAL'] = int(os.environ.get('DB_MAINTENANCE_INTERVAL', 0))
+    app.config['DB_WAL_CHECKPOINT_MB'] = int(os.environ.get('DB_WAL_CHECKPOINT_MB', 64))
+    app.config['DB_VACUUM_STEP_PAGES'] = int(os.environ.get('DB_VACUUM_STEP_PAGES', 1000))
+    # Delta sync tombstones are kept this many days; clients further behind resync fully
+    app.config['SYNC_TOMBSTONE_DAYS'] = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 90))
+    # Dashboard/chart aggregates: 'sql' or 'columnar' (in-memory NumPy columns per user)
+    app.config['ANALYTICS_BACKEND'] = os.environ.get('ANALYTICS_BACKEND', 'sql')
+    app.config['ANALYTICS_CACHE_TTL'] = int(os.environ.get('ANALYTICS_CACHE_TTL', 300))  # seconds
+    app.config['ANALYTICS_CACHE_USERS'] = int(os.environ.get('ANALYTICS_CACHE_USERS', 1000))
+    # Large CSV imports are parsed by a process pool of this many processes per server process; 1 disables it
+    app.config['IMPORT_WORKERS'] = int(os.environ.get('IMPORT_WORKERS', 1))
+    app.config['IMPORT_PARALLEL_MIN_SIZE'] = int(os.environ.get('IMPORT_PARALLEL_MIN_SIZE', 4 * 1024 * 1024))  # bytes
+    # Date formats tried when detecting an import's format, in order (names from dates.DATE_FORMATS)
+    app.config['IMPORT_DATE_FORMATS'] = [
+        name.strip() for name in os.environ.get('IMPORT_DATE_FORMATS', '').split(',') if name.strip()
+    ] or None
+    # Commit expense writes of concurrent requests together, from one writer thread per database file
+    app.config['WRITE_BATCHING'] = os.environ.get('WRITE_BATCHING', '0') == '1'
+    app.config['WRITE_BATCH_WINDOW_MS'] = float(os.environ.get('WRITE_BATCH_WINDOW_MS', 2))
+    app.config['WRITE_BATCH_MAX'] = int(os.environ.get('WRITE_BATCH_MAX', 64))
+    app.config['WRITE_BATCH_TIMEOUT'] = float(os.environ.get('WRITE_BATCH_TIMEOUT', 30))
+    # Thread pools of the ASGI front end (asgi.py): general requests, exports/imports, event streams
+    app.config['ASGI_THREADS'] = int(os.environ.get('ASGI_THREADS', 16))
+    app.config['ASGI_SLOW_THREADS'] = int(os.environ.get('ASGI_SLOW_THREADS', 2))
+    app.config['ASGI_STREAM_THREADS'] = int(os.environ.get('ASGI_STREAM_THREADS', 4))
+    # ASGI: answer 503 once this many requests wait for a lane thread (0 never sheds)
+    app.config['LOAD_SHED_QUEUE'] = int(os.environ.get('LOAD_SHED_QUEUE', 0))
+    # Per-user token buckets ('endpoint=per minute/burst'), export/import caps and in-process shedding
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '0') == '1'
+    app.config['RATE_LIMITS'] = os.environ.get('RATE_LIMITS', 'dashboard=120/20,export=6/3,upload=6/3')
+    app.config['ANONYMOUS_RATE_LIMIT'] = os.environ.get('ANONYMOUS_RATE_LIMIT', '30/10')
+    app.config['SLOW_REQUESTS_PER_USER'] = int(os.environ.get('SLOW_REQUESTS_PER_USER', 1))
+    app.config['SLOW_REQUESTS_MAX'] = int(os.environ.get('SLOW_REQUESTS_MAX', 4))
+    app.config['LOAD_SHED_INFLIGHT'] = int(os.environ.get('LOAD_SHED_INFLIGHT', 0))
     
     # Register database cleanup
     app.teardown_appcontext(close_db)
@@ -43,30 +104,18 @@ def create_app():
         from flask import redirect, url_for
         return redirect('/login.html')
     
+    # Rate limits and load shedding, before any handler touches the database
+    init_admission(app)
+    
     # Register API blueprint
     from finance_app.api import api
     app.register_blueprint(api)
     
-    # Serve static HTML files
-    @app.route('/')
-    def index():
-        return send_from_directory(app.static_folder, 'index.html')
+    # Gzip/brotli responses, static assets are compressed once at startup
+    init_compression(app)
     
-    @app.route('/<path:path>')
-    def serve_static(path):
-        # Skip API routes - they're handled by the API blueprint
-        if path.startswith('api/'):
-            from flask import abort
-            abort(404)
-        
-        # Serve static files from static directory
-        try:
-            return send_from_directory(app.static_folder, path)
-        except:
-            # If file not found, try to serve index.html for HTML routes
-            if '.' not in path.split('/')[-1] or path.endswith('.html'):
-                return send_from_directory(app.static_folder, 'index.html')
-            raise
+    # Serve static HTML files from memory, with fingerprinted asset URLs
+    init_static(app)
     
     # Initialize database tables
     with app.app_context():
@@ -74,4 +123,11 @@ def create_app():
         # Create uploads directory if it doesn't exist
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
+    if app.config['DB_SNAPSHOT_PATH']:
+        start_snapshot_refresher(app)
+    
+    if app.config['DB_MAINTENANCE_INTERVAL']:
+        from finance_app.maintenance import start_maintenance
+        start_maintenance(app)
+    
     return app
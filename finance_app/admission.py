@@ -0,0 +1,197 @@
+# Admission control - per-user rate limits, concurrency caps and load shedding for expensive endpoints
+"""
+Checked in a before_request hook, in this order:
+
+    shedding     while this process is already handling LOAD_SHED_INFLIGHT
+                 requests, expensive endpoints get 503 before any database
+                 work (the ASGI front end also sheds requests queued behind
+                 LOAD_SHED_QUEUE, see asgi.py)
+    rate         a token bucket per user and endpoint (RATE_LIMITS) answers
+                 429 once the user's burst is spent; requests without a
+                 logged-in user share one bucket per address across the
+                 expensive endpoints (ANONYMOUS_RATE_LIMIT)
+    concurrency  at most SLOW_REQUESTS_PER_USER exports/imports per user, and
+                 SLOW_REQUESTS_MAX in the process, run at once; others get 429
+
+Rejections carry Retry-After. Limits are per process, so with several worker
+processes a user gets up to that many times the configured rate. Users are
+identified by current_user, whose lookup the view then reuses.
+"""
+import math
+import threading
+import time
+
+from flask import g, jsonify, request
+from flask_login import current_user
+
+# Endpoints (view names without the blueprint) counted as expensive
+EXPENSIVE_ENDPOINTS = ('dashboard', 'export', 'upload')
+# Expensive endpoints that hold a concurrency slot while they run
+SLOW_ENDPOINTS = ('export', 'upload')
+# Buckets kept before idle (full) ones are dropped
+MAX_BUCKETS = 100000
+# Retry-After of shed requests and concurrency rejections, seconds
+BUSY_RETRY_AFTER = 1
+
+
+def parse_limit(value):
+    """(tokens per second, burst) from '120/20' (per minute/burst), None when empty"""
+    if not value.strip():
+        return None
+    per_minute, _, burst = value.partition('/')
+    return float(per_minute) / 60, float(burst or per_minute)
+
+
+def parse_limits(spec):
+    """{'endpoint': (tokens per second, burst)} from 'dashboard=120/20,export=6/3' (per minute/burst)"""
+    limits = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        endpoint, _, value = part.partition('=')
+        limits[endpoint.strip()] = parse_limit(value)
+    return limits
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to burst; each request takes one"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Take a token, returning 0, or the seconds until one is available"""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate else math.inf
+
+
+class Admission:
+    """Buckets, slot counters and in-flight count of one process"""
+
+    def __init__(self, limits, anonymous_limit, per_user, slow_max, shed_inflight):
+        self.limits = limits
+        self.anonymous_limit = anonymous_limit
+        self.per_user = per_user
+        self.slow_max = slow_max
+        self.shed_inflight = shed_inflight
+        self.inflight = 0
+        self.slow = 0
+        self.slow_by_user = {}
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def rate_limit(self, client, endpoint):
+        """0 when the request may run, otherwise the seconds to wait
+
+        client is ('user', id) or ('address', ip); addresses share one
+        bucket across endpoints, limited by anonymous_limit.
+        """
+        if client[0] == 'address':
+            endpoint, limit = None, self.anonymous_limit
+        else:
+            limit = self.limits.get(endpoint)
+        if limit is None:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.buckets.get((client, endpoint))
+            if bucket is None:
+                if len(self.buckets) >= MAX_BUCKETS:
+                    self._drop_full(now)
+                bucket = self.buckets[(client, endpoint)] = TokenBucket(*limit, now)
+            return bucket.take(now)
+
+    def _drop_full(self, now):
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[key]
+
+    def acquire_slot(self, user):
+        """Take an export/import slot for the user, False when none is free"""
+        with self._lock:
+            running = self.slow_by_user.get(user, 0)
+            if (self.per_user and running >= self.per_user) or (self.slow_max and self.slow >= self.slow_max):
+                return False
+            self.slow_by_user[user] = running + 1
+            self.slow += 1
+            return True
+
+    def release_slot(self, user):
+        with self._lock:
+            self.slow -= 1
+            if self.slow_by_user[user] <= 1:
+                del self.slow_by_user[user]
+            else:
+                self.slow_by_user[user] -= 1
+
+    def enter(self):
+        """Count a request in, returning the number in flight before it"""
+        with self._lock:
+            self.inflight += 1
+            return self.inflight - 1
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+
+def rejected(status_code, message, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status_code
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def init_admission(app):
+    """Register the admission hooks when RATE_LIMIT_ENABLED is set"""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return
+    admission = app.extensions['admission'] = Admission(
+        parse_limits(app.config['RATE_LIMITS']),
+        parse_limit(app.config['ANONYMOUS_RATE_LIMIT']),
+        app.config['SLOW_REQUESTS_PER_USER'],
+        app.config['SLOW_REQUESTS_MAX'],
+        app.config['LOAD_SHED_INFLIGHT'],
+    )
+
+    @app.before_request
+    def admit():
+        busy = admission.enter()
+        g.admission_entered = True
+        endpoint = (request.endpoint or '').rpartition('.')[2]
+        if endpoint not in EXPENSIVE_ENDPOINTS:
+            return None
+        if admission.shed_inflight and busy >= admission.shed_inflight:
+            return rejected(503, 'Server busy, try again shortly', BUSY_RETRY_AFTER)
+        if current_user.is_authenticated:
+            client = ('user', current_user.get_id())
+        else:
+            client = ('address', request.remote_addr)
+        wait = admission.rate_limit(client, endpoint)
+        if wait:
+            return rejected(429, 'Too many requests', wait)
+        if endpoint in SLOW_ENDPOINTS:
+            if not admission.acquire_slot(client):
+                return rejected(429, 'Another export or import is still running', BUSY_RETRY_AFTER)
+            g.admission_slot = client
+        return None
+
+    @app.teardown_request
+    def release(e=None):
+        if g.pop('admission_entered', False):
+            admission.leave()
+        if 'admission_slot' in g:
+            admission.release_slot(g.pop('admission_slot'))
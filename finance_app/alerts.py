@@ -0,0 +1,141 @@
+# Budget alerts - every user's current-month budgets evaluated in one set-based pass
+"""
+A nightly job evaluates the current month's budgets of every user against
+what they spent, in one grouped query per database file, and stores the
+budgets at or past 80% in the alert table:
+
+    python -m finance_app.alerts    # evaluate every file, printing users, alerts and runtime
+
+Alongside, alert_state records the sync version (see sync.py) each user's
+alerts were computed at. The dashboard reads the stored alerts with an
+indexed lookup while that version is still the user's current one; once an
+expense or budget has changed since, it evaluates the same query for just
+that user instead.
+"""
+import sys
+import time
+from datetime import date
+
+from finance_app.database import connect, all_db_paths
+
+# Share of a budget spent from which it is reported
+WARNING_PERCENTAGE = 80
+
+# Budgets of the month with what was spent against them, from one pass over
+# the month's expenses; {user} narrows both sides to one user
+_EVALUATE = '''
+    WITH spent AS (
+        SELECT user_id, category, SUM(amount) AS spent
+        FROM expense
+        WHERE date >= :start AND date < :end {user}
+        GROUP BY user_id, category
+    )
+    SELECT budget.user_id, budget.category, budget.amount AS budget, COALESCE(spent.spent, 0) AS spent
+    FROM budget
+    LEFT JOIN spent ON spent.user_id = budget.user_id AND spent.category = budget.category
+    WHERE budget.year = :year AND budget.month = :month AND budget.amount > 0
+        AND COALESCE(spent.spent, 0) * 100.0 / budget.amount >= :percentage {budget_user}
+    ORDER BY budget.user_id, budget.category
+'''
+
+
+def month_range(year, month):
+    """First day of the month and of the next, as ISO date strings"""
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return date(year, month, 1).isoformat(), end.isoformat()
+
+
+def _evaluate(conn, year, month, user_id=None):
+    start, end = month_range(year, month)
+    query = _EVALUATE.format(user='AND user_id = :user_id' if user_id is not None else '',
+                             budget_user='AND budget.user_id = :user_id' if user_id is not None else '')
+    return conn.execute(query, {'start': start, 'end': end, 'year': year, 'month': month,
+                                'percentage': WARNING_PERCENTAGE, 'user_id': user_id}).fetchall()
+
+
+def to_alert(category, budget, spent):
+    """Dashboard alert of a budget, as get_budget_status reports it"""
+    percentage = (spent / budget) * 100
+    is_over = spent > budget
+    return {
+        'category': category,
+        'budget': budget,
+        'spent': spent,
+        'remaining': budget - spent,
+        'percentage': percentage,
+        'is_over': is_over,
+        'is_warning': percentage >= WARNING_PERCENTAGE and not is_over
+    }
+
+
+def for_user(db, user_id, today=None):
+    """The user's current budget alerts: stored ones while fresh, otherwise evaluated now"""
+    today = today or date.today()
+    fresh = db.execute('''
+        SELECT 1 FROM alert_state
+        LEFT JOIN sync_state ON sync_state.user_id = alert_state.user_id
+        WHERE alert_state.user_id = ? AND alert_state.year = ? AND alert_state.month = ?
+            AND alert_state.version = COALESCE(sync_state.version, 0)
+    ''', (user_id, today.year, today.month)).fetchone()
+    if fresh:
+        rows = db.execute('SELECT category, budget, spent FROM alert WHERE user_id = ? ORDER BY category',
+                          (user_id,)).fetchall()
+    else:
+        rows = [row[1:] for row in _evaluate(db, today.year, today.month, user_id)]
+    return [to_alert(*row) for row in rows]
+
+
+def evaluate_all(conn, today=None):
+    """Replace the stored alerts of every user in one database file, returning (users, alerts)
+
+    Runs in one write transaction, so the versions recorded in alert_state
+    are the ones the alerts were computed from.
+    """
+    today = today or date.today()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = _evaluate(conn, today.year, today.month)
+        conn.execute('DELETE FROM alert')
+        conn.executemany('INSERT INTO alert (user_id, category, budget, spent) VALUES (?, ?, ?, ?)', rows)
+        conn.execute('DELETE FROM alert_state')
+        users = conn.execute('''
+            INSERT INTO alert_state (user_id, year, month, version)
+            SELECT user_id, ?, ?, version FROM sync_state
+        ''', (today.year, today.month)).rowcount
+        conn.execute('COMMIT')
+        return users, len(rows)
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def run():
+    """Evaluate every database file, returning [(path, users, alerts, seconds)]"""
+    report = []
+    for path in all_db_paths():
+        conn = connect(path)
+        conn.isolation_level = None
+        try:
+            started = time.perf_counter()
+            users, alerts = evaluate_all(conn)
+            report.append((path, users, alerts, time.perf_counter() - started))
+        finally:
+            conn.close()
+    return report
+
+
+def main(argv):
+    from finance_app import create_app
+    app = create_app()
+    with app.app_context():
+        report = run()
+    for path, users, alerts, seconds in report:
+        per_user = seconds / users * 1e6 if users else 0
+        print(f'{users:>9} users {alerts:>8} alerts {seconds:8.3f} s ({per_user:6.1f} µs/user)  {path}')
+    users = sum(entry[1] for entry in report)
+    seconds = sum(entry[3] for entry in report)
+    print(f'{users:>9} users {sum(entry[2] for entry in report):>8} alerts {seconds:8.3f} s  total')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
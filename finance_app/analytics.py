@@ -0,0 +1,174 @@
+# Columnar analytics - per-user expense columns with vectorized group-bys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from finance_app import sync
+from finance_app.database import get_db
+
+# NumPy is imported on first use by load_numpy(), it dominates app startup otherwise.
+# Optional: the SQL aggregates in utils.py are the fallback.
+np = None
+_numpy_missing = False
+
+
+def load_numpy():
+    """The numpy module, imported on first call; None when not installed"""
+    global np, _numpy_missing
+    if np is None and not _numpy_missing:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            _numpy_missing = True
+    return np
+
+
+class ExpenseColumns:
+    """One user's expenses as parallel arrays.
+
+    ``days`` are int32 day numbers since 1970-01-01 and ``months`` the
+    matching month numbers since 1970-01, ``cents`` are int64 amounts and
+    ``codes`` index into ``categories`` (dictionary encoding).
+    """
+
+    __slots__ = ('days', 'months', 'cents', 'codes', 'categories', 'loaded_at', 'version')
+
+    def __init__(self, days, cents, codes, categories):
+        self.days = days
+        self.months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+        self.cents = cents
+        self.codes = codes
+        self.categories = categories
+        self.loaded_at = time.monotonic()
+        self.version = None
+
+    @classmethod
+    def load(cls, db, user_id):
+        """Scan a user's expenses once into columns
+
+        Archived months are loaded from their rollups as one row per
+        category dated the 1st, which keeps monthly and all-time totals whole.
+        """
+        rows = db.execute('''
+            SELECT date, amount, category FROM expense WHERE user_id = ?
+            UNION ALL
+            SELECT month || '-01', total, category FROM expense_rollup WHERE user_id = ?
+        ''', (user_id, user_id)).fetchall()
+        days = parse_days([row[0] for row in rows])
+        # Legacy rows with unparseable dates are left out of the columns
+        valid = ~np.isnat(days)
+        amounts = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        categories, codes = np.unique(
+            np.array([row[2] for row in rows], dtype=object), return_inverse=True
+        )
+        return cls(
+            days[valid].astype(np.int32),
+            np.rint(amounts[valid] * 100).astype(np.int64),
+            codes[valid].astype(np.int32),
+            [str(category) for category in categories]
+        )
+
+    def _mask(self, start=None, end=None):
+        """Boolean mask of rows dated within [start, end] (dates or None)"""
+        mask = np.ones(len(self.days), dtype=bool)
+        if start is not None:
+            mask &= self.days >= _day_number(start)
+        if end is not None:
+            mask &= self.days <= _day_number(end)
+        return mask
+
+    def category_totals(self, start=None, end=None):
+        """Total spent per category, largest first"""
+        codes, cents = self.codes, self.cents
+        if start is not None or end is not None:
+            mask = self._mask(start, end)
+            codes, cents = codes[mask], cents[mask]
+        sums = np.bincount(codes, weights=cents, minlength=len(self.categories))
+        counts = np.bincount(codes, minlength=len(self.categories))
+        order = np.argsort(-sums, kind='stable')
+        return {self.categories[i]: float(sums[i]) / 100 for i in order if counts[i]}
+
+    def monthly_totals(self, months):
+        """Total spent in each (year, month) of months, in the given order"""
+        wanted = np.array([(year - 1970) * 12 + month - 1 for year, month in months], dtype=np.int64)
+        if not len(self.months):
+            return [0.0] * len(months)
+        first = int(min(self.months.min(), wanted.min()))
+        last = int(max(self.months.max(), wanted.max()))
+        sums = np.bincount(self.months - first, weights=self.cents, minlength=last - first + 1)
+        return (sums[wanted - first] / 100).tolist()
+
+    def daily_totals(self, start, end):
+        """Total spent per day from start to end inclusive, zero-filled"""
+        first, last = _day_number(start), _day_number(end)
+        mask = self._mask(start, end)
+        sums = np.bincount(self.days[mask] - first, weights=self.cents[mask], minlength=last - first + 1)
+        return sums / 100
+
+
+def _day_number(value):
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+def parse_days(dates):
+    """ISO date strings as a datetime64[D] array, NaT where unparseable"""
+    try:
+        return np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        return np.array([_parse_day(value) for value in dates], dtype='datetime64[D]')
+
+
+def _parse_day(value):
+    try:
+        return np.datetime64(value, 'D')
+    except (ValueError, TypeError):
+        return np.datetime64('NaT')
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def enabled():
+    """True when the columnar backend is configured and NumPy is installed"""
+    return current_app.config.get('ANALYTICS_BACKEND') == 'columnar' and load_numpy() is not None
+
+
+def get_columns(user_id):
+    """Cached columns for a user, loaded lazily and reloaded after ANALYTICS_CACHE_TTL
+
+    Columns are also reloaded once the user's sync version (see sync.py) has
+    moved past the one they were loaded at, whichever process made the write.
+    """
+    ttl = current_app.config.get('ANALYTICS_CACHE_TTL', 300)
+    db = get_db(user_id=user_id)
+    # Read before loading, so a write racing with the load is picked up next time
+    version, _ = sync.state(db, user_id)
+    with _cache_lock:
+        columns = _cache.get(user_id)
+        if (columns is not None and columns.version == version
+                and time.monotonic() - columns.loaded_at < ttl):
+            _cache.move_to_end(user_id)
+            return columns
+
+    columns = ExpenseColumns.load(db, user_id)
+    columns.version = version
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached is not None and cached.version > version:
+            return columns
+        _cache[user_id] = columns
+        _cache.move_to_end(user_id)
+        while len(_cache) > current_app.config.get('ANALYTICS_CACHE_USERS', 1000):
+            _cache.popitem(last=False)
+    return columns
+
+
+def reset_after_fork():
+    """Start a forked worker with an empty cache and an unheld lock"""
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    _cache.clear()
@@ -1,21 +1,22 @@
 # REST API endpoints - returns JSON instead of templates
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from finance_app.database import get_db
-from finance_app.models import User
+from finance_app.models import User, Expense, Budget, Recurring
 from finance_app.utils import (
-    format_currency, calculate_category_totals, calculate_monthly_totals,
-    get_budget_status, get_weekly_comparison, get_monthly_total,
-    get_top_categories, get_category_comparison, predict_budget_overrun,
-    categorize_transaction
+    format_currency, get_budget_status, get_weekly_comparison, get_monthly_total,
+    get_top_categories, get_category_comparison, get_category_totals,
+    get_trend_months, get_monthly_trends
 )
-from datetime import datetime, timedelta
+from finance_app import alerts, archive, events, sync
+from finance_app.group_commit import write, insert_expense, update_expense
+from finance_app.recurring import merchant_hash, update_merchant, detect_recurring
+from finance_app.forecast import forecast_month, predict_budget_overruns, available as forecast_available
+from datetime import datetime
 import csv
 import io
 import os
-import json
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
@@ -33,6 +34,11 @@ def success_response(data, status_code=200):
     return jsonify(data), status_code
 
 
+def streamed_response(data, stream_key, status_code=200):
+    """Return success response, streaming the large list under stream_key"""
+    return current_app.json.stream_response(data, stream_key, status_code)
+
+
 @api.route('/auth/register', methods=['POST'])
 def register():
     """User registration API"""
@@ -72,11 +78,7 @@ def register():
         login_user(user, remember=True)
         return success_response({
             'message': 'Registration successful',
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email
-            }
+            'user': user.to_dict()
         }, 201)
     except Exception as e:
         return error_response(f'Registration failed: {str(e)}', 500)
@@ -101,11 +103,7 @@ def login():
         login_user(user, remember=True)
         return success_response({
             'message': 'Login successful',
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email
-            }
+            'user': user.to_dict()
         })
     else:
         return error_response('Invalid username or password', 401)
@@ -125,11 +123,7 @@ def check_auth():
     if current_user.is_authenticated:
         return success_response({
             'authenticated': True,
-            'user': {
-                'id': current_user.id,
-                'username': current_user.username,
-                'email': current_user.email
-            }
+            'user': current_user.to_dict()
         })
     else:
         return success_response({'authenticated': False})
@@ -145,24 +139,22 @@ def dashboard():
     
     db = get_db()
     cursor = db.cursor()
-    
-    # Get all expenses
-    cursor.execute('SELECT * FROM expense WHERE user_id = ? ORDER BY date DESC', (current_user.id,))
-    expenses_rows = cursor.fetchall()
-    expenses = [dict(row) for row in expenses_rows]
+    # Live updates (see events.py) continue from this version
+    version, _ = sync.state(db, current_user.id)
     
     # Calculate metrics
     this_week, last_week, week_change = get_weekly_comparison(current_user.id)
     monthly_total = get_monthly_total(current_user.id, current_month, current_year)
     top_categories = get_top_categories(current_user.id, current_month, current_year, limit=3)
-    category_totals = calculate_category_totals(expenses)
+    category_totals = get_category_totals(current_user.id)
     
     # Monthly trends
-    monthly_trends = {}
-    for i in range(5, -1, -1):
-        month_date = today - timedelta(days=30 * i)
-        month_key = f"{month_date.year}-{month_date.month:02d}"
-        monthly_trends[month_key] = get_monthly_total(current_user.id, month_date.month, month_date.year)
+    months = get_trend_months(today)
+    trend_totals = get_monthly_trends(current_user.id, months)
+    monthly_trends = {
+        f"{year}-{month:02d}": total
+        for (year, month), total in zip(months, trend_totals)
+    }
     
     # Budget alerts
     cursor.execute('''
@@ -170,23 +162,10 @@ def dashboard():
         WHERE user_id = ? AND month = ? AND year = ?
     ''', (current_user.id, current_month, current_year))
     budgets_rows = cursor.fetchall()
-    budgets = [dict(row) for row in budgets_rows]
+    budgets = Budget.from_rows(budgets_rows)
     
-    budget_alerts = []
-    for budget in budgets:
-        budget_amount, spent, remaining, percentage, is_over, is_warning = get_budget_status(
-            current_user.id, budget['category'], current_month, current_year
-        )
-        if budget_amount is not None and (is_over or is_warning):
-            budget_alerts.append({
-                'category': budget['category'],
-                'budget': budget_amount,
-                'spent': spent,
-                'remaining': remaining,
-                'percentage': percentage,
-                'is_over': is_over,
-                'is_warning': is_warning
-            })
+    # Stored by the nightly evaluation, evaluated now if anything changed since
+    budget_alerts = alerts.for_user(db, current_user.id, today)
     
     # Insights
     insights = []
@@ -201,10 +180,11 @@ def dashboard():
                 direction = "more" if change > 0 else "less"
                 insights.append(f"You spent {abs(change):.1f}% {direction} on {category} compared to last month.")
     
-    for budget in budgets:
-        will_exceed, projected, overrun = predict_budget_overrun(current_user.id, budget['category'], current_month, current_year)
+    # Month-end projections for every category in one pass
+    forecasts = forecast_month(current_user.id, today) if forecast_available() else {}
+    for category, will_exceed, projected, overrun in predict_budget_overruns(current_user.id, budgets, today, forecasts):
         if will_exceed:
-            insights.append(f"You are likely to exceed your budget for {budget['category']} if current pace continues. Projected overrun: {format_currency(overrun)}")
+            insights.append(f"You are likely to exceed your budget for {category} if current pace continues. Projected overrun: {format_currency(overrun)}")
     
     # Recent expenses
     cursor.execute('''
@@ -214,9 +194,9 @@ def dashboard():
         LIMIT 10
     ''', (current_user.id,))
     recent_expenses_rows = cursor.fetchall()
-    recent_expenses = [dict(row) for row in recent_expenses_rows]
+    recent_expenses = Expense.from_rows(recent_expenses_rows)
     
-    return success_response({
+    payload = {
         'this_week': this_week,
         'last_week': last_week,
         'week_change': week_change,
@@ -226,8 +206,21 @@ def dashboard():
         'monthly_trends': monthly_trends,
         'budget_alerts': budget_alerts,
         'insights': insights,
-        'recent_expenses': recent_expenses
-    })
+        'forecasts': forecasts,
+        'recent_expenses': recent_expenses,
+        'version': version
+    }
+    
+    # ?include=charts adds the chart series from the aggregates above,
+    # saving the client the /charts/* round-trips
+    include = {part.strip() for part in request.args.get('include', '').split(',')}
+    if 'charts' in include:
+        payload['charts'] = {
+            'category': category_chart_series(category_totals),
+            'monthly': monthly_chart_series(months, trend_totals)
+        }
+    
+    return success_response(payload)
 
 
 @api.route('/expenses', methods=['GET', 'POST'])
@@ -244,7 +237,9 @@ def expenses():
         
         db = get_db()
         cursor = db.cursor()
-        query = 'SELECT * FROM expense WHERE user_id = ?'
+        # Archived expenses are included unless date_from is past them
+        source = archive.expense_source(db, current_user.id, date_from or None)
+        query = f'SELECT * FROM {source} WHERE user_id = ?'
         params = [current_user.id]
         
         if search_query:
@@ -273,19 +268,18 @@ def expenses():
         }
         query += ' ' + sort_map.get(sort_by, 'ORDER BY date DESC')
         
-        cursor.execute(query, params)
-        expenses_rows = cursor.fetchall()
-        expenses = [dict(row) for row in expenses_rows]
-        
         # Get categories
-        cursor.execute('SELECT DISTINCT category FROM expense WHERE user_id = ?', (current_user.id,))
+        cursor.execute(f'SELECT DISTINCT category FROM {source} WHERE user_id = ?', (current_user.id,))
         categories_rows = cursor.fetchall()
         categories = [row['category'] for row in categories_rows]
         
-        return success_response({
+        # Encode expenses in batches straight from the cursor, never holding them all
+        expenses = (Expense.from_row(row) for row in db.execute(query, params))
+        
+        return streamed_response({
             'expenses': expenses,
             'categories': categories
-        })
+        }, 'expenses')
     
     else:  # POST
         data = request.get_json()
@@ -308,17 +302,11 @@ def expenses():
             return error_response('Date is required')
         
         try:
-            db = get_db()
-            cursor = db.cursor()
-            cursor.execute('''
-                INSERT INTO expense (user_id, description, amount, category, date)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (current_user.id, description, amount, category, date))
-            db.commit()
-            
-            expense_id = cursor.lastrowid
-            cursor.execute('SELECT * FROM expense WHERE id = ?', (expense_id,))
-            expense = dict(cursor.fetchone())
+            # Committed on its own, or in a batch with other requests' writes (WRITE_BATCHING)
+            expense = Expense.from_row(write(
+                insert_expense, current_user.id, description, amount, category, date, merchant_hash(description)
+            ))
+            events.publish_expense(current_user.id, 'created', expense)
             
             return success_response({'expense': expense}, 201)
         except Exception as e:
@@ -333,16 +321,22 @@ def expense(expense_id):
     cursor = db.cursor()
     
     # Get expense
-    cursor.execute('SELECT * FROM expense WHERE id = ?', (expense_id,))
+    cursor.execute('SELECT * FROM expense WHERE id = ? AND user_id = ?', (expense_id, current_user.id))
     expense_row = cursor.fetchone()
     
+    if not expense_row:
+        # Archived expenses are read in place, and moved back to be changed
+        expense_row = archive.find(db, current_user.id, expense_id)
+        if expense_row and request.method != 'GET':
+            archive.restore(db, current_user.id, expense_id)
+    
     if not expense_row:
         return error_response('Expense not found', 404)
     
-    expense = dict(expense_row)
+    expense = Expense.from_row(expense_row)
     
     # Check ownership
-    if expense['user_id'] != current_user.id:
+    if expense.user_id != current_user.id:
         return error_response('Permission denied', 403)
     
     if request.method == 'GET':
@@ -362,15 +356,12 @@ def expense(expense_id):
             return error_response('All fields are required')
         
         try:
-            cursor.execute('''
-                UPDATE expense 
-                SET description = ?, amount = ?, category = ?, date = ?
-                WHERE id = ? AND user_id = ?
-            ''', (description, amount, category, date, expense_id, current_user.id))
-            db.commit()
+            updated_expense = Expense.from_row(write(
+                update_expense, expense_id, current_user.id, description, amount, category, date,
+                merchant_hash(description), merchant_hash(expense.description)
+            ))
             
-            cursor.execute('SELECT * FROM expense WHERE id = ?', (expense_id,))
-            updated_expense = dict(cursor.fetchone())
+            events.publish_expense(current_user.id, 'updated', updated_expense, previous=expense)
             
             return success_response({'expense': updated_expense})
         except Exception as e:
@@ -379,6 +370,9 @@ def expense(expense_id):
     else:  # DELETE
         try:
             cursor.execute('DELETE FROM expense WHERE id = ? AND user_id = ?', (expense_id, current_user.id))
+            update_merchant(db, current_user.id, merchant_hash(expense.description))
+            # Committed together with the delete
+            events.publish_expense(current_user.id, 'deleted', previous=expense)
             db.commit()
             return success_response({'message': 'Expense deleted successfully'})
         except Exception as e:
@@ -401,7 +395,7 @@ def budgets():
             WHERE user_id = ? AND month = ? AND year = ?
         ''', (current_user.id, current_month, current_year))
         budgets_rows = cursor.fetchall()
-        budgets_list = [dict(row) for row in budgets_rows]
+        budgets_list = Budget.from_rows(budgets_rows)
         
         # Get budget statuses
         budget_statuses = []
@@ -466,94 +460,161 @@ def budgets():
                 ''', (current_user.id, category, amount, month, year))
                 message = 'Budget set successfully'
             
+            # Committed together with the budget
+            events.publish_budget(current_user.id, category, month, year)
             db.commit()
             
             cursor.execute('''
                 SELECT * FROM budget 
                 WHERE user_id = ? AND category = ? AND month = ? AND year = ?
             ''', (current_user.id, category, month, year))
-            budget = dict(cursor.fetchone())
+            budget = Budget.from_row(cursor.fetchone())
             
             return success_response({'budget': budget, 'message': message}, 201)
         except Exception as e:
             return error_response(f'Failed to set budget: {str(e)}', 500)
 
 
+@api.route('/events', methods=['GET'])
+@login_required
+def event_stream():
+    """Server-Sent Events of dashboard deltas for the current user, one poll per request
+
+    Events: 'expense' (created/updated/deleted with signed total deltas),
+    'budget' (status of one budget), 'refresh' (reload everything) and
+    'version' (first poll without a version). Each carries the version as its
+    id; the browser sends it back as Last-Event-ID (or pass `since`).
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    response = Response(events.poll(current_user.id, since), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api.route('/sync', methods=['GET'])
+@login_required
+def sync_changes():
+    """Expenses and budgets changed after version `since`, and the ids deleted since
+
+    Clients store the returned version and pass it as `since` next time.
+    Without `since`, or when the changes cannot be given as a delta, the
+    response is a full snapshot with `full` set.
+    """
+    since = request.args.get('since', type=int)
+    version, full, expense_rows, budget_rows, deleted = sync.changes(get_db(), current_user.id, since)
+    return streamed_response({
+        'version': version,
+        'full': full,
+        'expenses': (Expense.from_row(row) for row in expense_rows),
+        'budgets': Budget.from_rows(budget_rows),
+        'deleted': deleted
+    }, 'expenses')
+
+
+def category_chart_series(category_totals):
+    """Pie chart series from category totals"""
+    return {
+        'labels': list(category_totals.keys()),
+        'data': list(category_totals.values())
+    }
+
+
+def monthly_chart_series(months, totals):
+    """Line chart series for (year, month) pairs, with 'YYYY-MM' keys for live updates"""
+    return {
+        'labels': [datetime(year, month, 1).strftime('%b %Y') for year, month in months],
+        'months': [f"{year}-{month:02d}" for year, month in months],
+        'data': totals
+    }
+
+
 @api.route('/charts/category', methods=['GET'])
 @login_required
 def chart_category():
     """Get category chart data"""
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute('SELECT * FROM expense WHERE user_id = ?', (current_user.id,))
-    expenses_rows = cursor.fetchall()
-    expenses = [dict(row) for row in expenses_rows]
-    category_totals = calculate_category_totals(expenses)
-    
-    return success_response({
-        'labels': list(category_totals.keys()),
-        'data': list(category_totals.values())
-    })
+    return success_response(category_chart_series(get_category_totals(current_user.id)))
 
 
 @api.route('/charts/monthly', methods=['GET'])
 @login_required
 def chart_monthly():
     """Get monthly trend chart data"""
-    today = datetime.now().date()
-    monthly_trends = {}
+    months = get_trend_months()
+    return success_response(monthly_chart_series(months, get_monthly_trends(current_user.id, months)))
+
+
+@api.route('/recurring', methods=['GET', 'POST'])
+@login_required
+def recurring():
+    """Get detected recurring charges (subscriptions, rent, bills)
+
+    Series are kept up to date as expenses are written; POST rebuilds them
+    from the full expense history.
+    """
+    db = get_db()
+    cursor = db.cursor()
     
-    for i in range(5, -1, -1):
-        month_date = today - timedelta(days=30 * i)
-        month_key = f"{month_date.strftime('%b %Y')}"
-        monthly_trends[month_key] = get_monthly_total(current_user.id, month_date.month, month_date.year)
+    if request.method == 'POST':
+        detect_recurring(db, current_user.id)
+    
+    cursor.execute('''
+        SELECT * FROM recurring
+        WHERE user_id = ?
+        ORDER BY next_date ASC
+    ''', (current_user.id,))
+    series = Recurring.from_rows(cursor.fetchall())
     
     return success_response({
-        'labels': list(monthly_trends.keys()),
-        'data': list(monthly_trends.values())
+        'recurring': series,
+        'monthly_total': round(sum(s.amount * 30 / s.period_days for s in series), 2)
     })
 
 
 @api.route('/export', methods=['GET'])
 @login_required
 def export():
-    """Export expenses as CSV"""
+    """Export expenses as CSV, streamed from the cursor"""
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('''
-        SELECT * FROM expense 
-        WHERE user_id = ? 
+    cursor.execute(f'''
+        SELECT description, amount, category, date FROM {archive.expense_source(db, current_user.id)}
+        WHERE user_id = ?
         ORDER BY date DESC
     ''', (current_user.id,))
-    expenses_rows = cursor.fetchall()
-    expenses = [dict(row) for row in expenses_rows]
-    
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Description', 'Amount', 'Category', 'Date'])
-    
-    for expense in expenses:
-        writer.writerow([
-            expense['description'],
-            expense['amount'],
-            expense['category'],
-            expense['date']
-        ])
-    
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['Description', 'Amount', 'Category', 'Date'])
+        # One chunk of CSV per 1000 rows, never the whole export in memory
+        for rows in iter(lambda: cursor.fetchmany(1000), []):
+            writer.writerows(rows)
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+        if output.tell():
+            yield output.getvalue()
+
+    # Plain response rather than send_file so the body can be compressed
+    filename = f'expenses_{datetime.now().strftime("%Y%m%d")}.csv'
+    return Response(
+        stream_with_context(generate()),
         mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'expenses_{datetime.now().strftime("%Y%m%d")}.csv'
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 
 @api.route('/upload', methods=['POST'])
 @login_required
 def upload():
-    """Upload and import CSV file"""
+    """Upload and import a bank statement (CSV, OFX/QFX, QIF or XLSX)"""
+    # Parsers (multiprocessing, zipfile, XML) load on the first upload, not at startup
+    from finance_app.importer import import_file, supported_extensions
+    
     if 'file' not in request.files:
         return error_response('No file provided')
     
@@ -561,68 +622,22 @@ def upload():
     if file.filename == '':
         return error_response('No file selected')
     
-    if not file.filename.endswith('.csv'):
-        return error_response('Invalid file type. Please upload a CSV file')
-    
-    imported_count = 0
-    errors = []
-    db = get_db()
-    cursor = db.cursor()
+    if os.path.splitext(file.filename.lower())[1] not in supported_extensions():
+        return error_response(f"Invalid file type. Supported: {', '.join(supported_extensions())}")
     
     try:
-        # Read CSV - handle both text and binary uploads
-        file_content = file.read()
-        if isinstance(file_content, bytes):
-            file_content = file_content.decode('utf-8')
-        stream = io.StringIO(file_content, newline=None)
-        reader = csv.DictReader(stream)
-        
-        for row in reader:
-            try:
-                description = row.get('description', '').strip()
-                amount_str = row.get('amount', '').strip()
-                category = row.get('category', '').strip()
-                date_str = row.get('date', '').strip()
-                
-                if not description or not amount_str:
-                    errors.append(f"Row missing description or amount: {row}")
-                    continue
-                
-                try:
-                    amount = float(amount_str)
-                except ValueError:
-                    errors.append(f"Invalid amount in row: {row}")
-                    continue
-                
-                if not category:
-                    category = categorize_transaction(description, amount)
-                
-                try:
-                    if date_str:
-                        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    else:
-                        date_obj = datetime.now().date()
-                except ValueError:
-                    date_obj = datetime.now().date()
-                
-                cursor.execute('''
-                    INSERT INTO expense (user_id, description, amount, category, date)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (current_user.id, description, amount, category, date_obj.isoformat()))
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Error processing row {row}: {str(e)}")
-        
-        db.commit()
+        result = import_file(
+            get_db(), current_user.id, file.filename, file.stream,
+            workers=current_app.config['IMPORT_WORKERS'],
+            parallel_min_size=current_app.config['IMPORT_PARALLEL_MIN_SIZE'],
+            date_formats=current_app.config['IMPORT_DATE_FORMATS']
+        )
+        # Bulk changes are cheaper to reload than to send as deltas
+        if result.imported_count:
+            events.publish(current_user.id, [('refresh', {})])
         
-        return success_response({
-            'imported_count': imported_count,
-            'errors': errors[:10] if len(errors) > 10 else errors,  # Limit errors in response
-            'error_count': len(errors),
-            'message': f'Successfully imported {imported_count} expenses'
-        })
+        return success_response(result.to_dict())
         
     except Exception as e:
-        return error_response(f'Error reading CSV file: {str(e)}', 500)
+        return error_response(f'Error reading file: {str(e)}', 500)
 
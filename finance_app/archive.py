@@ -0,0 +1,293 @@
+# Cold storage - old expenses moved to an attached archive database, kept as monthly rollups
+"""
+Expenses older than ARCHIVE_AFTER_MONTHS are moved out of each database file
+into a sibling archive file (finance_app.db -> finance_app.archive.db,
+shards alike), so the hot file only holds recent history:
+
+    python -m finance_app.archive            # archive everything past the horizon
+    python -m finance_app.archive --dry-run  # count what would be archived
+
+Archived rows leave per-month, per-category totals behind in the hot
+expense_rollup table, so all-time totals and charts never open the archive,
+and their import fingerprints in archived_fingerprint, so re-importing an
+old statement still skips them. Queries that need the rows themselves
+(listing without a recent date_from, export) ATTACH the archive and read
+`expense_source()`, a UNION ALL of both tables. Editing or deleting an
+archived expense first moves it back with `restore()`.
+
+Archiving does not count as a change for delta sync: the triggers are
+paused while rows move out, and synced clients keep their copies.
+"""
+import os
+import sys
+from datetime import date
+
+from flask import current_app
+
+from finance_app import sync
+from finance_app.database import connect, all_db_paths
+
+# Dashboard windows (trends, forecasts, comparisons) must stay in the hot table
+MIN_ARCHIVE_MONTHS = 12
+# Archived rows must have ISO dates, legacy values stay hot
+ISO_DATE_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+
+
+def archive_path(db_path):
+    """Archive file for a database file"""
+    base, ext = os.path.splitext(db_path)
+    return f'{base}.archive{ext or ".db"}'
+
+
+def horizon(today=None, months=None):
+    """First day of the oldest month kept hot, None when archiving is disabled"""
+    if months is None:
+        months = current_app.config.get('ARCHIVE_AFTER_MONTHS', 0)
+    if not months:
+        return None
+    if months < MIN_ARCHIVE_MONTHS:
+        raise ValueError(f'ARCHIVE_AFTER_MONTHS must be 0 or at least {MIN_ARCHIVE_MONTHS}')
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1).isoformat()
+
+
+def attach(db):
+    """ATTACH the archive of a connection's database as `archive`, False when it has none"""
+    files = {row[1]: row[2] for row in db.execute('PRAGMA database_list')}
+    if 'archive' in files:
+        return True
+    path = archive_path(files['main'])
+    if not files['main'] or not os.path.exists(path):
+        return False
+    db.execute('ATTACH DATABASE ? AS archive', (path,))
+    return True
+
+
+def _table_columns(db, schema):
+    return [row[1] for row in db.execute(f'PRAGMA {schema}.table_info(expense)')]
+
+
+def archived_until(db, user_id):
+    """'YYYY-MM' of the user's newest archived month, None if nothing is archived"""
+    row = db.execute('SELECT MAX(month) FROM expense_rollup WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0]
+
+
+def expense_source(db, user_id, date_from=None):
+    """FROM-clause source for a user's expenses dated from date_from (None: all of them)
+
+    Plain `expense` unless archived rows could match, then a UNION ALL of
+    the hot and archive tables aliased as `expense`. Filters on user_id and
+    date are pushed into both halves and use their indexes.
+    """
+    until = archived_until(db, user_id)
+    if until is None or (date_from and date_from[:7] > until) or not attach(db):
+        return 'expense'
+    hot = _table_columns(db, 'main')
+    cold = set(_table_columns(db, 'archive'))
+    columns = ', '.join(hot)
+    # Columns added to the hot table since the last archive run read as NULL
+    archived = ', '.join(column if column in cold else f'NULL AS {column}' for column in hot)
+    return (f'(SELECT {columns} FROM main.expense UNION ALL '
+            f'SELECT {archived} FROM archive.expense) AS expense')
+
+
+def find(db, user_id, expense_id):
+    """An archived expense row of the user's, or None"""
+    if not attach(db):
+        return None
+    return db.execute('SELECT * FROM archive.expense WHERE id = ? AND user_id = ?',
+                      (expense_id, user_id)).fetchone()
+
+
+def restore(db, user_id, expense_id):
+    """Move an archived expense back to the hot table, keeping its id; False if not archived
+
+    Runs in the caller's transaction: the rollup and fingerprint entries are
+    taken back, and the caller's commit makes the move and its own change
+    together. Archived ids come from the hot AUTOINCREMENT sequence, so the
+    id is still free there, and synced clients see the row as changed.
+    """
+    if not attach(db):
+        return False
+    row = db.execute('SELECT * FROM archive.expense WHERE id = ? AND user_id = ?',
+                     (expense_id, user_id)).fetchone()
+    if row is None:
+        return False
+    columns = [column for column in _table_columns(db, 'main') if column in row.keys()]
+    db.execute(
+        f'INSERT INTO main.expense ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+        [row[column] for column in columns]
+    )
+    db.execute('''
+        UPDATE expense_rollup SET total = total - ?, count = count - 1
+        WHERE user_id = ? AND month = ? AND category = ?
+    ''', (row['amount'], user_id, row['date'][:7], row['category']))
+    db.execute('DELETE FROM expense_rollup WHERE user_id = ? AND count <= 0', (user_id,))
+    if row['fingerprint'] is not None:
+        db.execute('DELETE FROM archived_fingerprint WHERE user_id = ? AND fingerprint = ?',
+                   (user_id, row['fingerprint']))
+    db.execute('DELETE FROM archive.expense WHERE id = ?', (expense_id,))
+    return True
+
+
+def _ensure_archive_table(archive_db, source='hot'):
+    """Create or extend the archive's expense table to hold every column of the attached source's"""
+    hot = archive_db.execute(f'PRAGMA {source}.table_info(expense)').fetchall()
+    cold = set(_table_columns(archive_db, 'main'))
+    if not cold:
+        definitions = ', '.join('id INTEGER PRIMARY KEY' if column[1] == 'id' else f'{column[1]} {column[2]}'
+                                for column in hot)
+        archive_db.execute(f'CREATE TABLE expense ({definitions})')
+    else:
+        for column in hot:
+            if column[1] not in cold:
+                archive_db.execute(f'ALTER TABLE expense ADD COLUMN {column[1]} {column[2]}')
+    archive_db.execute('CREATE INDEX IF NOT EXISTS idx_expense_user_date ON expense(user_id, date)')
+
+
+def archive_user(hot_db, archive_db, user_id, cutoff):
+    """Move one user's expenses dated before cutoff, returning the number moved
+
+    The hot file stays write-locked (BEGIN IMMEDIATE) from before the copy
+    until the delete commits. The copy commits first and keeps row ids, so
+    a run interrupted between the two is completed by running it again.
+    """
+    hot_db.execute('BEGIN IMMEDIATE')
+    try:
+        sync.pause(hot_db, 'archive')
+        columns = ', '.join(_table_columns(hot_db, 'main'))
+        selection = f'user_id = ? AND date < ? AND date GLOB \'{ISO_DATE_GLOB}\''
+        with archive_db:
+            archive_db.execute(f'INSERT OR IGNORE INTO main.expense ({columns}) '
+                               f'SELECT {columns} FROM hot.expense WHERE {selection}', (user_id, cutoff))
+        hot_db.execute(f'''
+            INSERT INTO expense_rollup (user_id, month, category, total, count)
+            SELECT user_id, substr(date, 1, 7), category, SUM(amount), COUNT(*)
+            FROM expense WHERE {selection}
+            GROUP BY user_id, substr(date, 1, 7), category
+            ON CONFLICT (user_id, month, category)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+        ''', (user_id, cutoff))
+        hot_db.execute(f'''
+            INSERT OR IGNORE INTO archived_fingerprint (user_id, fingerprint)
+            SELECT user_id, fingerprint FROM expense WHERE {selection} AND fingerprint IS NOT NULL
+        ''', (user_id, cutoff))
+        moved = hot_db.execute(f'DELETE FROM expense WHERE {selection}', (user_id, cutoff)).rowcount
+        sync.resume(hot_db)
+        hot_db.execute('COMMIT')
+        return moved
+    except Exception:
+        if hot_db.in_transaction:
+            hot_db.execute('ROLLBACK')
+        raise
+
+
+def reserve_ids(db, count, schema='main'):
+    """Take count ids from the AUTOINCREMENT sequence of a hot expense table, returning the first
+
+    Runs in the caller's transaction. The hot table never hands out a
+    reserved id, so archived rows given one cannot collide with hot rows.
+    """
+    row = db.execute(f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'expense'").fetchone()
+    last = row[0] if row else db.execute(f'SELECT COALESCE(MAX(id), 0) FROM {schema}.expense').fetchone()[0]
+    if row:
+        db.execute(f"UPDATE {schema}.sqlite_sequence SET seq = ? WHERE name = 'expense'", (last + count,))
+    else:
+        db.execute(f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES ('expense', ?)", (last + count,))
+    return last + 1
+
+
+def copy_archived(user_id, source_archive, target_path):
+    """Replace a user's rows in a database file's archive with their rows from another archive
+
+    The rows get new ids, reserved from the target file's hot expense
+    sequence, so they stay out of the ids of the target's hot rows.
+    """
+    target = connect(archive_path(target_path))
+    try:
+        target.execute('ATTACH DATABASE ? AS source', (os.path.abspath(source_archive),))
+        target.execute('ATTACH DATABASE ? AS hot', (os.path.abspath(target_path),))
+        with target:
+            _ensure_archive_table(target, 'source')
+            columns = ', '.join(column for column in _table_columns(target, 'source') if column != 'id')
+            count = target.execute('SELECT COUNT(*) FROM source.expense WHERE user_id = ?',
+                                   (user_id,)).fetchone()[0]
+            first_id = reserve_ids(target, count, 'hot')
+            target.execute('DELETE FROM main.expense WHERE user_id = ?', (user_id,))
+            target.execute(f'INSERT INTO main.expense (id, {columns}) '
+                           f'SELECT ? + ROW_NUMBER() OVER (ORDER BY id) - 1, {columns} '
+                           f'FROM source.expense WHERE user_id = ?', (first_id, user_id))
+    finally:
+        target.close()
+
+
+def delete_archived(user_id, archive_file_path):
+    """Drop a user's rows from an archive file"""
+    conn = connect(archive_file_path)
+    try:
+        with conn:
+            conn.execute('DELETE FROM expense WHERE user_id = ?', (user_id,))
+    finally:
+        conn.close()
+
+
+def pending(db_path, cutoff):
+    """{user_id: expenses} that would be archived from a database file"""
+    conn = connect(db_path, readonly=True)
+    try:
+        return dict(conn.execute(f'''
+            SELECT user_id, COUNT(*) FROM expense
+            WHERE date < ? AND date GLOB '{ISO_DATE_GLOB}'
+            GROUP BY user_id
+        ''', (cutoff,)).fetchall())
+    finally:
+        conn.close()
+
+
+def archive_file(db_path, cutoff):
+    """Archive every user's old expenses in one database file, one user per transaction"""
+    users = pending(db_path, cutoff)
+    if not users:
+        return 0
+    hot_db = connect(db_path)
+    hot_db.isolation_level = None  # explicit transactions in archive_user
+    archive_db = connect(archive_path(db_path))
+    try:
+        archive_db.execute('ATTACH DATABASE ? AS hot', (os.path.abspath(db_path),))
+        with archive_db:
+            _ensure_archive_table(archive_db)
+        return sum(archive_user(hot_db, archive_db, user_id, cutoff) for user_id in users)
+    finally:
+        archive_db.close()
+        hot_db.close()
+
+
+def archive_all(dry_run=False):
+    """Archive old expenses in every database file, returning {path: expenses}"""
+    cutoff = horizon()
+    if cutoff is None:
+        raise ValueError('ARCHIVE_AFTER_MONTHS is not set')
+    moved = {}
+    for path in all_db_paths():
+        moved[path] = sum(pending(path, cutoff).values()) if dry_run else archive_file(path, cutoff)
+    return moved
+
+
+def main(argv):
+    from finance_app import create_app
+    app = create_app()
+    with app.app_context():
+        dry_run = '--dry-run' in argv
+        try:
+            moved = archive_all(dry_run=dry_run)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f'Expenses before {horizon()}' + (' (dry run)' if dry_run else ''))
+        for path, count in moved.items():
+            print(f'  {count:9} {"to archive" if dry_run else "archived"}  {path}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
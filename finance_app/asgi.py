@@ -0,0 +1,239 @@
+# ASGI server front end - async request handling with bounded database executors
+"""
+Serves the Flask app to an ASGI server (``uvicorn asgi:app``).
+
+The event loop only reads request bodies and writes responses. Handlers,
+and so all SQLite work and serialization, run on one of three bounded
+thread pools ("lanes") whose threads each keep their own connections:
+
+    fast    everything else (ASGI_THREADS)
+    slow    exports and imports (ASGI_SLOW_THREADS)
+    stream  /api/events polls, never queued behind other requests (ASGI_STREAM_THREADS)
+
+However many exports and imports are running or queued, they can occupy at
+most the slow lane, so dashboard reads keep their own threads. Uploads are
+received by the event loop before a thread is taken.
+
+With LOAD_SHED_QUEUE set, a request arriving while that many others already
+wait for a thread of its lane is answered 503 (with Retry-After) by the
+event loop, before its body is read or a thread is taken.
+"""
+import asyncio
+import functools
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from finance_app.database import keep_thread_connections
+
+# Request paths served by the slow lane
+SLOW_PATHS = ('/api/export', '/api/upload')
+# Request paths served by the stream lane
+STREAM_PATHS = ('/api/events',)
+# Request bodies larger than this are spooled to a temporary file
+SPOOL_MAX_SIZE = 1024 * 1024
+# Retry-After of shed requests, seconds
+SHED_RETRY_AFTER = 1
+
+
+class Lane:
+    """Bounded pool of threads, each with its own kept database connections"""
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self.pending = 0  # submitted and not finished; only touched from the event loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'asgi-{name}',
+                                            initializer=keep_thread_connections)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on one of the lane's threads"""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+        finally:
+            self.pending -= 1
+
+    def waiting(self):
+        """Requests queued for a thread"""
+        return max(0, self.pending - self.max_workers)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        # The body was received in full before the call, reading to EOF is safe
+        'wsgi.input_terminated': True,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        if name in environ:
+            # Repeated headers are joined as lists, except cookies (RFC 6265)
+            value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+        environ[name] = value
+    return environ
+
+
+class ASGIApp:
+    """ASGI callable serving a Flask app through the lanes"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.max_body_size = flask_app.config.get('MAX_CONTENT_LENGTH')
+        self.shed_queue = flask_app.config.get('LOAD_SHED_QUEUE', 0)
+        self.lanes = {
+            'fast': Lane('fast', flask_app.config['ASGI_THREADS']),
+            'slow': Lane('slow', flask_app.config['ASGI_SLOW_THREADS']),
+            'stream': Lane('stream', flask_app.config['ASGI_STREAM_THREADS']),
+        }
+
+    def lane_for(self, path):
+        if path.startswith(STREAM_PATHS):
+            return self.lanes['stream']
+        if path.startswith(SLOW_PATHS):
+            return self.lanes['slow']
+        return self.lanes['fast']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for lane in self.lanes.values():
+                    lane.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        """Request body as a file, or None once it exceeds MAX_CONTENT_LENGTH"""
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if self.max_body_size is not None and size > self.max_body_size:
+                body.close()
+                return None
+            body.write(chunk)
+            more_body = message.get('more_body', False)
+        body.seek(0)
+        return body
+
+    async def _http(self, scope, receive, send):
+        lane = self.lane_for(scope['path'])
+        if self.shed_queue and lane.name != 'stream' and lane.waiting() >= self.shed_queue:
+            await send({'type': 'http.response.start', 'status': 503,
+                        'headers': [(b'content-type', b'application/json'),
+                                    (b'retry-after', str(SHED_RETRY_AFTER).encode())]})
+            await send({'type': 'http.response.body', 'body': b'{"error": "Server busy, try again shortly"}'})
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Request body too large'})
+            return
+
+        # Notice a client going away, so a streamed response gives its thread back
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await lane.run(
+                self._respond, asyncio.get_running_loop(), build_environ(scope, body), send, disconnected
+            )
+        finally:
+            # Also stops the thread when this task is cancelled (e.g. at shutdown)
+            disconnected.set()
+            watcher.cancel()
+            body.close()
+
+    def _respond(self, loop, environ, send, disconnected):
+        """Run the handler and send its response, all on one lane thread
+
+        A response is produced start to finish by the thread that began it:
+        the request context and the thread's connections cannot move
+        between threads. Each send waits for the event loop, so a slow
+        client only holds back the thread serving it.
+        """
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+            return lambda data: None
+
+        def send_start():
+            status, headers = started
+            send_message({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+
+        iterable = self.flask_app.wsgi_app(environ, start_response)
+        try:
+            head_sent = False
+            for chunk in iterable:
+                if not head_sent:
+                    send_start()
+                    head_sent = True
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not head_sent:
+                send_start()
+            send_message({'type': 'http.response.body', 'body': b''})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
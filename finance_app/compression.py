@@ -0,0 +1,132 @@
+# Response compression - negotiated gzip/brotli for JSON, CSV and static assets
+import gzip
+import zlib
+from itertools import chain
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'text/javascript',
+    'text/css', 'text/html', 'text/csv', 'text/plain', 'image/svg+xml',
+}
+
+
+def _compress(data, encoding, level):
+    """Compress a complete body"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _encode(chunk):
+    return chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def _read_head(chunks, min_size):
+    """Encoded chunks from the start of a stream totalling at least min_size bytes
+
+    Returns (head, True) when the stream ended before that, having read it all.
+    """
+    head, size = [], 0
+    for chunk in chunks:
+        head.append(_encode(chunk))
+        size += len(head[-1])
+        if size >= min_size:
+            return head, False
+    return head, True
+
+
+def _compress_stream(head, chunks, level):
+    """Gzip a streamed body chunk by chunk, head (already read) first"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chain(head, chunks):
+            data = compressor.compress(_encode(chunk))
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        # Let the source release what it holds (e.g. the request context) when the client leaves
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def choose_encoding(accept_encoding, allow_brotli=True):
+    """Pick the best supported content-coding from an Accept-Encoding header"""
+    if allow_brotli and brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def precompress(data, level):
+    """Compress a static body once in every supported encoding"""
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    return {encoding: _compress(data, encoding, level) for encoding in encodings}
+
+
+def init_compression(app):
+    """Register the after_request hook that compresses dynamic responses.
+
+    Static assets are compressed once when the manifest is built, see
+    finance_app.static_assets.
+    """
+    if not app.config['COMPRESS_ENABLED']:
+        return
+
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    level = app.config['COMPRESS_LEVEL']
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if (
+            response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or 'Content-Range' in response.headers
+            or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        # Streamed JSON: gzip on the fly, brotli has no incremental stdlib path.
+        # The first min_size bytes are read first, so short bodies go out as is
+        if response.is_streamed:
+            encoding = choose_encoding(request.accept_encodings, allow_brotli=False)
+            if encoding is None:
+                return response
+            chunks = iter(response.response)
+            head, ended = _read_head(chunks, min_size)
+            if ended:
+                response.set_data(b''.join(head))
+                return response
+            response.response = _compress_stream(head, chunks, level)
+            _mark_encoded(response, encoding)
+            return response
+
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None or response.content_length is None \
+                or response.content_length < min_size:
+            return response
+        response.set_data(_compress(response.get_data(), encoding, level))
+        _mark_encoded(response, encoding)
+        return response
+
+    return compress_response
+
+
+def _mark_encoded(response, encoding):
+    """Set encoding headers and derive a distinct ETag for the encoded body"""
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+    if response.is_streamed:
+        response.headers.pop('Content-Length', None)
@@ -1,37 +1,258 @@
 # DB setup - Standard SQL with sqlite3
 import sqlite3
 import os
+import threading
+import time
 from contextlib import contextmanager
-from flask import g, current_app
+from flask import g, current_app, request, has_request_context, has_app_context
+from flask_login import current_user
 
 
-def get_db():
-    """Get database connection from Flask g object"""
-    if 'db' not in g:
-        db_path = os.environ.get('DATABASE_URL', 'finance_app.db')
-        # Remove sqlite:/// prefix if present
-        if db_path.startswith('sqlite:///'):
-            db_path = db_path.replace('sqlite:///', '')
-        g.db = sqlite3.connect(db_path)
-        g.db.row_factory = sqlite3.Row  # Return rows as dictionaries
-    return g.db
+# HTTP methods served from a read-only connection when DB_READ_ROUTING is on
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Connections kept open by threads that serve many requests (see keep_thread_connections)
+_thread_local = threading.local()
+# Idle connections per (path, readonly), shared by the threads of a process
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_db_path():
+    """Path of the live database file (the directory database when sharded)"""
+    db_path = os.environ.get('DATABASE_URL', 'finance_app.db')
+    # Remove sqlite:/// prefix if present
+    if db_path.startswith('sqlite:///'):
+        db_path = db_path.replace('sqlite:///', '')
+    return db_path
+
+
+def shard_count():
+    """Number of shard files, 0 when all data lives in the one database"""
+    return current_app.config.get('DB_SHARDS', 0) if has_app_context() else 0
+
+
+def get_shard_path(shard):
+    """File of one shard: finance_app.db -> finance_app.shard0.db"""
+    base, ext = os.path.splitext(get_db_path())
+    return f'{base}.shard{shard}{ext or ".db"}'
+
+
+def all_db_paths():
+    """The database, followed by every shard file"""
+    return [get_db_path()] + [get_shard_path(shard) for shard in range(shard_count())]
+
+
+def default_shard(user_id):
+    """Shard a new user is placed on"""
+    return user_id % shard_count()
+
+
+def shard_for_user(user_id):
+    """Shard holding a user's data, from the directory's user.shard"""
+    if has_request_context() and current_user.is_authenticated and current_user.id == user_id:
+        shard = current_user.shard
+    else:
+        row = get_directory_db().execute('SELECT shard FROM user WHERE id = ?', (user_id,)).fetchone()
+        shard = row['shard'] if row is not None else None
+    # Users created before sharding have no shard until they are moved to one
+    return default_shard(user_id) if shard is None else shard
+
+
+def connect(db_path, readonly=False, check_same_thread=True):
+    """Open a connection, read-only connections can never write or create the file"""
+    if readonly:
+        conn = sqlite3.connect(f'file:{os.path.abspath(db_path)}?mode=ro', uri=True,
+                               check_same_thread=check_same_thread)
+        conn.execute('PRAGMA query_only = ON')
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    return conn
+
+
+class ConnectionPool:
+    """Idle connections to one database file, reused by later requests
+
+    A reused connection skips re-reading the schema and keeps its page
+    cache. A connection is only used by one request at a time, but that
+    request may run on any thread, so pooled connections are opened with
+    check_same_thread off.
+    """
+
+    def __init__(self, path, readonly, max_idle):
+        self.path = path
+        self.readonly = readonly
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.path, readonly=self.readonly, check_same_thread=False)
+
+    def release(self, conn):
+        # Discard anything the request left uncommitted
+        conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+
+def _get_pool(path, readonly):
+    size = current_app.config.get('DB_POOL_SIZE', 0)
+    if size <= 0:
+        return None
+    key = (path, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(path, readonly, size))
+    return pool
+
+
+def reset_after_fork():
+    """Forget pooled connections inherited from the parent process
+
+    SQLite connections must not be used across fork(); the child opens its
+    own as requests arrive.
+    """
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    _pools.clear()
+
+
+def keep_thread_connections():
+    """Reuse this thread's connections across requests instead of reopening them
+
+    Called once by each thread of a long-lived executor (asgi.py). get_db
+    then hands out the thread's own writer and read-only connections, and
+    close_db rolls them back rather than closing them. Connections never
+    leave the thread that opened them.
+    """
+    _thread_local.connections = {}
+
+
+def _acquire(path, readonly):
+    connections = getattr(_thread_local, 'connections', None)
+    if connections is not None:
+        key = (path, readonly)
+        if key not in connections:
+            connections[key] = connect(path, readonly=readonly)
+        return connections[key]
+    pool = _get_pool(path, readonly)
+    return pool.acquire() if pool is not None else connect(path, readonly=readonly)
+
+
+def _release(conn, path, readonly):
+    if conn in getattr(_thread_local, 'connections', {}).values():
+        conn.rollback()
+        return
+    pool = _pools.get((path, readonly))
+    if pool is not None:
+        pool.release(conn)
+    else:
+        conn.close()
+
+
+def _request_connection(path, readonly):
+    """Connection to path for the rest of the request (or app context)"""
+    connections = g.setdefault('db_connections', {})
+    key = (path, readonly)
+    if key not in connections:
+        connections[key] = _acquire(path, readonly)
+    return connections[key]
+
+
+def is_read_request():
+    """True inside a request whose method never mutates data"""
+    return has_request_context() and request.method in READ_METHODS
+
+
+def _use_read_only(readonly):
+    if readonly is None:
+        return current_app.config.get('DB_READ_ROUTING', False) and is_read_request()
+    return readonly
+
+
+def get_user_shard(user_id=None):
+    """Shard of a user, the logged-in user by default
+
+    None without shards, or when there is no user (the request then uses
+    the directory database).
+    """
+    if not shard_count():
+        return None
+    if user_id is None:
+        if not (has_request_context() and current_user.is_authenticated):
+            return None
+        user_id = current_user.id
+    return shard_for_user(user_id)
+
+
+def get_user_db_path(user_id=None):
+    """File holding a user's data, the logged-in user's by default"""
+    shard = get_user_shard(user_id)
+    return get_db_path() if shard is None else get_shard_path(shard)
+
+
+def get_db(readonly=None, user_id=None):
+    """Get database connection from Flask g object
+
+    With DB_READ_ROUTING enabled, GET requests get a read-only connection and
+    mutations get the writer connection. Pass readonly to override the routing.
+    With DB_SHARDS set, the connection is to the shard of user_id (the
+    logged-in user by default).
+    """
+    return _request_connection(get_user_db_path(user_id), _use_read_only(readonly))
+
+
+def get_directory_db(readonly=None):
+    """Connection to the database holding the user table"""
+    return _request_connection(get_db_path(), _use_read_only(readonly))
+
+
+def get_snapshot_path(shard=None):
+    """Analytics snapshot of the database, or of one shard"""
+    snapshot_path = current_app.config.get('DB_SNAPSHOT_PATH')
+    if not snapshot_path or shard is None:
+        return snapshot_path
+    base, ext = os.path.splitext(snapshot_path)
+    return f'{base}.shard{shard}{ext or ".db"}'
+
+
+def get_analytics_db(user_id=None):
+    """Connection for heavy aggregate reads
+
+    Uses the periodically refreshed snapshot when DB_SNAPSHOT_PATH is set (and
+    has been built), so analytics never contend with imports on the live file.
+    Snapshots are replaced on disk, so their connections are never pooled.
+    """
+    snapshot_path = get_snapshot_path(get_user_shard(user_id))
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        return get_db(user_id=user_id)
+    snapshots = g.setdefault('analytics_db', {})
+    if snapshot_path not in snapshots:
+        snapshots[snapshot_path] = connect(snapshot_path, readonly=True)
+    return snapshots[snapshot_path]
 
 
 def close_db(e=None):
-    """Close database connection"""
-    db = g.pop('db', None)
-    if db is not None:
+    """Return pooled connections, close the others"""
+    for (path, readonly), db in g.pop('db_connections', {}).items():
+        _release(db, path, readonly)
+    for db in g.pop('analytics_db', {}).values():
         db.close()
 
 
 @contextmanager
 def get_db_connection():
     """Context manager for database connections"""
-    db_path = os.environ.get('DATABASE_URL', 'finance_app.db')
-    if db_path.startswith('sqlite:///'):
-        db_path = db_path.replace('sqlite:///', '')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = connect(get_db_path())
     try:
         yield conn
         conn.commit()
@@ -42,57 +263,73 @@ def get_db_connection():
         conn.close()
 
 
+def refresh_snapshot(db_path, snapshot_path):
+    """Copy a live database into its analytics snapshot with the backup API
+
+    The copy is written next to the snapshot and swapped in atomically, so
+    readers of the old snapshot are never interrupted. The source is read in
+    a single step from a read-only connection, which in WAL mode never blocks
+    writers.
+    """
+    tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    source = connect(db_path, readonly=True)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_path, snapshot_path)
+
+
+def start_snapshot_refresher(app):
+    """Refresh the analytics snapshot every DB_SNAPSHOT_INTERVAL seconds
+
+    Several worker processes may run this loop; a worker only refreshes when
+    the snapshot on disk is older than the interval. With shards, each shard
+    file has its own snapshot.
+    """
+    interval = app.config['DB_SNAPSHOT_INTERVAL']
+    with app.app_context():
+        if shard_count():
+            paths = [(get_shard_path(shard), get_snapshot_path(shard)) for shard in range(shard_count())]
+        else:
+            paths = [(get_db_path(), get_snapshot_path())]
+
+    def refresh_loop():
+        while True:
+            for db_path, snapshot_path in paths:
+                try:
+                    if not os.path.exists(snapshot_path) or \
+                            time.time() - os.path.getmtime(snapshot_path) >= interval:
+                        refresh_snapshot(db_path, snapshot_path)
+                except Exception:
+                    app.logger.exception('Analytics snapshot refresh failed')
+            time.sleep(interval)
+
+    thread = threading.Thread(target=refresh_loop, name='snapshot-refresher', daemon=True)
+    thread.start()
+    return thread
+
+
 def init_db():
-    """Initialize database tables"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create expenses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expense (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                description TEXT NOT NULL,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                date DATE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Create budgets table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS budget (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                category TEXT NOT NULL,
-                amount REAL NOT NULL,
-                month INTEGER NOT NULL,
-                year INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, category, month, year),
-                FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Create indexes for better performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_user_id ON expense(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_date ON expense(date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_category ON expense(category)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_budget_user_id ON budget(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_budget_month_year ON budget(month, year)')
-        
-        conn.commit()
+    """Bring the schema of the database and every shard up to date
+
+    Migrations are versioned (see migrations.py), so on a current database
+    startup costs one PRAGMA read per file instead of re-running every DDL
+    statement. Missing shard files are created, with incremental auto-vacuum
+    so maintenance can return freed pages to the filesystem.
+    """
+    from finance_app.migrations import migrate
+    for path in all_db_paths():
+        conn = connect(path)
+        try:
+            if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            migrate(conn)
+            
+            # WAL lets read-only connections and the snapshot backup run alongside writers
+            if current_app.config.get('DB_READ_ROUTING') or current_app.config.get('DB_SNAPSHOT_PATH'):
+                conn.execute('PRAGMA journal_mode=WAL').fetchone()
+        finally:
+            conn.close()
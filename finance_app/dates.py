@@ -0,0 +1,98 @@
+# Date normalization - fast ISO parsing and per-file format detection for imports
+from datetime import date, datetime
+from functools import lru_cache
+
+
+# Statement date formats by name, in detection order. US before day-first
+# formats, so a file whose days are all <= 12 reads as MM/DD/YYYY.
+DATE_FORMATS = {
+    'iso': '%Y-%m-%d',
+    'us': '%m/%d/%Y',
+    'us_short': '%m/%d/%y',
+    'eu': '%d/%m/%Y',
+    'eu_dot': '%d.%m.%Y',
+    'eu_dash': '%d-%m-%Y',
+    'compact': '%Y%m%d',          # OFX / bank exports
+    'bank': '%d %b %Y',           # 15 Oct 2024
+    'bank_dash': '%d-%b-%Y',      # 15-Oct-2024
+    'bank_us': '%b %d, %Y',       # Oct 15, 2024
+}
+
+# Date strings looked at when detecting a file's format
+DETECT_SAMPLE_SIZE = 50
+
+
+@lru_cache(maxsize=4096)
+def parse_iso(value):
+    """date for a YYYY-MM-DD string, memoized since the same days repeat"""
+    return date.fromisoformat(value)
+
+
+def month_key(value):
+    """'YYYY-MM' for a date or ISO date string"""
+    if isinstance(value, str):
+        value = parse_iso(value[:10])
+    return f"{value.year}-{value.month:02d}"
+
+
+class DateParser:
+    """Parses one file's dates into ISO strings with a fixed format
+
+    Results are memoized per distinct string, so each day in a statement
+    is parsed once no matter how many transactions it has.
+    """
+
+    __slots__ = ('name', 'fmt', '_cache')
+
+    def __init__(self, name='iso'):
+        self.name = name
+        self.fmt = DATE_FORMATS[name]
+        self._cache = {}
+
+    def __call__(self, value):
+        """ISO date string for value, None if it does not match the format"""
+        try:
+            return self._cache[value]
+        except KeyError:
+            pass
+        parsed = None
+        if self.name == 'iso':
+            try:
+                parsed = parse_iso(value).isoformat()
+            except ValueError:
+                pass  # unpadded dates (2024-1-5) fall through to strptime
+        if parsed is None:
+            try:
+                parsed = datetime.strptime(value, self.fmt).date().isoformat()
+            except ValueError:
+                pass
+        self._cache[value] = parsed
+        return parsed
+
+
+def _matches(fmt, value):
+    try:
+        datetime.strptime(value, fmt)
+        return True
+    except ValueError:
+        return False
+
+
+def detect_format(values, names=None):
+    """Name of the first format that parses every sampled date
+
+    Falls back to the format parsing the most samples, so a few bad rows
+    do not reject a whole file; those rows are reported individually.
+    """
+    names = names or list(DATE_FORMATS)
+    samples = [value for value in values if value][:DETECT_SAMPLE_SIZE]
+    if not samples:
+        return names[0]
+    best, best_count = names[0], -1
+    for name in names:
+        count = sum(_matches(DATE_FORMATS[name], value) for value in samples)
+        if count == len(samples):
+            return name
+        if count > best_count:
+            best, best_count = name, count
+    return best
@@ -0,0 +1,175 @@
+# Live updates - per-user Server-Sent Events of dashboard deltas, shared by all worker processes
+"""
+A write publishes its dashboard deltas into the event_log table of the
+user's database file, stamped with the user's sync version (see sync.py),
+so the events reach the user's dashboards whichever process serves them.
+
+/api/events does not hold a connection (or a server thread) open: every
+request answers with the events after the version the client has seen and
+ends, and the browser's EventSource polls again after POLL_INTERVAL_MS,
+sending the last event id (the version) back. When some version in between
+has no events (an import, or events already pruned) the client is told to
+reload instead.
+
+Nothing is recorded for users who have not polled within LISTENER_TTL.
+"""
+import time
+from datetime import date, timedelta
+
+from flask import current_app
+
+from finance_app import sync
+from finance_app.database import get_db
+from finance_app.utils import get_budget_status
+
+
+# Milliseconds the browser waits between polls, i.e. the delay of an update
+POLL_INTERVAL_MS = 2000
+# Seconds after their last poll that a user still counts as listening
+LISTENER_TTL = 60
+# Versions of events kept per user; a client further behind reloads
+EVENT_LOG_VERSIONS = 200
+
+
+def has_subscribers(user_id):
+    """True when the user polled for events recently, in any process"""
+    row = get_db(user_id=user_id).execute(
+        'SELECT seen_at FROM event_listener WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return row is not None and row[0] > time.time() - LISTENER_TTL
+
+
+def publish(user_id, messages, version=None):
+    """Record the (event, data) messages of one change together, in one transaction
+
+    version is the one the change was stamped with. By default it is read
+    from sync_state, which is only exact inside the change's own transaction;
+    the commit here then commits the change too. Does nothing when nobody is
+    listening.
+    """
+    if not messages or not has_subscribers(user_id):
+        return
+    db = get_db(readonly=False, user_id=user_id)
+    if version is None:
+        version, _ = sync.state(db, user_id)
+    db.executemany(
+        'INSERT INTO event_log (user_id, version, event, data) VALUES (?, ?, ?, ?)',
+        [(user_id, version, event, current_app.json.dumps(data)) for event, data in messages]
+    )
+    db.execute('DELETE FROM event_log WHERE user_id = ? AND version <= ?',
+               (user_id, version - EVENT_LOG_VERSIONS))
+    db.commit()
+
+
+def _message(version, event, data):
+    return f"id: {version}\nevent: {event}\ndata: {data}\n\n"
+
+
+def poll(user_id, since):
+    """SSE messages for a client that has seen version since (None when unknown)
+
+    Marks the user as listening, writing at most every third of LISTENER_TTL.
+    """
+    db = get_db(user_id=user_id)
+    version, _ = sync.state(db, user_id)
+    listener = db.execute('SELECT seen_at FROM event_listener WHERE user_id = ?', (user_id,)).fetchone()
+    now = time.time()
+    if listener is None or listener[0] < now - LISTENER_TTL / 3:
+        writer = get_db(readonly=False, user_id=user_id)
+        writer.execute('INSERT OR REPLACE INTO event_listener (user_id, seen_at) VALUES (?, ?)', (user_id, now))
+        writer.commit()
+
+    # Tell the browser how long to wait before polling again
+    messages = [f'retry: {POLL_INTERVAL_MS}\n\n']
+    if since is None:
+        messages.append(_message(version, 'version', '{}'))
+    elif since < version:
+        rows = db.execute('''
+            SELECT version, event, data FROM event_log
+            WHERE user_id = ? AND version > ? AND version <= ?
+            ORDER BY id
+        ''', (user_id, since, version)).fetchall()
+        if len({row[0] for row in rows}) == version - since:
+            messages.extend(_message(*row) for row in rows)
+        else:
+            messages.append(_message(version, 'refresh', '{}'))
+    elif since > version:
+        # Version from another database (the user was moved, or it was reset)
+        messages.append(_message(version, 'refresh', '{}'))
+    return messages
+
+
+def expense_delta(expense, sign, today=None):
+    """Signed change one expense makes to the dashboard totals
+
+    The server decides which week/month buckets the expense falls in, so
+    the client only adds amounts.
+    """
+    if today is None:
+        today = date.today()
+    day = date.fromisoformat(str(expense.date)[:10])
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_last_week = start_of_week - timedelta(days=7)
+    return {
+        'amount': sign * expense.amount,
+        'category': expense.category,
+        'month': f"{day.year}-{day.month:02d}",
+        'this_week': start_of_week <= day <= start_of_week + timedelta(days=6),
+        'last_week': start_of_last_week <= day < start_of_week,
+        'this_month': (day.year, day.month) == (today.year, today.month),
+    }
+
+
+def publish_expense(user_id, action, expense=None, previous=None):
+    """Publish an expense write with its total deltas and the budgets it changed
+
+    Created and updated rows carry their version; a delete is published
+    inside its own transaction (see publish).
+    """
+    if not has_subscribers(user_id):
+        return
+    version = expense.version if expense is not None else None
+    today = date.today()
+    try:
+        deltas = [expense_delta(e, sign, today) for e, sign in ((previous, -1), (expense, 1)) if e is not None]
+    except ValueError:
+        # Legacy rows with unparseable dates cannot be placed, reload instead
+        publish(user_id, [('refresh', {})], version)
+        return
+    messages = [('expense', {
+        'action': action,
+        'expense': expense,
+        'previous': previous,
+        'deltas': deltas,
+    })]
+    for category in sorted({delta['category'] for delta in deltas if delta['this_month']}):
+        message = budget_message(user_id, category, today.month, today.year)
+        if message is not None:
+            messages.append(message)
+    publish(user_id, messages, version)
+
+
+def budget_message(user_id, category, month, year):
+    """('budget', current status) of one budget (alert or not), None without a budget"""
+    budget_amount, spent, remaining, percentage, is_over, is_warning = get_budget_status(
+        user_id, category, month, year, db=get_db(user_id=user_id)
+    )
+    if budget_amount is None:
+        return None
+    return 'budget', {
+        'category': category,
+        'budget': budget_amount,
+        'spent': spent,
+        'remaining': remaining,
+        'percentage': percentage,
+        'is_over': is_over,
+        'is_warning': is_warning
+    }
+
+
+def publish_budget(user_id, category, month, year):
+    """Publish the status of one budget, inside the transaction that changed it"""
+    if not has_subscribers(user_id):
+        return
+    message = budget_message(user_id, category, month, year)
+    publish(user_id, [message] if message is not None else [])
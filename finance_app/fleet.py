@@ -0,0 +1,164 @@
+# Fleet analytics - cross-user aggregates for operators, fanned out over worker processes
+"""
+Operator report of spend by category, active users and import volumes
+across every user:
+
+    python -m finance_app.fleet [--workers N] [--days D]   # report, with timings
+    python -m finance_app.fleet --scale                    # wall time per worker count
+
+Each database file (the analytics snapshot of it when DB_SNAPSHOT_PATH is
+built, so the live files see no load) is cut into user-id ranges. Worker
+processes aggregate one range each on their own read-only connection, and
+the partial results are summed. A user's rows live in one file and one
+range, so per-user counts add up without double counting. Archived months
+are included through expense_rollup.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from finance_app.database import connect, all_db_paths, get_db_path, get_snapshot_path
+
+# User-id ranges per worker and file, so a slow range does not leave workers idle
+RANGES_PER_WORKER = 4
+# Users with an expense dated in this many days count as active
+ACTIVE_DAYS = 30
+
+
+def _source(path, shard):
+    """The snapshot of a file when it has been built, otherwise the file itself"""
+    snapshot_path = get_snapshot_path(shard)
+    return snapshot_path if snapshot_path and os.path.exists(snapshot_path) else path
+
+
+def sources():
+    """[(label, path read)] for the database and every shard"""
+    return [(path, _source(path, None if index == 0 else index - 1))
+            for index, path in enumerate(all_db_paths())]
+
+
+def user_ranges(low, high, count):
+    """Split user ids low..high into at most count (first, last) ranges"""
+    size = max(1, -(-(high - low + 1) // count))
+    return [(first, min(first + size - 1, high)) for first in range(low, high + 1, size)]
+
+
+def aggregate_range(path, first, last, since):
+    """Partial aggregates of users first..last in one file, run in a worker process"""
+    started = time.perf_counter()
+    conn = connect(path, readonly=True)
+    try:
+        partial = {'categories': {}, 'expenses': 0, 'archived': 0, 'imported': 0, 'imported_recent': 0}
+        for category, total, count, imported, recent in conn.execute('''
+            SELECT category, SUM(amount), COUNT(*), COUNT(fingerprint),
+                   COALESCE(SUM(fingerprint IS NOT NULL AND created_at >= ?), 0)
+            FROM expense WHERE user_id BETWEEN ? AND ?
+            GROUP BY category
+        ''', (since, first, last)):
+            partial['categories'][category] = [total, count]
+            partial['expenses'] += count
+            partial['imported'] += imported
+            partial['imported_recent'] += recent
+        for category, total, count in conn.execute('''
+            SELECT category, SUM(total), SUM(count) FROM expense_rollup
+            WHERE user_id BETWEEN ? AND ? GROUP BY category
+        ''', (first, last)):
+            entry = partial['categories'].setdefault(category, [0.0, 0])
+            entry[0] += total
+            entry[1] += count
+            partial['archived'] += count
+        partial['active_users'] = conn.execute(
+            'SELECT COUNT(DISTINCT user_id) FROM expense WHERE user_id BETWEEN ? AND ? AND date >= ?',
+            (first, last, since)
+        ).fetchone()[0]
+        partial['seconds'] = time.perf_counter() - started
+        return partial
+    finally:
+        conn.close()
+
+
+def merge(partials):
+    """Sum partial aggregates into one report"""
+    report = {'categories': {}, 'expenses': 0, 'archived': 0, 'imported': 0, 'imported_recent': 0,
+              'active_users': 0, 'seconds': 0.0}
+    for partial in partials:
+        for category, (total, count) in partial['categories'].items():
+            entry = report['categories'].setdefault(category, [0.0, 0])
+            entry[0] += total
+            entry[1] += count
+        for key in ('expenses', 'archived', 'imported', 'imported_recent', 'active_users', 'seconds'):
+            report[key] += partial[key]
+    return report
+
+
+def run(workers=None, days=ACTIVE_DAYS):
+    """Fleet report over every file, with 'users', 'tasks' and 'wall_seconds' timings
+
+    Needs an app context (for the paths); the workers do not.
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    directory = connect(get_db_path(), readonly=True)
+    try:
+        users, low, high = directory.execute('SELECT COUNT(*), MIN(id), MAX(id) FROM user').fetchone()
+    finally:
+        directory.close()
+    since = (date.today() - timedelta(days=days)).isoformat()
+    ranges = user_ranges(low, high, workers * RANGES_PER_WORKER) if users else []
+    tasks = [(path, first, last, since) for _, path in sources() for first, last in ranges]
+    if workers == 1:
+        partials = [aggregate_range(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partials = list(executor.map(aggregate_range, *zip(*tasks))) if tasks else []
+    report = merge(partials)
+    report.update(users=users, tasks=len(tasks), workers=workers, days=days,
+                  wall_seconds=time.perf_counter() - started)
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"users            {report['users']:>12,}",
+        f"active users     {report['active_users']:>12,}  (expense in the last {report['days']} days)",
+        f"expenses         {report['expenses'] + report['archived']:>12,}  ({report['archived']:,} archived)",
+        f"imported         {report['imported']:>12,}  ({report['imported_recent']:,} in the last {report['days']} days)",
+        '',
+        f"{'category':<16} {'total':>16} {'expenses':>12}",
+    ]
+    for category, (total, count) in sorted(report['categories'].items(), key=lambda item: -item[1][0]):
+        lines.append(f'{category or "-":<16} {total:>16,.2f} {count:>12,}')
+    lines += [
+        '',
+        f"{report['tasks']} ranges on {report['workers']} workers: {report['wall_seconds']:.3f} s wall, "
+        f"{report['seconds']:.3f} s in queries "
+        f"({report['seconds'] / report['wall_seconds'] if report['wall_seconds'] else 0:.1f}x parallel)",
+    ]
+    return '\n'.join(lines)
+
+
+def main(argv):
+    from finance_app import create_app
+    workers = int(argv[argv.index('--workers') + 1]) if '--workers' in argv else os.cpu_count() or 1
+    days = int(argv[argv.index('--days') + 1]) if '--days' in argv else ACTIVE_DAYS
+    app = create_app()
+    with app.app_context():
+        for label, path in sources():
+            print(f'{label}: reading {"snapshot " + path if path != label else "read-only"}')
+        if '--scale' not in argv:
+            print()
+            print(format_report(run(workers, days)))
+            return
+        # 1, 2, 4, ... up to the worker count
+        counts = [2 ** power for power in range(workers.bit_length()) if 2 ** power < workers] + [workers]
+        baseline = None
+        for count in counts:
+            wall = run(count, days)['wall_seconds']
+            baseline = baseline or wall
+            print(f'{count:>4} workers  {wall:8.3f} s  {baseline / wall:5.1f}x')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,196 @@
+# Budget forecasting - vectorized month-end projections for every category
+import calendar
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from finance_app.database import get_db
+from finance_app.analytics import load_numpy, parse_days
+from finance_app.utils import predict_budget_overrun
+
+
+# Set by available() on first use, see analytics.load_numpy
+np = None
+
+
+# Full months of history used for weekday seasonality and recurring charges
+HISTORY_MONTHS = 3
+# Two-sided 90% normal interval
+Z_90 = 1.645
+# A day-of-month charge is recurring when its amount varies less than this across months
+RECURRING_TOLERANCE = 0.15
+
+
+@dataclass(slots=True)
+class CategoryForecast:
+    """Month-end projection for one category"""
+
+    category: str
+    spent: float
+    projected: float
+    lower: float
+    upper: float
+    recurring_remaining: float
+
+
+def available():
+    """Forecasting needs NumPy, otherwise callers use predict_budget_overrun"""
+    global np
+    np = load_numpy()
+    return np is not None
+
+
+def _add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _shift(values, offset):
+    """Shift an array along its last axis, filling with zeros/False"""
+    shifted = np.zeros_like(values)
+    if offset > 0:
+        shifted[..., offset:] = values[..., :-offset]
+    else:
+        shifted[..., :offset] = values[..., -offset:]
+    return shifted
+
+
+def forecast_month(user_id, today=None):
+    """Project this month's total for every category the user spends in.
+
+    One grouped query loads daily per-category totals for the current month
+    and the HISTORY_MONTHS before it. All categories are then fitted at once:
+
+    - recurring charges are day-of-month charges present in every history
+      month (within a day) with a stable amount; the ones not yet billed
+      this month are added as-is,
+    - the remaining (discretionary) spend is projected with a weekday
+      profile from history, scaled to this month's pace so far,
+    - the band is the 90% interval of the summed remaining daily spend.
+
+    Returns {category: CategoryForecast}, empty without NumPy.
+    """
+    if not available():
+        return {}
+    if today is None:
+        today = datetime.now().date()
+    month_start = today.replace(day=1)
+    history_start = _add_months(month_start, -HISTORY_MONTHS)
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    days_passed = today.day
+
+    db = get_db(user_id=user_id)
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT category, date, SUM(amount) as total
+        FROM expense
+        WHERE user_id = ? AND date >= ? AND date <= ?
+        GROUP BY category, date
+    ''', (user_id, history_start.isoformat(), today.isoformat()))
+    rows = cursor.fetchall()
+    if not rows:
+        return {}
+
+    categories, category_index = np.unique(
+        np.array([row['category'] for row in rows], dtype=object), return_inverse=True
+    )
+    days = parse_days([row['date'] for row in rows])
+    totals = np.array([row['total'] for row in rows], dtype=np.float64)
+    valid = ~np.isnat(days)
+    days, totals, category_index = days[valid], totals[valid], category_index[valid]
+
+    # Lay every day out as (category, month, day of month); the last month is the current one
+    months = days.astype('datetime64[M]')
+    month_offset = (months - np.datetime64(history_start, 'M')).astype(np.int64)
+    day_of_month = (days - months.astype('datetime64[D]')).astype(np.int64)
+    by_day = np.zeros((len(categories), HISTORY_MONTHS + 1, 31))
+    np.add.at(by_day, (category_index, month_offset, day_of_month), totals)
+    history, current = by_day[:, :HISTORY_MONTHS], by_day[:, HISTORY_MONTHS]
+
+    # Calendar of the history months: which (month, day) cells exist and their weekday
+    first_days = np.array([_add_months(history_start, m) for m in range(HISTORY_MONTHS)], dtype='datetime64[D]')
+    cell_days = first_days[:, None] + np.arange(31)
+    cell_valid = cell_days.astype('datetime64[M]') == first_days.astype('datetime64[M]')[:, None]
+    cell_weekday = (cell_days.astype(np.int64) - 4) % 7  # 1970-01-01 was a Thursday
+
+    # Recurring charges: charged on day d of the latest month with no charge on
+    # the neighbouring days, within a day of d in every history month, with a
+    # stable amount. Busy categories with spend every day never qualify.
+    present = history > 0
+    neighbours = _shift(present, 1) | _shift(present, -1)
+    near = present | neighbours
+    window = history + _shift(history, 1) + _shift(history, -1)
+    low, high = window.min(axis=1), window.max(axis=1)
+    recurring = near.all(axis=1) & present[:, -1] & ~neighbours[:, -1] \
+        & (low >= high * (1 - RECURRING_TOLERANCE)) & (high > 0)
+    recurring_amount = np.where(recurring, np.median(window, axis=1), 0.0)
+    recurring_window = recurring | _shift(recurring, 1) | _shift(recurring, -1)
+
+    # Recurring charges still to come this month (not already billed a day early)
+    day_numbers = np.arange(1, 32)
+    billed = current > 0
+    already = billed | _shift(billed, 1)
+    upcoming = recurring & (day_numbers > days_passed) & (day_numbers <= days_in_month) & ~already
+    recurring_remaining = (recurring_amount * upcoming).sum(axis=1)
+
+    # Discretionary spend excludes the recurring charge windows
+    discretionary = history * ~recurring_window[:, None, :] * cell_valid
+    weekday_onehot = (cell_weekday[..., None] == np.arange(7)) & cell_valid[..., None]
+    weekday_counts = weekday_onehot.sum(axis=(0, 1))
+    profile = np.einsum('cmd,mdw->cw', discretionary, weekday_onehot) / np.maximum(weekday_counts, 1)
+    daily_std = discretionary[:, cell_valid].std(axis=1)
+
+    spent = current.sum(axis=1)
+    current_discretionary = (current * ~recurring_window)[:, :days_passed].sum(axis=1)
+    month_weekdays = (np.datetime64(month_start, 'D').astype(np.int64) + np.arange(days_in_month) - 4) % 7
+    expected_elapsed = profile[:, month_weekdays[:days_passed]].sum(axis=1)
+    expected_remaining = profile[:, month_weekdays[days_passed:]].sum(axis=1)
+    remaining_days = days_in_month - days_passed
+
+    # Weekday-shaped projection scaled to this month's pace; plain pace without history
+    pace_remaining = current_discretionary / days_passed * remaining_days
+    level = np.clip(current_discretionary / np.where(expected_elapsed > 0, expected_elapsed, 1), 0.5, 2.0)
+    discretionary_remaining = np.where(expected_elapsed > 0, expected_remaining * level, pace_remaining)
+
+    projected = spent + discretionary_remaining + recurring_remaining
+    spread = Z_90 * daily_std * np.sqrt(remaining_days)
+    lower = spent + recurring_remaining + np.maximum(discretionary_remaining - spread, 0)
+    upper = projected + spread
+
+    return {
+        str(category): CategoryForecast(
+            category=str(category),
+            spent=round(float(spent[i]), 2),
+            projected=round(float(projected[i]), 2),
+            lower=round(float(lower[i]), 2),
+            upper=round(float(upper[i]), 2),
+            recurring_remaining=round(float(recurring_remaining[i]), 2)
+        )
+        for i, category in enumerate(categories)
+    }
+
+
+def predict_budget_overruns(user_id, budgets, today=None, forecasts=None):
+    """Predict overruns for a month's budgets from a single forecast pass
+
+    Pass forecasts to reuse an existing forecast_month() result. Returns
+    [(category, will_exceed, projected_total, projected_overrun)], falling
+    back to the per-category predict_budget_overrun without NumPy.
+    """
+    if today is None:
+        today = datetime.now().date()
+    if not available():
+        return [
+            (budget['category'],) + predict_budget_overrun(user_id, budget['category'], today.month, today.year)
+            for budget in budgets
+        ]
+
+    if forecasts is None:
+        forecasts = forecast_month(user_id, today)
+    results = []
+    for budget in budgets:
+        forecast = forecasts.get(budget['category'])
+        projected = forecast.projected if forecast else 0.0
+        will_exceed = projected > budget['amount']
+        overrun = projected - budget['amount'] if will_exceed else 0
+        results.append((budget['category'], will_exceed, projected, overrun))
+    return results
@@ -0,0 +1,190 @@
+# Group commit - expense writes batched into shared transactions by one writer thread per file
+"""
+Expense inserts and updates go through `write()`. Normally it runs the
+write on the request's connection and commits, one transaction (and one
+fsync) per expense.
+
+With WRITE_BATCHING on, the write is queued for the writer thread of the
+user's database file instead. The writer takes the first queued write,
+keeps collecting for up to WRITE_BATCH_WINDOW_MS (or until WRITE_BATCH_MAX
+writes), runs them in one transaction and commits once. Each write runs
+under its own savepoint, so a failing write is rolled back and reported to
+its request without failing the rest of the batch. Requests wait for the
+commit of their batch before they respond, at most WRITE_BATCH_TIMEOUT.
+
+A batch that fails outside its writes (the file cannot be opened, a commit
+or rollback fails) fails its requests; the writer then continues on a new
+connection.
+
+Writes read their row back in the same transaction, after the sync
+triggers have stamped its version and updated_at.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import current_app
+
+from finance_app.database import connect, get_db, get_user_db_path
+from finance_app.recurring import update_merchant
+
+# One writer per database file, created on first use in each process
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def insert_expense(conn, user_id, description, amount, category, date, hash_value):
+    """Insert an expense and re-evaluate its merchant, returning the new row"""
+    cursor = conn.execute('''
+        INSERT INTO expense (user_id, description, amount, category, date, merchant_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, description, amount, category, date, hash_value))
+    # Read back after the sync trigger, which assigns version and updated_at
+    row = conn.execute('SELECT * FROM expense WHERE id = ?', (cursor.lastrowid,)).fetchone()
+    update_merchant(conn, user_id, hash_value)
+    return row
+
+
+def update_expense(conn, expense_id, user_id, description, amount, category, date, hash_value, previous_hash):
+    """Update an expense and re-evaluate the merchants it left and joined, returning the row"""
+    conn.execute('''
+        UPDATE expense
+        SET description = ?, amount = ?, category = ?, date = ?, merchant_hash = ?
+        WHERE id = ? AND user_id = ?
+    ''', (description, amount, category, date, hash_value, expense_id, user_id))
+    row = conn.execute('SELECT * FROM expense WHERE id = ? AND user_id = ?', (expense_id, user_id)).fetchone()
+    # The old merchant loses a charge, the new one gains it
+    for affected_hash in {previous_hash, hash_value}:
+        update_merchant(conn, user_id, affected_hash)
+    return row
+
+
+class GroupCommitWriter:
+    """Writer thread committing queued writes to one database file in batches"""
+
+    def __init__(self, path, window, max_batch, timeout, logger):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.logger = logger
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """Queue fn(conn, *args) for the next batch, returning its result once committed"""
+        future = Future()
+        self._queue.put((fn, args, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # A write that has not started is dropped, it must not commit after the request failed
+            if not future.cancel() and future.done():
+                return future.result()
+            raise
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = self._next_batch()
+            try:
+                if conn is None:
+                    conn = connect(self.path)
+                    conn.isolation_level = None  # explicit transactions and savepoints
+                self._commit(conn, batch)
+            except Exception as e:
+                self.logger.exception('Group commit to %s failed', self.path)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+
+    def _commit(self, conn, batch):
+        # Skip writes whose request timed out before the batch started
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, future in batch:
+                conn.execute('SAVEPOINT write')
+                try:
+                    results.append((future, fn(conn, *args), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write')
+                    results.append((future, None, e))
+                conn.execute('RELEASE write')
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def _get_writer(path):
+    writer = _writers.get(path)
+    if writer is None or not writer.is_alive():
+        with _writers_lock:
+            writer = _writers.get(path)
+            # A writer whose thread ended anyway is replaced
+            if writer is None or not writer.is_alive():
+                writer = _writers[path] = GroupCommitWriter(
+                    path,
+                    current_app.config.get('WRITE_BATCH_WINDOW_MS', 2) / 1000,
+                    current_app.config.get('WRITE_BATCH_MAX', 64),
+                    current_app.config.get('WRITE_BATCH_TIMEOUT', 30),
+                    current_app.logger
+                )
+    return writer
+
+
+def write(fn, *args, user_id=None):
+    """Run fn(conn, *args) as a committed write to the user's file, returning its result
+
+    A write joining a transaction already open on the request's connection
+    (e.g. after archive.restore) runs on it directly, committing both.
+    """
+    db = get_db(user_id=user_id)
+    if not current_app.config.get('WRITE_BATCHING') or db.in_transaction:
+        result = fn(db, *args)
+        db.commit()
+        return result
+    return _get_writer(get_user_db_path(user_id)).submit(fn, *args)
+
+
+def reset_after_fork():
+    """Forget writer threads inherited from the parent process, fork does not copy them"""
+    global _writers_lock
+    _writers_lock = threading.Lock()
+    _writers.clear()
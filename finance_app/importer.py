@@ -0,0 +1,455 @@
+# Statement import - validate statement rows and bulk insert them idempotently
+import codecs
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from itertools import chain, islice
+
+from finance_app import sync
+from finance_app.dates import DETECT_SAMPLE_SIZE, DateParser, detect_format
+from finance_app.recurring import merchant_hash, update_merchant
+from finance_app.utils import categorize_transaction
+
+
+# Rows written per transaction, in one executemany call
+IMPORT_BATCH_SIZE = 1000
+# Files at least this large (chars) are parsed in a process pool
+PARALLEL_MIN_SIZE = 4 * 1024 * 1024
+# Characters of CSV handed to a worker at a time
+PARALLEL_CHUNK_SIZE = 1024 * 1024
+# Characters read from the top of a file to detect its date format
+DATE_SAMPLE_CHARS = 16 * 1024
+
+
+class ImportResult:
+    """Counts and errors of one import"""
+
+    __slots__ = ('imported_count', 'duplicate_count', 'skipped_count', 'errors', 'rejected_dates',
+                 'date_format', 'merchants', 'seconds')
+
+    def __init__(self):
+        self.imported_count = 0
+        self.duplicate_count = 0
+        self.skipped_count = 0  # credits (deposits, refunds) in bank statements
+        self.errors = []
+        self.rejected_dates = []
+        self.date_format = None
+        self.merchants = set()
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        rows = self.imported_count + self.duplicate_count + self.skipped_count + len(self.errors)
+        return round(rows / self.seconds) if self.seconds else 0
+
+    def to_dict(self):
+        """Response payload, errors are capped at 10"""
+        return {
+            'imported_count': self.imported_count,
+            'duplicate_count': self.duplicate_count,
+            'skipped_count': self.skipped_count,
+            'errors': self.errors[:10],  # Limit errors in response
+            'error_count': len(self.errors),
+            'date_format': self.date_format,
+            'rejected_dates': self.rejected_dates[:10],
+            'rejected_date_count': len(self.rejected_dates),
+            'rows_per_second': self.rows_per_second,
+            'message': f'Successfully imported {self.imported_count} expenses'
+                       + (f', skipped {self.duplicate_count} duplicates' if self.duplicate_count else '')
+                       + (f', skipped {self.skipped_count} credits' if self.skipped_count else '')
+        }
+
+
+def fingerprint_key(date_str, amount, description):
+    """(date, cents, normalized description): rows with equal keys are the same expense"""
+    return date_str, round(amount * 100), ' '.join(description.lower().split())
+
+
+def fingerprint(key, occurrence):
+    """Content hash identifying an imported row across re-uploads
+
+    occurrence numbers rows with the same fingerprint_key within one file
+    (two equal coffees on the same day), so genuine repeats are kept while
+    a re-upload of the same file maps onto the same fingerprints.
+    """
+    date_str, cents, normalized = key
+    return hashlib.sha1(f'{date_str}|{cents}|{normalized}|{occurrence}'.encode('utf-8')).hexdigest()
+
+
+def _validate(row, errors, rejected_dates, parse_date, today):
+    """(description, amount, category, date) for a CSV row, None if rejected"""
+    try:
+        description = (row.get('description') or '').strip()
+        amount_str = (row.get('amount') or '').strip()
+        category = (row.get('category') or '').strip()
+        date_str = (row.get('date') or '').strip()
+
+        if not description or not amount_str:
+            errors.append(f"Row missing description or amount: {row}")
+            return None
+
+        try:
+            amount = float(amount_str)
+        except ValueError:
+            errors.append(f"Invalid amount in row: {row}")
+            return None
+
+        # Missing dates mean today; dates in the wrong format are rejected
+        if date_str:
+            date_iso = parse_date(date_str)
+            if date_iso is None:
+                errors.append(f"Invalid date '{date_str}' in row: {row}")
+                rejected_dates.append(date_str)
+                return None
+        else:
+            date_iso = today
+
+        if not category:
+            category = categorize_transaction(description, amount)
+
+        return description, amount, category, date_iso
+    except Exception as e:
+        errors.append(f"Error processing row {row}: {str(e)}")
+        return None
+
+
+def _record_end(text, pos, in_quotes=False):
+    """Offset just past the first newline at or after pos that ends a record
+
+    A newline inside a quoted field does not end the record; quote state is
+    tracked by parity, which "" escapes preserve.
+    """
+    while True:
+        newline = text.find('\n', pos)
+        if newline == -1:
+            return len(text)
+        in_quotes ^= text.count('"', pos, newline) % 2 == 1
+        pos = newline + 1
+        if not in_quotes:
+            return pos
+
+
+def read_blocks(stream, chunk_size):
+    """Yield the text of a CSV upload in blocks of about chunk_size chars, cut on record boundaries
+
+    The stream may be binary (decoded as UTF-8) or text. Only the block
+    being cut is held, never the whole upload.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    while True:
+        data = stream.read(chunk_size)
+        pending += decoder.decode(data, final=not data) if isinstance(data, bytes) else data
+        if not data:
+            if pending:
+                yield pending
+            return
+        if len(pending) < chunk_size:
+            continue
+        # pending starts on a record boundary, so a newline after an even number of quotes ends a record
+        end = pending.rfind('\n')
+        while end != -1 and pending.count('"', 0, end) % 2:
+            end = pending.rfind('\n', 0, end)
+        if end != -1:
+            yield pending[:end + 1]
+            pending = pending[end + 1:]
+
+
+def _read_header(text):
+    """(fieldnames, offset of the first data record)"""
+    header_end = _record_end(text, 0)
+    return next(csv.reader([text[:header_end]]), None), header_end
+
+
+def _sample_dates(text, start, fieldnames):
+    """Date strings from the first records after start, for format detection"""
+    end = _record_end(text, min(start + DATE_SAMPLE_CHARS, len(text)),
+                      text.count('"', start, start + DATE_SAMPLE_CHARS) % 2 == 1)
+    reader = csv.DictReader(io.StringIO(text[start:end], newline=None), fieldnames=fieldnames)
+    return [(row.get('date') or '').strip() for row in reader]
+
+
+def _parse_chunk(fieldnames, chunk, date_format):
+    """Validate one chunk of CSV records, also the process pool worker"""
+    errors = []
+    rejected_dates = []
+    rows = []
+    parse_date = DateParser(date_format)
+    today = datetime.now().date().isoformat()
+    for row in csv.DictReader(io.StringIO(chunk, newline=None), fieldnames=fieldnames):
+        parsed = _validate(row, errors, rejected_dates, parse_date, today)
+        if parsed is not None:
+            rows.append(parsed)
+    return rows, errors, rejected_dates
+
+
+def _read_start(blocks, result, date_formats):
+    """(fieldnames, chunks of records) of CSV blocks, detecting the date format from the first block"""
+    blocks = iter(blocks)
+    first = next(blocks, '')
+    fieldnames, header_end = _read_header(first)
+    if fieldnames:
+        result.date_format = detect_format(_sample_dates(first, header_end, fieldnames), date_formats)
+    return fieldnames, chain([first[header_end:]], blocks)
+
+
+def parse_csv(blocks, result, date_formats=None):
+    """Yield validated (description, amount, category, date) rows from blocks of CSV text (see read_blocks)
+
+    The date format is detected once from the first rows; rows whose date
+    does not match it are rejected and listed in result.rejected_dates.
+    """
+    fieldnames, chunks = _read_start(blocks, result, date_formats)
+    if not fieldnames:
+        return
+    for chunk in chunks:
+        rows, errors, rejected_dates = _parse_chunk(fieldnames, chunk, result.date_format)
+        result.errors.extend(errors)
+        result.rejected_dates.extend(rejected_dates)
+        yield from rows
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """The process's parser pool of `workers` processes, created on first use and kept
+
+    Its processes are started by a forkserver (spawned where fork is not
+    available), never forked from the threaded server, and are reused by
+    every later import. The forkserver preloads this module, so workers
+    start without importing it again.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop a broken pool (a worker died), so the next import starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def reset_after_fork():
+    """Forget the parent's pool in a forked worker, its management thread is not copied"""
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+def parse_csv_parallel(blocks, result, workers, date_formats=None):
+    """parse_csv across the process pool, yielding rows in file order
+
+    At most 2 * workers blocks are in flight, so memory stays bounded while
+    the single writer consumes earlier blocks.
+    """
+    fieldnames, chunks = _read_start(blocks, result, date_formats)
+    if not fieldnames:
+        return
+    pool = get_pool(workers)
+    pending = deque()
+
+    def collect():
+        rows, errors, rejected_dates = pending.popleft().result()
+        result.errors.extend(errors)
+        result.rejected_dates.extend(rejected_dates)
+        return rows
+
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(_parse_chunk, fieldnames, chunk, result.date_format))
+            if len(pending) >= 2 * workers:
+                yield from collect()
+        while pending:
+            yield from collect()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        # A failed or abandoned import leaves no work queued for the next one
+        for future in pending:
+            future.cancel()
+
+
+# Streaming statement parsers by file extension, see register_importer
+IMPORTERS = {}
+
+
+def register_importer(*extensions, date_formats=None):
+    """Register a streaming statement parser for file extensions
+
+    The parser is called with the binary upload stream and the ImportResult
+    and yields raw records, dicts of description/amount/category/date
+    strings. Records go through the same validation and batched insert as
+    CSV rows. date_formats narrows date detection for formats that fix it.
+    """
+    def decorator(parse):
+        for extension in extensions:
+            IMPORTERS[extension] = (parse, date_formats)
+        return parse
+    return decorator
+
+
+def supported_extensions():
+    """File extensions accepted by import_file"""
+    return ['.csv'] + sorted(IMPORTERS)
+
+
+def validate_records(records, result, date_formats=None):
+    """Validate raw records from a statement parser into rows for insert_expenses
+
+    The first DETECT_SAMPLE_SIZE records are buffered to detect the date
+    format, the rest are validated as they stream in.
+    """
+    records = iter(records)
+    head = list(islice(records, DETECT_SAMPLE_SIZE))
+    result.date_format = detect_format([(record.get('date') or '').strip() for record in head], date_formats)
+    parse_date = DateParser(result.date_format)
+    today = datetime.now().date().isoformat()
+    for record in chain(head, records):
+        parsed = _validate(record, result.errors, result.rejected_dates, parse_date, today)
+        if parsed is not None:
+            yield parsed
+
+
+def insert_expenses(db, user_id, rows, result):
+    """Bulk insert validated rows, skipping ones already imported
+
+    Duplicates are rejected by the unique (user_id, fingerprint) index via
+    ON CONFLICT DO NOTHING, and archived ones by archived_fingerprint, so
+    dedup costs two index probes per row.
+
+    Rows are committed in batches of IMPORT_BATCH_SIZE, each parsed and
+    prepared before its transaction takes the write lock, so other writers
+    to the file get it between batches. The rows of a batch share one sync
+    version, written with them rather than by the per-row triggers. An
+    import failing part way keeps its committed batches; uploading the file
+    again adds the rest. The caller commits the merchant updates.
+    """
+    cursor = db.cursor()
+    rows = iter(rows)
+    occurrences = {}
+    # Statements repeat a few merchants many times, hash each description once
+    hashes = {}
+
+    while True:
+        batch = []
+        for description, amount, category, date_str in islice(rows, IMPORT_BATCH_SIZE):
+            key = fingerprint_key(date_str, amount, description)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            hash_value = hashes.get(description)
+            if hash_value is None:
+                hash_value = hashes[description] = merchant_hash(description)
+                result.merchants.add(hash_value)
+            batch.append((
+                user_id, description, amount, category, date_str, hash_value,
+                fingerprint(key, occurrence)
+            ))
+        if not batch:
+            break
+
+        version = sync.bump(db, user_id)
+        sync.pause(db, 'import')
+        try:
+            cursor.executemany('''
+                INSERT INTO expense (user_id, description, amount, category, date, merchant_hash, fingerprint,
+                                     version, updated_at)
+                SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, CURRENT_TIMESTAMP
+                WHERE NOT EXISTS (SELECT 1 FROM archived_fingerprint WHERE user_id = ?1 AND fingerprint = ?7)
+                ON CONFLICT (user_id, fingerprint) DO NOTHING
+            ''', [row + (version,) for row in batch])
+            sync.resume(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        result.imported_count += cursor.rowcount
+        result.duplicate_count += len(batch) - cursor.rowcount
+
+    # Re-evaluate recurring series only for merchants in this file
+    for hash_value in result.merchants:
+        update_merchant(db, user_id, hash_value)
+
+
+def import_csv(db, user_id, stream, workers=1, parallel_min_size=PARALLEL_MIN_SIZE, date_formats=None):
+    """Import a CSV stream (binary or text) for a user and commit, returning an ImportResult
+
+    The stream is read in blocks as the rows are inserted. Files of at least
+    parallel_min_size chars are parsed by `workers` processes; smaller files
+    are parsed inline, where pool startup would cost more than it saves.
+    date_formats limits and orders the DATE_FORMATS names tried when
+    detecting the file's date format.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    blocks = read_blocks(stream, PARALLEL_CHUNK_SIZE)
+    head = []
+    size = 0
+    if workers > 1:
+        # Only the first parallel_min_size chars are read ahead to tell the size apart
+        for block in blocks:
+            head.append(block)
+            size += len(block)
+            if size >= parallel_min_size:
+                break
+    if workers > 1 and size >= parallel_min_size:
+        rows = parse_csv_parallel(chain(head, blocks), result, workers, date_formats)
+    else:
+        rows = parse_csv(chain(head, blocks), result, date_formats)
+    insert_expenses(db, user_id, rows, result)
+    db.commit()
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def import_file(db, user_id, filename, stream, workers=1, parallel_min_size=PARALLEL_MIN_SIZE,
+                date_formats=None):
+    """Import an uploaded statement by file extension and commit
+
+    CSV goes through import_csv (chunked, optionally parallel); other
+    formats stream from their registered parser. Raises ValueError for
+    unsupported extensions.
+    """
+    extension = os.path.splitext(filename.lower())[1]
+    if extension == '.csv':
+        return import_csv(db, user_id, stream, workers, parallel_min_size, date_formats)
+
+    if extension not in IMPORTERS:
+        raise ValueError(f"Unsupported file type '{extension}'")
+    parse, format_dates = IMPORTERS[extension]
+    result = ImportResult()
+    started = time.perf_counter()
+    rows = validate_records(parse(stream, result), result, format_dates or date_formats)
+    insert_expenses(db, user_id, rows, result)
+    db.commit()
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# Registers the OFX/QFX, QIF and XLSX parsers
+from finance_app import statements  # noqa: E402,F401
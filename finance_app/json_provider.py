@@ -0,0 +1,95 @@
+# JSON provider - pluggable encoder backend for API responses
+import decimal
+import json
+from itertools import islice
+
+from flask import stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json is the fallback
+    orjson = None
+
+
+# Number of array items encoded per chunk when streaming large lists
+STREAM_BATCH_SIZE = 500
+
+
+def _default(o):
+    """Serialize records via to_dict(), then defer to Flask's defaults.
+
+    orjson encodes the record dataclasses natively and never gets here.
+    """
+    to_dict = getattr(o, 'to_dict', None)
+    if to_dict is not None:
+        return to_dict()
+    if isinstance(o, decimal.Decimal):
+        # Money stays exact: emit the decimal's own digits, never a float
+        return str(o)
+    return DefaultJSONProvider.default(o)
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes Expense/Budget/User records.
+
+    Encoding goes through orjson when it is installed and falls back to the
+    stdlib encoder otherwise. Set ``JSON_BACKEND`` to ``json`` or ``orjson``
+    in the app config to force one. Large lists can be streamed with
+    :meth:`stream_response` instead of being encoded into one string.
+    """
+
+    default = staticmethod(_default)
+
+    def __init__(self, app):
+        super().__init__(app)
+        backend = app.config.get('JSON_BACKEND', 'auto')
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'json'
+        elif backend not in ('json', 'orjson'):
+            raise ValueError(f'Unknown JSON_BACKEND: {backend}')
+        elif backend == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_BACKEND is "orjson" but orjson is not installed')
+        self.backend = backend
+
+    def dumps(self, obj, **kwargs):
+        """Serialize data as JSON to a string"""
+        if self.backend == 'orjson' and not kwargs.get('indent'):
+            # Dates go through default() so both backends emit the same format
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def iter_array(self, items, batch_size=STREAM_BATCH_SIZE):
+        """Yield a JSON array chunk by chunk, encoding batch_size items at a time"""
+        items = iter(items)
+        yield '['
+        first = True
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            encoded = self.dumps(batch, separators=(',', ':'))[1:-1]
+            yield encoded if first else ',' + encoded
+            first = False
+        yield ']'
+
+    def iter_object(self, obj, stream_key):
+        """Yield a JSON object whose stream_key member is an iterable to stream"""
+        rest = {key: value for key, value in obj.items() if key != stream_key}
+        head = self.dumps(rest, separators=(',', ':'))[:-1]
+        yield head + (',' if rest else '') + json.dumps(stream_key) + ':'
+        yield from self.iter_array(obj[stream_key])
+        yield '}'
+
+    def stream_response(self, obj, stream_key, status=200):
+        """Build a streamed JSON response, see iter_object().
+
+        The request context is kept until encoding finishes, so stream_key
+        may iterate over a cursor of the request's connection.
+        """
+        return self._app.response_class(
+            stream_with_context(self.iter_object(obj, stream_key)), status=status, mimetype=self.mimetype
+        )
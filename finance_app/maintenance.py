@@ -0,0 +1,220 @@
+# Database maintenance - planner statistics, WAL checkpoints and paced incremental vacuum
+"""
+Keeps every database file (directory, shards and their archives) tuned:
+
+    checkpoint  every WAL_CHECK_INTERVAL seconds: a WAL over DB_WAL_CHECKPOINT_MB
+                is checkpointed and truncated, smaller ones get a passive checkpoint
+    statistics  every DB_MAINTENANCE_INTERVAL seconds: PRAGMA optimize (plain
+                ANALYZE before SQLite 3.46), bounded by analysis_limit
+    vacuum      with it: free pages are returned to the filesystem with
+                incremental_vacuum, DB_VACUUM_STEP_PAGES at a time
+    tombstones  with it: sync tombstones older than SYNC_TOMBSTONE_DAYS are pruned
+
+Runs in a background thread started by create_app when DB_MAINTENANCE_INTERVAL
+is set, or once from the command line:
+
+    python -m finance_app.maintenance           # every task on every file now
+    python -m finance_app.maintenance vacuum    # one-off VACUUM into auto_vacuum=INCREMENTAL
+
+New database files are created with auto_vacuum=INCREMENTAL; files created
+before need the one-off `vacuum` (which rewrites the file and holds its write
+lock meanwhile) before free pages can be returned.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from finance_app import sync
+from finance_app.database import connect, all_db_paths
+from finance_app.archive import archive_path
+
+# Seconds between WAL size checks of the background thread
+WAL_CHECK_INTERVAL = 60
+# Rows sampled per index by ANALYZE, keeps statistics runs to milliseconds
+ANALYSIS_LIMIT = 1000
+# Pause between incremental_vacuum steps, so writers get the lock in between
+VACUUM_PAUSE = 0.05
+# Lock waits of maintenance statements, shorter than the app's 5s
+BUSY_TIMEOUT_MS = 1000
+# auto_vacuum mode number of INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def maintained_paths():
+    """Every database file, followed by the archives that exist"""
+    paths = all_db_paths()
+    return paths + [archive_path(path) for path in paths if os.path.exists(archive_path(path))]
+
+
+def _connect(path):
+    conn = connect(path)
+    conn.isolation_level = None  # PRAGMAs and VACUUM outside transactions
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def file_stats(conn, path):
+    """Page counts and WAL size of an open database file"""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    wal_path = f'{path}-wal'
+    return {
+        'pages': conn.execute('PRAGMA page_count').fetchone()[0],
+        'free_pages': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        'page_size': page_size,
+        'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+
+
+def format_stats(stats):
+    return (f"{stats['pages']} pages ({stats['pages'] * stats['page_size'] / 1024 / 1024:.1f} MB), "
+            f"{stats['free_pages']} free, WAL {stats['wal_bytes'] / 1024 / 1024:.1f} MB")
+
+
+def checkpoint(conn, path, wal_limit):
+    """Checkpoint a WAL-mode file, truncating the WAL once it has grown past wal_limit bytes
+
+    Returns the checkpoint mode run, None when the file is not in WAL mode.
+    A truncating checkpoint waits up to BUSY_TIMEOUT_MS for readers and
+    otherwise completes as a passive one.
+    """
+    if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+        return None
+    wal_path = f'{path}-wal'
+    size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    mode = 'TRUNCATE' if size >= wal_limit else 'PASSIVE'
+    busy, _, _ = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+    if busy:
+        conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    return mode
+
+
+def update_statistics(conn):
+    """Refresh the query planner's statistics where they are missing or stale"""
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    if sqlite3.sqlite_version_info >= (3, 46, 0):
+        # 0x10002: analyze every table whose size changed enough, not only ones this connection used
+        conn.execute('PRAGMA optimize = 0x10002').fetchall()
+    else:
+        conn.execute('ANALYZE')
+
+
+def incremental_vacuum(conn, step_pages, pause=VACUUM_PAUSE):
+    """Return free pages to the filesystem in steps, returning the number freed"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        return 0
+    freed = 0
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    while free:
+        # execute() would step the pragma once, freeing a single page; a script runs it to the end
+        conn.executescript(f'PRAGMA incremental_vacuum({step_pages})')
+        remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if remaining >= free:
+            break
+        freed += free - remaining
+        free = remaining
+        time.sleep(pause)
+    return freed
+
+
+def prune_tombstones(conn, days):
+    """Prune old sync tombstones of a file that has them, returning the number pruned"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tombstone'").fetchone():
+        return 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        pruned = sync.prune_tombstones(conn, days)
+        conn.execute('COMMIT')
+        return pruned
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def maintain(path, wal_limit, step_pages, tombstone_days=sync.TOMBSTONE_DAYS):
+    """Run every task on one file, returning (stats before, stats after)"""
+    conn = _connect(path)
+    try:
+        before = file_stats(conn, path)
+        prune_tombstones(conn, tombstone_days)
+        update_statistics(conn)
+        incremental_vacuum(conn, step_pages)
+        checkpoint(conn, path, wal_limit)
+        return before, file_stats(conn, path)
+    finally:
+        conn.close()
+
+
+def convert_to_incremental(path):
+    """Switch a file to auto_vacuum=INCREMENTAL with a full VACUUM, returning (before, after)"""
+    conn = _connect(path)
+    try:
+        before = file_stats(conn, path)
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return before, file_stats(conn, path)
+    finally:
+        conn.close()
+
+
+def start_maintenance(app):
+    """Run maintenance every DB_MAINTENANCE_INTERVAL seconds, checking WAL sizes in between
+
+    Like the snapshot refresher, several worker processes may run this loop;
+    a file is only maintained when the stamp file next to it is older than
+    the interval.
+    """
+    interval = app.config['DB_MAINTENANCE_INTERVAL']
+    wal_limit = app.config['DB_WAL_CHECKPOINT_MB'] * 1024 * 1024
+    step_pages = app.config['DB_VACUUM_STEP_PAGES']
+    tombstone_days = app.config['SYNC_TOMBSTONE_DAYS']
+
+    def maintenance_loop():
+        while True:
+            with app.app_context():
+                paths = maintained_paths()
+            for path in paths:
+                stamp = f'{path}.maintained'
+                try:
+                    if not os.path.exists(stamp) or time.time() - os.path.getmtime(stamp) >= interval:
+                        with open(stamp, 'a'):
+                            os.utime(stamp)
+                        before, after = maintain(path, wal_limit, step_pages, tombstone_days)
+                        app.logger.info('Maintained %s: %s -> %s', path, format_stats(before), format_stats(after))
+                    else:
+                        conn = _connect(path)
+                        try:
+                            if checkpoint(conn, path, wal_limit) == 'TRUNCATE':
+                                app.logger.info('Truncated the WAL of %s', path)
+                        finally:
+                            conn.close()
+                except Exception:
+                    app.logger.exception('Database maintenance of %s failed', path)
+            time.sleep(min(interval, WAL_CHECK_INTERVAL))
+
+    thread = threading.Thread(target=maintenance_loop, name='db-maintenance', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv):
+    from finance_app import create_app
+    app = create_app()
+    with app.app_context():
+        command = argv[0] if argv else 'run'
+        if command not in ('run', 'vacuum'):
+            raise SystemExit(__doc__)
+        for path in maintained_paths():
+            if command == 'vacuum':
+                before, after = convert_to_incremental(path)
+            else:
+                before, after = maintain(path, app.config['DB_WAL_CHECKPOINT_MB'] * 1024 * 1024,
+                                         app.config['DB_VACUUM_STEP_PAGES'], app.config['SYNC_TOMBSTONE_DAYS'])
+            print(path)
+            print(f'  before  {format_stats(before)}')
+            print(f'  after   {format_stats(after)}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,281 @@
+# Schema migrations - ordered, versioned with PRAGMA user_version
+
+
+def _base_schema(cursor):
+    """Users, expenses and budgets with their lookup indexes"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expense (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS budget (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            month INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, category, month, year),
+            FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_user_id ON expense(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_date ON expense(date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_category ON expense(category)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_budget_user_id ON budget(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_budget_month_year ON budget(month, year)')
+
+
+def _columns(cursor, table):
+    return {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+
+
+def _recurring(cursor):
+    """Recurring series table and the merchant hash it is keyed by"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recurring (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            merchant_hash INTEGER NOT NULL,
+            merchant TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            period_days INTEGER NOT NULL,
+            occurrences INTEGER NOT NULL,
+            first_date DATE NOT NULL,
+            last_date DATE NOT NULL,
+            next_date DATE NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
+        )
+    ''')
+    if 'merchant_hash' not in _columns(cursor, 'expense'):
+        cursor.execute('ALTER TABLE expense ADD COLUMN merchant_hash INTEGER')
+    from finance_app.recurring import backfill_merchant_hashes
+    backfill_merchant_hashes(cursor.connection)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_user_merchant ON expense(user_id, merchant_hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recurring_user_merchant ON recurring(user_id, merchant_hash)')
+
+
+def _import_fingerprints(cursor):
+    """Content hash of imported rows, NULL for expenses entered by hand"""
+    if 'fingerprint' not in _columns(cursor, 'expense'):
+        cursor.execute('ALTER TABLE expense ADD COLUMN fingerprint TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_expense_user_fingerprint ON expense(user_id, fingerprint)')
+
+
+def _user_shards(cursor):
+    """Shard file holding each user's data, NULL until sharding places the user"""
+    if 'shard' not in _columns(cursor, 'user'):
+        cursor.execute('ALTER TABLE user ADD COLUMN shard INTEGER')
+
+
+def _archive_rollups(cursor):
+    """Totals and import fingerprints left behind by expenses moved to the archive"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expense_rollup (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month, category)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_fingerprint (
+            user_id INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            PRIMARY KEY (user_id, fingerprint)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _sync_versions(cursor):
+    """Per-user change versions, row versions and tombstones kept by triggers (see sync.py)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            reset_version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tombstone (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, kind, row_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tombstone_user_version ON tombstone(user_id, version)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS sync_pause (reason TEXT)')
+
+    # Existing rows are all version 1, so a first sync from 0 returns them
+    if 'version' not in _columns(cursor, 'expense'):
+        cursor.execute('ALTER TABLE expense ADD COLUMN version INTEGER')
+        cursor.execute('ALTER TABLE expense ADD COLUMN updated_at TIMESTAMP')
+        cursor.execute('UPDATE expense SET version = 1, updated_at = created_at')
+    if 'version' not in _columns(cursor, 'budget'):
+        cursor.execute('ALTER TABLE budget ADD COLUMN version INTEGER')
+        cursor.execute('UPDATE budget SET version = 1')
+    cursor.execute('''
+        INSERT OR IGNORE INTO sync_state (user_id, version)
+        SELECT user_id, 1 FROM expense UNION SELECT user_id, 1 FROM budget
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_user_version ON expense(user_id, version)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_budget_user_version ON budget(user_id, version)')
+
+    # Changes to the synced columns stamp the row with the user's next version;
+    # the stamping UPDATE does not touch them, so it does not fire again
+    for table, columns in (('expense', 'description, amount, category, date'),
+                           ('budget', 'category, amount, month, year')):
+        bump = '''
+            INSERT INTO sync_state (user_id, version) VALUES ({row}.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        '''
+        stamp = f'''
+            UPDATE {table}
+            SET version = (SELECT version FROM sync_state WHERE user_id = NEW.user_id),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_sync_insert AFTER INSERT ON {table}
+            WHEN NOT EXISTS (SELECT 1 FROM sync_pause)
+            BEGIN {bump.format(row='NEW')} {stamp} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_sync_update AFTER UPDATE OF {columns} ON {table}
+            WHEN NOT EXISTS (SELECT 1 FROM sync_pause)
+            BEGIN {bump.format(row='NEW')} {stamp} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_sync_delete AFTER DELETE ON {table}
+            WHEN NOT EXISTS (SELECT 1 FROM sync_pause)
+            BEGIN {bump.format(row='OLD')}
+                INSERT OR REPLACE INTO tombstone (user_id, kind, row_id, version)
+                VALUES (OLD.user_id, '{table}', OLD.id,
+                        (SELECT version FROM sync_state WHERE user_id = OLD.user_id));
+            END
+        ''')
+
+
+def _budget_alerts(cursor):
+    """Stored budget alerts of the nightly evaluation (see alerts.py)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            budget REAL NOT NULL,
+            spent REAL NOT NULL,
+            PRIMARY KEY (user_id, category)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_state (
+            user_id INTEGER PRIMARY KEY,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            evaluated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _event_log(cursor):
+    """Live-update events shared by all worker processes (see events.py)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_log_user_version ON event_log(user_id, version)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_listener (
+            user_id INTEGER PRIMARY KEY,
+            seen_at REAL NOT NULL
+        )
+    ''')
+
+
+# Applied in order; the schema version is the number applied. Append only.
+# Steps are idempotent, so databases created before versioning (user_version
+# 0 with tables present) are brought up to date by the same path.
+MIGRATIONS = [
+    _base_schema,
+    _recurring,
+    _import_fingerprints,
+    _user_shards,
+    _archive_rollups,
+    _sync_versions,
+    _budget_alerts,
+    _event_log,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations, returning the number applied
+
+    A current database costs a single PRAGMA read. Otherwise each migration
+    runs in its own IMMEDIATE transaction together with the version bump,
+    so workers starting at once apply it exactly once.
+    """
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return 0
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # explicit transactions below
+    applied = 0
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # Re-read under the write lock, another process may have migrated
+                version = schema_version(conn)
+                if version >= SCHEMA_VERSION:
+                    cursor.execute('COMMIT')
+                    break
+                MIGRATIONS[version](cursor)
+                cursor.execute(f'PRAGMA user_version = {version + 1}')
+                cursor.execute('COMMIT')
+                applied += 1
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
@@ -1,78 +1,168 @@
 # database tables - User class for Flask-Login compatibility
+from dataclasses import dataclass
 from flask_login import UserMixin
-from finance_app.database import get_db
+from finance_app.database import get_directory_db, shard_count, default_shard
+
+
+class Record:
+    """Compact row object built from a sqlite3.Row.
+
+    Subclasses are ``@dataclass(slots=True)`` so a record costs a fixed
+    number of pointers instead of a per-row ``__dict__``. Records still
+    support ``record['column']`` so helpers written against ``dict(row)``
+    keep working, and ``to_dict()`` is what the JSON provider serializes.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a record from a sqlite3.Row, ignoring unknown columns"""
+        if row is None:
+            return None
+        try:
+            return cls(*[row[name] for name in cls.__slots__])
+        except IndexError:
+            # Partial SELECT: leave the missing columns as None
+            keys = row.keys()
+            return cls(**{name: row[name] for name in cls.__slots__ if name in keys})
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build records for every row of a result set"""
+        return [cls.from_row(row) for row in rows]
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        """Return the record as a plain dict for JSON serialization"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass(slots=True)
+class Expense(Record):
+    """Row of the expense table"""
+
+    id: int = None
+    user_id: int = None
+    description: str = None
+    amount: float = None
+    category: str = None
+    date: str = None
+    created_at: str = None
+    updated_at: str = None
+    version: int = None
+
+
+@dataclass(slots=True)
+class Budget(Record):
+    """Row of the budget table"""
+
+    id: int = None
+    user_id: int = None
+    category: str = None
+    amount: float = None
+    month: int = None
+    year: int = None
+    created_at: str = None
+    updated_at: str = None
+    version: int = None
+
+
+@dataclass(slots=True)
+class Recurring(Record):
+    """Row of the recurring table"""
+
+    id: int = None
+    user_id: int = None
+    merchant: str = None
+    category: str = None
+    amount: float = None
+    period_days: int = None
+    occurrences: int = None
+    first_date: str = None
+    last_date: str = None
+    next_date: str = None
 
 
 class User(UserMixin):
     """User class for Flask-Login compatibility with standard SQL"""
     
-    def __init__(self, id, username, email, password_hash, created_at=None):
+    __slots__ = ('id', 'username', 'email', 'password_hash', 'created_at', 'shard')
+    
+    def __init__(self, id, username, email, password_hash, created_at=None, shard=None):
         self.id = id
         self.username = username
         self.email = email
         self.password_hash = password_hash
         self.created_at = created_at
+        self.shard = shard
+    
+    @classmethod
+    def from_row(cls, row):
+        """Build a user from a sqlite3.Row"""
+        if row is None:
+            return None
+        return cls(
+            id=row['id'],
+            username=row['username'],
+            email=row['email'],
+            password_hash=row['password_hash'],
+            created_at=row['created_at'],
+            shard=row['shard']
+        )
+    
+    def to_dict(self):
+        """Public user fields for API responses (never the password hash)"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email
+        }
     
     @staticmethod
     def get(user_id):
         """Get user by ID"""
-        db = get_db()
+        db = get_directory_db()
         cursor = db.cursor()
         cursor.execute('SELECT * FROM user WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
-        if row:
-            return User(
-                id=row['id'],
-                username=row['username'],
-                email=row['email'],
-                password_hash=row['password_hash'],
-                created_at=row['created_at']
-            )
-        return None
+        return User.from_row(cursor.fetchone())
     
     @staticmethod
     def get_by_username(username):
         """Get user by username"""
-        db = get_db()
+        db = get_directory_db()
         cursor = db.cursor()
         cursor.execute('SELECT * FROM user WHERE username = ?', (username,))
-        row = cursor.fetchone()
-        if row:
-            return User(
-                id=row['id'],
-                username=row['username'],
-                email=row['email'],
-                password_hash=row['password_hash'],
-                created_at=row['created_at']
-            )
-        return None
+        return User.from_row(cursor.fetchone())
     
     @staticmethod
     def get_by_email(email):
         """Get user by email"""
-        db = get_db()
+        db = get_directory_db()
         cursor = db.cursor()
         cursor.execute('SELECT * FROM user WHERE email = ?', (email,))
-        row = cursor.fetchone()
-        if row:
-            return User(
-                id=row['id'],
-                username=row['username'],
-                email=row['email'],
-                password_hash=row['password_hash'],
-                created_at=row['created_at']
-            )
-        return None
+        return User.from_row(cursor.fetchone())
     
     @staticmethod
     def create(username, email, password_hash):
         """Create a new user"""
-        db = get_db()
+        db = get_directory_db()
         cursor = db.cursor()
         cursor.execute(
             'INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)',
             (username, email, password_hash)
         )
-        db.commit()
         user_id = cursor.lastrowid
+        if shard_count():
+            # Pinned, so adding shards later does not move existing users
+            cursor.execute('UPDATE user SET shard = ? WHERE id = ?', (default_shard(user_id), user_id))
+        db.commit()
         return User.get(user_id)
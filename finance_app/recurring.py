@@ -0,0 +1,135 @@
+# Recurring transactions - subscription/rent detection keyed by merchant hash
+import hashlib
+import re
+from collections import defaultdict
+from datetime import date, timedelta
+from statistics import median
+
+
+# Charges within this relative distance of each other belong to one series
+AMOUNT_TOLERANCE = 0.10
+# Charges needed before a series counts as recurring
+MIN_OCCURRENCES = 3
+# Allowed deviation of an interval from the series' median interval
+INTERVAL_TOLERANCE = 0.25
+MIN_PERIOD_DAYS = 5
+
+_NOISE_TOKENS = {'www', 'com', 'net', 'inc', 'llc', 'ltd', 'co', 'pos', 'ach'}
+
+
+def normalize_merchant(description):
+    """Reduce a bank description to a stable merchant name
+
+    'NETFLIX.COM 8842' and 'Netflix.com' both become 'netflix'.
+    """
+    words = re.sub(r'[^a-z]+', ' ', description.lower()).split()
+    return ' '.join(word for word in words if word not in _NOISE_TOKENS)
+
+
+def merchant_hash(description):
+    """Signed 64-bit hash of the normalized merchant, stored on expense rows"""
+    digest = hashlib.blake2b(normalize_merchant(description).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _amount_clusters(charges):
+    """Split (date, amount, ...) charges into groups of similar amounts"""
+    clusters = []
+    for charge in sorted(charges, key=lambda c: c[1]):
+        if clusters and charge[1] <= clusters[-1][0][1] * (1 + AMOUNT_TOLERANCE) + 0.01:
+            clusters[-1].append(charge)
+        else:
+            clusters.append([charge])
+    return clusters
+
+
+def find_series(charges):
+    """Return the periodic series among one merchant's charges
+
+    charges are (date, amount, category, description) tuples with ISO
+    dates. Each result is a dict ready for the recurring table.
+    """
+    series = []
+    for cluster in _amount_clusters(charges):
+        if len(cluster) < MIN_OCCURRENCES:
+            continue
+        cluster.sort(key=lambda c: c[0])
+        try:
+            days = sorted({date.fromisoformat(c[0]) for c in cluster})
+        except ValueError:
+            continue
+        intervals = [(b - a).days for a, b in zip(days, days[1:])]
+        if len(intervals) < MIN_OCCURRENCES - 1:
+            continue
+        period = median(intervals)
+        if period < MIN_PERIOD_DAYS:
+            continue
+        regular = sum(abs(i - period) <= max(period * INTERVAL_TOLERANCE, 2) for i in intervals)
+        if regular < len(intervals) * 0.8:
+            continue
+        last = cluster[-1]
+        series.append({
+            'description': last[3],
+            'category': last[2],
+            'amount': round(median(c[1] for c in cluster), 2),
+            'period_days': int(round(period)),
+            'occurrences': len(days),
+            'first_date': days[0].isoformat(),
+            'last_date': days[-1].isoformat(),
+            'next_date': (days[-1] + timedelta(days=int(round(period)))).isoformat(),
+        })
+    return series
+
+
+def _store(cursor, user_id, hash_value, series):
+    cursor.executemany('''
+        INSERT INTO recurring (user_id, merchant_hash, merchant, category, amount, period_days,
+                               occurrences, first_date, last_date, next_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (user_id, hash_value, normalize_merchant(s['description']), s['category'], s['amount'],
+         s['period_days'], s['occurrences'], s['first_date'], s['last_date'], s['next_date'])
+        for s in series
+    ])
+
+
+def detect_recurring(db, user_id):
+    """Rebuild a user's recurring series from one pass over their expenses"""
+    cursor = db.cursor()
+    cursor.execute('SELECT description, amount, category, date FROM expense WHERE user_id = ?', (user_id,))
+    by_merchant = defaultdict(list)
+    for description, amount, category, day in cursor:
+        by_merchant[merchant_hash(description)].append((day, amount, category, description))
+
+    cursor.execute('DELETE FROM recurring WHERE user_id = ?', (user_id,))
+    found = 0
+    for hash_value, charges in by_merchant.items():
+        if len(charges) >= MIN_OCCURRENCES:
+            series = find_series(charges)
+            _store(cursor, user_id, hash_value, series)
+            found += len(series)
+    db.commit()
+    return found
+
+
+def update_merchant(db, user_id, hash_value):
+    """Re-evaluate one merchant after an expense insert/update/delete
+
+    Reads only that merchant's charges through idx_expense_user_merchant.
+    Does not commit, callers commit together with their own write.
+    """
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT date, amount, category, description FROM expense
+        WHERE user_id = ? AND merchant_hash = ?
+    ''', (user_id, hash_value))
+    charges = [tuple(row) for row in cursor.fetchall()]
+    cursor.execute('DELETE FROM recurring WHERE user_id = ? AND merchant_hash = ?', (user_id, hash_value))
+    if len(charges) >= MIN_OCCURRENCES:
+        _store(cursor, user_id, hash_value, find_series(charges))
+
+
+def backfill_merchant_hashes(conn):
+    """Fill merchant_hash for rows from before the column existed (run by a migration)"""
+    conn.create_function('merchant_hash', 1, merchant_hash, deterministic=True)
+    conn.execute('UPDATE expense SET merchant_hash = merchant_hash(description) WHERE merchant_hash IS NULL')
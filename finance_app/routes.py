@@ -3,6 +3,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from finance_app import alerts
 from finance_app.database import get_db
 from finance_app.models import User
 from finance_app.forms import LoginForm, RegisterForm, ExpenseForm, BudgetForm, UploadForm
@@ -127,21 +128,8 @@ def dashboard():
     budgets_rows = cursor.fetchall()
     budgets = [dict(row) for row in budgets_rows]
     
-    budget_alerts = []
-    for budget in budgets:
-        budget_amount, spent, remaining, percentage, is_over, is_warning = get_budget_status(
-            current_user.id, budget['category'], current_month, current_year
-        )
-        if budget_amount is not None and (is_over or is_warning):
-            budget_alerts.append({
-                'category': budget['category'],
-                'budget': budget_amount,
-                'spent': spent,
-                'remaining': remaining,
-                'percentage': percentage,
-                'is_over': is_over,
-                'is_warning': is_warning
-            })
+    # Stored by the nightly evaluation, evaluated now if anything changed since
+    budget_alerts = alerts.for_user(db, current_user.id, today)
     
     # Get intelligent insights
     insights = []
@@ -0,0 +1,140 @@
+# Production server - gunicorn (preforking) or waitress, sized from the host
+"""
+Run the app with a production WSGI server:
+
+    python -m finance_app.server           # gunicorn, or waitress where gunicorn is unavailable
+    python -m finance_app.server reload    # zero-downtime code reload of a running gunicorn
+    gunicorn app:app                       # same settings, read from gunicorn.conf.py
+
+Sizing is taken from WEB_CONCURRENCY (processes) and WEB_THREADS (threads per
+process) when set; benchmarks/load_test.py compares candidate values.
+"""
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+# Requests mostly wait on SQLite or the network, so each process runs several
+# threads per CPU (at least MIN_THREADS); /api/events polls end right away
+THREADS_PER_CPU = 2
+MIN_THREADS = 4
+# SQLite has a single writer and every process keeps its own analytics cache;
+# beyond this many processes extra workers only add memory and lock contention
+MAX_WORKERS = 8
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONFIG = os.path.join(ROOT, 'gunicorn.conf.py')
+
+
+def worker_count():
+    """WEB_CONCURRENCY, or (2 x CPUs) + 1 capped at MAX_WORKERS"""
+    if os.environ.get('WEB_CONCURRENCY'):
+        return max(1, int(os.environ['WEB_CONCURRENCY']))
+    return min(2 * (os.cpu_count() or 1) + 1, MAX_WORKERS)
+
+
+def thread_count():
+    """WEB_THREADS, or THREADS_PER_CPU x CPUs and at least MIN_THREADS"""
+    if os.environ.get('WEB_THREADS'):
+        return max(1, int(os.environ['WEB_THREADS']))
+    return max(MIN_THREADS, THREADS_PER_CPU * (os.cpu_count() or 1))
+
+
+def bind_address():
+    """BIND, or HOST:PORT (127.0.0.1:8000 by default)"""
+    return os.environ.get('BIND') or f"{os.environ.get('HOST', '127.0.0.1')}:{os.environ.get('PORT', 8000)}"
+
+
+def pidfile():
+    return os.environ.get('PIDFILE', os.path.join(tempfile.gettempdir(), 'mybudgethub-gunicorn.pid'))
+
+
+def reset_process_state():
+    """Drop per-process state a worker inherited from the preloaded master
+
+    SQLite connections must not cross fork(), so each worker starts with
+    empty connection pools and starts its own group-commit writers and import
+    parser pool. The analytics cache is a module global guarded by a lock; a
+    lock held by a master thread when the worker forks would never be
+    released in the child. The snapshot refresher thread is not copied by
+    fork, so with a preloaded app it runs once, in the master.
+    """
+    from finance_app import analytics, database, group_commit, importer
+    database.reset_after_fork()
+    group_commit.reset_after_fork()
+    importer.reset_after_fork()
+    analytics.reset_after_fork()
+
+
+def post_fork(server, worker):
+    """gunicorn hook, runs in each worker right after it is forked"""
+    reset_process_state()
+
+
+def run_gunicorn():
+    """Replace this process with gunicorn using gunicorn.conf.py
+
+    gunicorn re-executes its own command line on USR2, so it is started
+    through its console script rather than embedded in this module
+    (``python -m gunicorn`` would re-execute as a bare script path).
+    """
+    script = shutil.which('gunicorn', path=os.path.dirname(sys.executable)) or shutil.which('gunicorn')
+    if script is None:
+        raise RuntimeError('gunicorn is installed but its console script is not on PATH')
+    os.execv(script, [script, '--config', GUNICORN_CONFIG, 'app:app'])
+
+
+def run_waitress():
+    """Serve with waitress: one process, all threads in it (Windows, or no gunicorn)"""
+    from waitress import serve
+    from app import app
+    host, _, port = bind_address().rpartition(':')
+    serve(app, host=host, port=int(port), threads=worker_count() * thread_count(),
+          # Idle keep-alive connections, including event streams between messages
+          channel_timeout=120)
+
+
+def reload(timeout=60):
+    """Load new code into a running gunicorn without dropping connections
+
+    HUP restarts workers but, with preload_app, keeps the master's copy of
+    the code. USR2 starts a second master from the current code on the same
+    socket and writes its pid to '<pidfile>.2'; the old master is then
+    stopped with TERM, which lets its workers finish in-flight requests.
+    """
+    path = pidfile()
+    with open(path) as f:
+        old_pid = int(f.read().strip())
+    os.kill(old_pid, signal.SIGUSR2)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        try:
+            with open(f'{path}.2') as f:
+                new_pid = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            continue
+        if new_pid and new_pid != old_pid:
+            os.kill(old_pid, signal.SIGTERM)
+            return new_pid
+    raise RuntimeError(f'New master did not start within {timeout}s; old master {old_pid} left running')
+
+
+def main(argv):
+    if argv[:1] == ['reload']:
+        print(f'Reloaded, master pid {reload()}')
+        return
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+    if gunicorn is None or os.name == 'nt':
+        run_waitress()
+    else:
+        run_gunicorn()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,230 @@
+# Shard maintenance - move users between shard files and rebalance them
+"""
+Operator tool for DB_SHARDS (run from the app's directory, with its environment):
+
+    python -m finance_app.shards status              # users, rows and size per shard
+    python -m finance_app.shards split               # move data out of DATABASE_URL into the shards
+    python -m finance_app.shards move USER_ID SHARD  # move one user
+    python -m finance_app.shards rebalance [--dry-run]
+
+Moving a user locks writes to the shard being emptied for the duration, so
+run moves while the user is inactive (or the app is stopped). Rows get new
+ids in the target shard, so the user's sync clients are sent to a full sync.
+"""
+import os
+import sys
+
+from finance_app import sync
+from finance_app.archive import archive_path, copy_archived, delete_archived
+from finance_app.database import connect, get_db_path, get_shard_path, shard_count, default_shard
+
+# Rebalancing stops once the largest shard is within this fraction of the smallest
+REBALANCE_TOLERANCE = 0.10
+# Sync bookkeeping is carried over by move_user itself, not copied row by row
+SYNC_TABLES = ('sync_state', 'tombstone')
+# Stored alerts are evaluated again in the target (live until the next nightly run);
+# pending live-update events are dropped, the user's dashboards reload instead
+DERIVED_TABLES = ('alert', 'alert_state', 'event_log', 'event_listener')
+
+
+def user_tables(conn):
+    """Tables with per-user rows, i.e. a user_id column"""
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    return [table for table in tables
+            if any(column[1] == 'user_id' for column in conn.execute(f'PRAGMA table_info({table})'))]
+
+
+def _columns(conn, table):
+    """Columns copied by a move, all but an INTEGER PRIMARY KEY row id"""
+    columns = conn.execute(f'PRAGMA table_info({table})').fetchall()
+    keys = [column for column in columns if column[5]]
+    row_id = keys[0][1] if len(keys) == 1 and keys[0][2].upper() == 'INTEGER' else None
+    return [column[1] for column in columns if column[1] != row_id]
+
+
+def assignments(directory):
+    """{user_id: shard} for every user in the directory"""
+    return {row['id']: default_shard(row['id']) if row['shard'] is None else row['shard']
+            for row in directory.execute('SELECT id, shard FROM user')}
+
+
+def expense_counts(path):
+    """{user_id: expense rows} stored in one file"""
+    conn = connect(path, readonly=True)
+    try:
+        return dict(conn.execute('SELECT user_id, COUNT(*) FROM expense GROUP BY user_id').fetchall())
+    finally:
+        conn.close()
+
+
+def move_user(user_id, source_path, target_path, target_shard):
+    """Copy a user's rows to another file, repoint the directory, then delete the originals
+
+    The source stays write-locked (BEGIN IMMEDIATE) from before the copy
+    until the delete commits, so no write of the user's is lost. The copy
+    first clears the user's rows in the target, so a move interrupted at any
+    point is completed by running it again. Archived expenses are copied
+    to the target's archive alongside.
+    """
+    source_archive = archive_path(source_path)
+    source = connect(source_path)
+    source.isolation_level = None
+    source.execute('BEGIN IMMEDIATE')
+    try:
+        if os.path.exists(source_archive):
+            copy_archived(user_id, source_archive, target_path)
+        target = connect(target_path)
+        try:
+            target.execute('ATTACH DATABASE ? AS source', (os.path.abspath(source_path),))
+            with target:
+                sync.pause(target, 'shard move')
+                for table in user_tables(target):
+                    target.execute(f'DELETE FROM main.{table} WHERE user_id = ?', (user_id,))
+                    if table in SYNC_TABLES or table in DERIVED_TABLES:
+                        continue
+                    columns = ', '.join(_columns(target, table))
+                    target.execute(f'INSERT INTO main.{table} ({columns}) '
+                                   f'SELECT {columns} FROM source.{table} WHERE user_id = ?', (user_id,))
+                # Versions continue from the source's, past every version a client has seen there
+                target.execute('INSERT INTO main.sync_state SELECT * FROM source.sync_state WHERE user_id = ?',
+                               (user_id,))
+                sync.force_full_sync(target, user_id)
+                sync.resume(target)
+            target.execute('DETACH DATABASE source')
+        finally:
+            target.close()
+
+        # The directory may be the (write-locked) source itself, during a split
+        directory = source if os.path.abspath(source_path) == os.path.abspath(get_db_path()) else connect(get_db_path())
+        try:
+            directory.execute('UPDATE user SET shard = ? WHERE id = ?', (target_shard, user_id))
+            if directory is not source:
+                directory.commit()
+        finally:
+            if directory is not source:
+                directory.close()
+
+        sync.pause(source, 'shard move')
+        for table in user_tables(source):
+            source.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+        sync.resume(source)
+        source.execute('COMMIT')
+        if os.path.exists(source_archive):
+            delete_archived(user_id, source_archive)
+    except Exception:
+        if source.in_transaction:
+            source.execute('ROLLBACK')
+        raise
+    finally:
+        source.close()
+
+
+def status():
+    directory = connect(get_db_path(), readonly=True)
+    try:
+        shards = assignments(directory)
+    finally:
+        directory.close()
+    unsplit = sum(expense_counts(get_db_path()).values())
+    print(f'{len(shards)} users on {shard_count()} shards'
+          + (f'; {unsplit} expenses still in {get_db_path()} (run split)' if unsplit else ''))
+    for shard in range(shard_count()):
+        path = get_shard_path(shard)
+        users = sum(1 for value in shards.values() if value == shard)
+        rows = sum(expense_counts(path).values())
+        print(f'  shard {shard}  {users:6} users  {rows:9} expenses  {os.path.getsize(path) / 1024 / 1024:8.1f} MB  {path}')
+
+
+def split():
+    """Move every user with rows in the unsharded database onto their shard"""
+    directory = connect(get_db_path(), readonly=True)
+    try:
+        shards = assignments(directory)
+    finally:
+        directory.close()
+    for user_id in expense_counts(get_db_path()):
+        if user_id in shards:
+            move_user(user_id, get_db_path(), get_shard_path(shards[user_id]), shards[user_id])
+            print(f'  user {user_id} -> shard {shards[user_id]}')
+
+
+def move(user_id, shard):
+    if not 0 <= shard < shard_count():
+        raise ValueError(f'Shard must be between 0 and {shard_count() - 1}')
+    directory = connect(get_db_path(), readonly=True)
+    try:
+        current = assignments(directory).get(user_id)
+    finally:
+        directory.close()
+    if current is None:
+        raise ValueError(f'No user {user_id}')
+    if current != shard:
+        move_user(user_id, get_shard_path(current), get_shard_path(shard), shard)
+
+
+def plan_rebalance(sizes):
+    """Moves (user_id, from_shard, to_shard) that even out expense rows per shard
+
+    sizes is {shard: {user_id: rows}}. Greedily moves the user from the
+    largest shard that best halves its gap to the smallest one, until the
+    gap is within REBALANCE_TOLERANCE or no single move narrows it.
+    """
+    sizes = {shard: dict(users) for shard, users in sizes.items()}
+    moves = []
+    while True:
+        totals = {shard: sum(users.values()) for shard, users in sizes.items()}
+        largest = max(totals, key=totals.get)
+        smallest = min(totals, key=totals.get)
+        gap = totals[largest] - totals[smallest]
+        if gap <= REBALANCE_TOLERANCE * max(totals[largest], 1):
+            return moves
+        # Moving r rows leaves a gap of |gap - 2r|; it only helps while r < gap
+        candidates = [(abs(gap - 2 * rows), user_id) for user_id, rows in sizes[largest].items() if 0 < rows < gap]
+        if not candidates:
+            return moves
+        _, user_id = min(candidates)
+        sizes[smallest][user_id] = sizes[largest].pop(user_id)
+        moves.append((user_id, largest, smallest))
+
+
+def rebalance(dry_run=False):
+    directory = connect(get_db_path(), readonly=True)
+    try:
+        shards = assignments(directory)
+    finally:
+        directory.close()
+    sizes = {shard: {} for shard in range(shard_count())}
+    for shard in sizes:
+        for user_id, rows in expense_counts(get_shard_path(shard)).items():
+            if shards.get(user_id) == shard:
+                sizes[shard][user_id] = rows
+    for user_id, source, target in plan_rebalance(sizes):
+        print(f'  user {user_id}: shard {source} -> {target} ({sizes[source][user_id]} expenses)')
+        if not dry_run:
+            move_user(user_id, get_shard_path(source), get_shard_path(target), target)
+
+
+def main(argv):
+    from finance_app import create_app
+    # create_app creates missing shard files and brings every schema up to date
+    app = create_app()
+    with app.app_context():
+        if not shard_count():
+            raise SystemExit('DB_SHARDS is not set')
+        command = argv[0] if argv else 'status'
+        if command == 'status':
+            status()
+        elif command == 'split':
+            split()
+        elif command == 'move' and len(argv) == 3:
+            move(int(argv[1]), int(argv[2]))
+        elif command == 'rebalance':
+            rebalance(dry_run='--dry-run' in argv)
+        else:
+            raise SystemExit(__doc__)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,229 @@
+# Statement formats - streaming OFX/QFX, QIF and XLSX parsers for the importer
+import html
+import io
+import re
+import zipfile
+from datetime import date, timedelta
+from xml.etree.ElementTree import iterparse
+
+from finance_app.importer import register_importer
+
+
+# Characters of OFX read per chunk
+OFX_READ_SIZE = 64 * 1024
+
+_OFX_TOKEN = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+# QIF sections holding transactions (!Type:Bank etc.); others (!Account, !Type:Cat) are skipped
+QIF_TRANSACTION_TYPES = {'bank', 'cash', 'ccard', 'oth a', 'oth l'}
+
+# Excel serial day 0 (with the 1900 leap-year bug folded in)
+EXCEL_EPOCH = date(1899, 12, 30)
+# Serials beyond 9999-12-31 are not dates (e.g. 20241015 is a YYYYMMDD string)
+EXCEL_MAX_SERIAL = 2958465
+
+
+def _debit(amount, result):
+    """Expense amount for a signed statement amount, None for credits
+
+    Statements record spending as negative amounts; deposits and refunds
+    are counted in result.skipped_count. Unparseable amounts are passed
+    through for validation to report.
+    """
+    amount = amount.replace(',', '').strip()
+    try:
+        value = float(amount)
+    except ValueError:
+        return amount
+    if value >= 0:
+        result.skipped_count += 1
+        return None
+    return amount[1:] if amount.startswith('-') else str(-value)
+
+
+@register_importer('.ofx', '.qfx', date_formats=['compact'])
+def parse_ofx(stream, result):
+    """Yield debits from OFX/QFX <STMTTRN> blocks, SGML (1.x) or XML (2.x)
+
+    The file is tokenized in OFX_READ_SIZE chunks; leaf elements in 1.x
+    have no closing tags, so values run up to the next '<'.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace', newline='')
+    transaction = None
+    tail = ''
+    while True:
+        chunk = text.read(OFX_READ_SIZE)
+        buffer = tail + chunk
+        tail = ''
+        if chunk:
+            # The last tag's value may continue in the next chunk
+            cut = buffer.rfind('<')
+            buffer, tail = (buffer[:cut], buffer[cut:]) if cut != -1 else ('', buffer)
+        for closing, tag, value in _OFX_TOKEN.findall(buffer):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    transaction = {}
+                elif transaction is not None:
+                    record = _ofx_record(transaction, result)
+                    if record is not None:
+                        yield record
+                    transaction = None
+            elif transaction is not None and not closing:
+                transaction[tag] = html.unescape(value.strip())
+        if not chunk:
+            break
+
+
+def _ofx_record(transaction, result):
+    amount = _debit(transaction.get('TRNAMT', ''), result)
+    if amount is None:
+        return None
+    return {
+        'description': transaction.get('NAME') or transaction.get('PAYEE') or transaction.get('MEMO', ''),
+        'amount': amount,
+        'category': '',
+        # DTPOSTED is YYYYMMDD[HHMMSS[.XXX][TZ]]
+        'date': transaction.get('DTPOSTED', '')[:8],
+    }
+
+
+@register_importer('.qif')
+def parse_qif(stream, result):
+    """Yield debits from the transaction sections of a QIF file, line by line"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+    in_transactions = False
+    fields = {}
+    for line in text:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        code, value = line[0], line[1:].strip()
+        if code == '!':
+            header = value.lower()
+            if header.startswith('type:'):
+                in_transactions = header[5:].strip() in QIF_TRANSACTION_TYPES
+            elif header.startswith('account'):
+                in_transactions = False
+            # !Option and !Clear lines leave the section unchanged
+        elif code == '^':
+            if in_transactions and fields:
+                record = _qif_record(fields, result)
+                if record is not None:
+                    yield record
+            fields = {}
+        elif code in 'DTUPML':
+            # Split lines (S, $) repeat codes; the first value is the transaction's
+            fields.setdefault(code, value)
+
+
+def _qif_record(fields, result):
+    amount = _debit(fields.get('T') or fields.get('U', ''), result)
+    if amount is None:
+        return None
+    # Categories are 'Food:Groceries'; '[Account]' marks a transfer
+    category = fields.get('L', '')
+    category = '' if category.startswith('[') else category.split(':')[0].strip()
+    # Quicken writes 1/ 5'24 for 01/05/2024
+    day = fields.get('D', '').replace("'", '/').replace(' ', '0')
+    return {
+        'description': fields.get('P') or fields.get('M', ''),
+        'amount': amount,
+        'category': category,
+        'date': day,
+    }
+
+
+def _local(tag):
+    """Element name without its namespace"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _column(reference):
+    """Zero-based column index of a cell reference like 'AB12'"""
+    index = 0
+    for char in reference:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+
+def _xlsx_shared_strings(archive):
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as part:
+        for _, elem in iterparse(part):
+            if _local(elem.tag) == 'si':
+                strings.append(''.join(t.text or '' for t in elem.iter() if _local(t.tag) == 't'))
+                elem.clear()
+    return strings
+
+
+def _xlsx_rows(part, shared):
+    """Yield {column index: value} per worksheet row, clearing parsed rows as it goes"""
+    sheet_data = None
+    cells = {}
+    for event, elem in iterparse(part, events=('start', 'end')):
+        name = _local(elem.tag)
+        if event == 'start':
+            if name == 'sheetData':
+                sheet_data = elem
+            continue
+        if name == 'c':
+            reference = elem.get('r')
+            kind = elem.get('t')
+            if kind == 'inlineStr':
+                value = ''.join(t.text or '' for t in elem.iter() if _local(t.tag) == 't')
+            else:
+                v = next((child for child in elem if _local(child.tag) == 'v'), None)
+                value = v.text if v is not None and v.text is not None else ''
+                if kind == 's' and value:
+                    value = shared[int(value)]
+                elif kind == 'b':
+                    value = 'TRUE' if value == '1' else 'FALSE'
+            cells[_column(reference) if reference else len(cells)] = value
+        elif name == 'row':
+            yield cells
+            cells = {}
+            if sheet_data is not None:
+                sheet_data.clear()
+
+
+def _xlsx_date(value):
+    """ISO date for an Excel serial day number, other values unchanged"""
+    try:
+        serial = float(value)
+    except ValueError:
+        return value
+    if 0 < serial <= EXCEL_MAX_SERIAL:
+        return (EXCEL_EPOCH + timedelta(days=int(serial))).isoformat()
+    return value
+
+
+@register_importer('.xlsx')
+def parse_xlsx(stream, result):
+    """Yield rows of the first worksheet, with a CSV-style header row
+
+    The workbook is read through zipfile, so only the shared strings and
+    the current row are held in memory; the sheet XML is decompressed and
+    parsed incrementally.
+    """
+    with zipfile.ZipFile(stream) as archive:
+        names = set(archive.namelist())
+        shared = _xlsx_shared_strings(archive) if 'xl/sharedStrings.xml' in names else []
+        sheets = sorted(name for name in names if re.fullmatch(r'xl/worksheets/sheet\d+\.xml', name))
+        if not sheets:
+            raise ValueError('Workbook has no worksheets')
+        first = 'xl/worksheets/sheet1.xml' if 'xl/worksheets/sheet1.xml' in names else sheets[0]
+        with archive.open(first) as part:
+            header = None
+            for cells in _xlsx_rows(part, shared):
+                if header is None:
+                    header = {column: str(value).strip().lower() for column, value in cells.items()}
+                    continue
+                record = {header[column]: value for column, value in cells.items() if column in header}
+                if not any(record.values()):
+                    continue
+                if record.get('date'):
+                    record['date'] = _xlsx_date(record['date'])
+                yield record
@@ -0,0 +1,159 @@
+# Static assets - in-memory manifest with content-hash fingerprinted URLs
+import hashlib
+import mimetypes
+import os
+import re
+from datetime import datetime, timezone
+
+from flask import abort, request
+
+from finance_app.compression import COMPRESSIBLE_MIMETYPES, choose_encoding, precompress
+
+
+# Hashed assets never change, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unhashed URLs (HTML pages, direct links) are revalidated with their ETag
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# src="..." / href="..." references that may point at a static asset
+ASSET_REFERENCE = re.compile(r'''((?:src|href)=["'])([^"':?#]+)(["'])''')
+
+
+class Asset:
+    """One static file held in memory"""
+
+    __slots__ = ('path', 'hashed_path', 'data', 'mimetype', 'etag', 'last_modified', 'encoded')
+
+    def __init__(self, path, data, mimetype, last_modified):
+        self.path = path
+        self.data = data
+        self.mimetype = mimetype
+        self.last_modified = last_modified
+        self.etag = hashlib.sha256(data).hexdigest()[:16]
+        root, ext = os.path.splitext(path)
+        self.hashed_path = f'{root}.{self.etag[:10]}{ext}'
+        self.encoded = {}
+
+
+class StaticManifest:
+    """Index of every file under the static folder, built once at startup.
+
+    Each asset is reachable under its plain path and under a fingerprinted
+    path (``style.<hash>.css``). HTML pages have their script and stylesheet
+    references rewritten to the fingerprinted paths, so only the pages
+    themselves need revalidation.
+    """
+
+    def __init__(self, folder, compress_level=None, compress_min_size=0):
+        self.folder = folder
+        self.assets = {}
+        self.hashed = {}
+        for root, _dirs, files in os.walk(folder):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, folder).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                last_modified = datetime.fromtimestamp(os.path.getmtime(full_path), timezone.utc)
+                self.assets[path] = Asset(path, data, mimetype, last_modified)
+
+        # Fingerprint assets first so the pages can reference the hashed names
+        for asset in self.assets.values():
+            if asset.mimetype != 'text/html':
+                self.hashed[asset.hashed_path] = asset
+        for asset in self.assets.values():
+            if asset.mimetype == 'text/html':
+                self._rewrite_references(asset)
+
+        if compress_level is not None:
+            for asset in self.assets.values():
+                if asset.mimetype in COMPRESSIBLE_MIMETYPES and len(asset.data) >= compress_min_size:
+                    asset.encoded = precompress(asset.data, compress_level)
+
+    def _rewrite_references(self, page):
+        """Point a page's local asset references at their fingerprinted paths"""
+        base = os.path.dirname(page.path)
+
+        def replace(match):
+            prefix, target, quote = match.groups()
+            if target.startswith('/'):
+                resolved, leading = target.lstrip('/'), '/'
+            else:
+                resolved, leading = os.path.normpath(os.path.join(base, target)).replace(os.sep, '/'), ''
+            asset = self.assets.get(resolved)
+            if asset is None or asset.mimetype == 'text/html':
+                return match.group(0)
+            hashed = asset.hashed_path if leading else os.path.relpath(asset.hashed_path, base or '.')
+            return f'{prefix}{leading}{hashed}{quote}'
+
+        text = page.data.decode('utf-8')
+        page.data = ASSET_REFERENCE.sub(replace, text).encode('utf-8')
+        page.etag = hashlib.sha256(page.data).hexdigest()[:16]
+
+    def url_for(self, path):
+        """Fingerprinted URL of a static file, or its plain URL if unknown"""
+        asset = self.assets.get(path)
+        return '/' + (asset.hashed_path if asset and asset.mimetype != 'text/html' else path)
+
+    def lookup(self, path):
+        """Return (asset, immutable) for a request path, or (None, False)"""
+        asset = self.hashed.get(path)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(path), False
+
+
+def send_asset(app, asset, immutable):
+    """Build the response for an in-memory asset, honouring conditional requests"""
+    encoding = choose_encoding(request.accept_encodings) if asset.encoded else None
+    body = asset.encoded.get(encoding) if encoding else None
+    if body is None:
+        body, encoding = asset.data, None
+
+    response = app.response_class(body, mimetype=asset.mimetype)
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(f'{asset.etag}-{encoding}' if encoding else asset.etag)
+    response.last_modified = asset.last_modified
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    return response.make_conditional(request)
+
+
+def init_static(app):
+    """Build the manifest and register the routes that serve it"""
+    compress_level = app.config['COMPRESS_LEVEL'] if app.config['COMPRESS_ENABLED'] else None
+
+    def build_manifest():
+        return StaticManifest(app.static_folder, compress_level, app.config['COMPRESS_MIN_SIZE'])
+
+    app.extensions['static_manifest'] = build_manifest()
+
+    def get_manifest():
+        # Debug servers pick up edits to static files without a restart
+        if app.debug:
+            app.extensions['static_manifest'] = build_manifest()
+        return app.extensions['static_manifest']
+
+    app.jinja_env.globals['asset_url'] = lambda path: get_manifest().url_for(path)
+
+    @app.route('/')
+    def index():
+        return send_asset(app, get_manifest().assets['index.html'], immutable=False)
+
+    @app.route('/<path:path>')
+    def serve_static(path):
+        # Skip API routes - they're handled by the API blueprint
+        if path.startswith('api/'):
+            abort(404)
+
+        manifest = get_manifest()
+        asset, immutable = manifest.lookup(path)
+        if asset is not None:
+            return send_asset(app, asset, immutable)
+
+        # Unknown HTML routes fall back to index.html, other misses are 404s
+        if '.' not in path.split('/')[-1] or path.endswith('.html'):
+            return send_asset(app, manifest.assets['index.html'], immutable=False)
+        abort(404)
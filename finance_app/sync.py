@@ -0,0 +1,105 @@
+# Delta sync - per-user change versions and tombstones for offline clients
+"""
+Every insert, update and delete of a user's expenses and budgets bumps the
+user's version in sync_state and stamps the row with it (updated_at too);
+deletes leave a tombstone carrying theirs. The triggers doing this are
+created by migrations._sync_versions. A client keeps the version of its last
+sync and asks ``/api/sync?since=<version>`` for what changed after it, at a
+cost proportional to the changes rather than to the ledger.
+
+Maintenance that moves rows without changing them (archiving, shard moves)
+silences the triggers with `pause()` inside its transaction, and so do bulk
+imports, which stamp all their rows with one `bump()` instead of one each.
+Clients whose version predates sync_state.reset_version (the user was moved,
+or tombstones they have not seen were pruned) get a full snapshot instead.
+"""
+from datetime import datetime, timedelta
+
+from finance_app import archive
+
+# Tombstones older than this are pruned by maintenance (clients this far behind resync fully)
+TOMBSTONE_DAYS = 90
+
+_BUMP = '''
+    INSERT INTO sync_state (user_id, version) VALUES (?, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+'''
+
+
+def pause(conn, reason):
+    """Silence the sync triggers for the rest of conn's transaction"""
+    conn.execute('INSERT INTO sync_pause (reason) VALUES (?)', (reason,))
+
+
+def resume(conn):
+    """Re-enable the sync triggers before committing"""
+    conn.execute('DELETE FROM sync_pause')
+
+
+def bump(conn, user_id):
+    """Advance the user's version, returning the new one"""
+    conn.execute(_BUMP, (user_id,))
+    return conn.execute('SELECT version FROM sync_state WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def record_deletion(conn, user_id, kind, row_id):
+    """Tombstone a row removed without a DELETE on its table (e.g. restored from the archive)"""
+    conn.execute('INSERT OR REPLACE INTO tombstone (user_id, kind, row_id, version) VALUES (?, ?, ?, ?)',
+                 (user_id, kind, row_id, bump(conn, user_id)))
+
+
+def force_full_sync(conn, user_id):
+    """Make every client of the user resync from scratch, e.g. after its rows got new ids"""
+    conn.execute('UPDATE sync_state SET reset_version = ? WHERE user_id = ?', (bump(conn, user_id), user_id))
+
+
+def state(db, user_id):
+    """(version, reset_version) of a user, (0, 0) before their first change"""
+    row = db.execute('SELECT version, reset_version FROM sync_state WHERE user_id = ?', (user_id,)).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def changes(db, user_id, since=None):
+    """(version, full, expense rows, budget rows, {kind: deleted ids}) after version since
+
+    The version is read first, so rows changed while this runs may also be
+    returned; applying a change twice is harmless. A full snapshot (since
+    None, too old or unknown) includes archived expenses.
+    """
+    version, reset_version = state(db, user_id)
+    full = since is None or since < reset_version or since > version
+    if full:
+        expenses = db.execute(
+            f'SELECT * FROM {archive.expense_source(db, user_id)} WHERE user_id = ? ORDER BY id', (user_id,)
+        ).fetchall()
+        budgets = db.execute('SELECT * FROM budget WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+        return version, True, expenses, budgets, {}
+
+    expenses = db.execute(
+        'SELECT * FROM expense WHERE user_id = ? AND version > ? ORDER BY version', (user_id, since)
+    ).fetchall()
+    budgets = db.execute(
+        'SELECT * FROM budget WHERE user_id = ? AND version > ? ORDER BY version', (user_id, since)
+    ).fetchall()
+    deleted = {}
+    for kind, row_id in db.execute(
+        'SELECT kind, row_id FROM tombstone WHERE user_id = ? AND version > ? ORDER BY version', (user_id, since)
+    ):
+        deleted.setdefault(kind, []).append(row_id)
+    return version, False, expenses, budgets, deleted
+
+
+def prune_tombstones(conn, days=TOMBSTONE_DAYS):
+    """Drop tombstones older than days, sending clients that missed them to a full sync
+
+    Returns the number pruned.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute('''
+        UPDATE sync_state SET reset_version = MAX(reset_version, (
+            SELECT MAX(version) FROM tombstone
+            WHERE tombstone.user_id = sync_state.user_id AND deleted_at < ?
+        ))
+        WHERE user_id IN (SELECT user_id FROM tombstone WHERE deleted_at < ?)
+    ''', (cutoff, cutoff))
+    return conn.execute('DELETE FROM tombstone WHERE deleted_at < ?', (cutoff,)).rowcount
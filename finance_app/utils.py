@@ -1,6 +1,8 @@
 # Small helper functions (e.g. format currency, calculate totals, etc.)
 from datetime import datetime, timedelta
-from finance_app.database import get_db
+from finance_app.database import get_analytics_db, get_db
+from finance_app import analytics
+from finance_app.dates import month_key
 from collections import defaultdict
 
 
@@ -23,19 +25,52 @@ def calculate_monthly_totals(expenses):
     """Calculate total spending per month"""
     totals = defaultdict(float)
     for expense in expenses:
-        date_str = expense['date']
-        if isinstance(date_str, str):
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-        else:
-            date_obj = date_str
-        key = f"{date_obj.year}-{date_obj.month:02d}"
-        totals[key] += expense['amount']
+        totals[month_key(expense['date'])] += expense['amount']
     return dict(totals)
 
 
-def get_budget_status(user_id, category, month, year):
+def get_category_totals(user_id):
+    """Get total spending per category for all of a user's expenses, archived ones included"""
+    if analytics.enabled():
+        return analytics.get_columns(user_id).category_totals()
+    
+    db = get_analytics_db(user_id)
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT category, SUM(total) as total
+        FROM (
+            SELECT category, SUM(amount) as total FROM expense WHERE user_id = ? GROUP BY category
+            UNION ALL
+            SELECT category, SUM(total) as total FROM expense_rollup WHERE user_id = ? GROUP BY category
+        )
+        GROUP BY category
+        ORDER BY total DESC
+    ''', (user_id, user_id))
+    return {row['category']: row['total'] for row in cursor.fetchall()}
+
+
+def get_trend_months(today=None, count=6):
+    """Get (year, month) pairs for the last `count` months, oldest first"""
+    if today is None:
+        today = datetime.now().date()
+    months = []
+    for i in range(count - 1, -1, -1):
+        month_date = today - timedelta(days=30 * i)
+        months.append((month_date.year, month_date.month))
+    return months
+
+
+def get_monthly_trends(user_id, months):
+    """Get total spending for each (year, month) pair in months"""
+    if analytics.enabled():
+        return analytics.get_columns(user_id).monthly_totals(months)
+    return [get_monthly_total(user_id, month, year) for year, month in months]
+
+
+def get_budget_status(user_id, category, month, year, db=None):
     """Get budget status for a category in a given month"""
-    db = get_db()
+    if db is None:
+        db = get_db(user_id=user_id)
     cursor = db.cursor()
     
     # Get budget
@@ -76,7 +111,7 @@ def get_weekly_comparison(user_id):
     start_of_last_week = start_of_week - timedelta(days=7)
     end_of_last_week = start_of_last_week + timedelta(days=6)
     
-    db = get_db()
+    db = get_db(user_id=user_id)
     cursor = db.cursor()
     
     # This week
@@ -112,14 +147,17 @@ def get_monthly_total(user_id, month=None, year=None):
     if year is None:
         year = datetime.now().year
     
-    db = get_db()
+    db = get_db(user_id=user_id)
     cursor = db.cursor()
     
+    # Archived months are read from their rollups
     cursor.execute('''
-        SELECT COALESCE(SUM(amount), 0) as total
+        SELECT COALESCE(SUM(amount), 0) + (
+            SELECT COALESCE(SUM(total), 0) FROM expense_rollup WHERE user_id = ? AND month = ?
+        ) as total
         FROM expense
         WHERE user_id = ? AND strftime('%m', date) = ? AND strftime('%Y', date) = ?
-    ''', (user_id, f"{month:02d}", str(year)))
+    ''', (user_id, f"{year}-{month:02d}", user_id, f"{month:02d}", str(year)))
     
     result = cursor.fetchone()
     return result['total'] if result else 0.0
@@ -132,7 +170,7 @@ def get_top_categories(user_id, month=None, year=None, limit=3):
     if year is None:
         year = datetime.now().year
     
-    db = get_db()
+    db = get_db(user_id=user_id)
     cursor = db.cursor()
     
     cursor.execute('''
@@ -155,7 +193,7 @@ def get_category_comparison(user_id, category, month=None, year=None):
     if year is None:
         year = datetime.now().year
     
-    db = get_db()
+    db = get_db(user_id=user_id)
     cursor = db.cursor()
     
     # Current month
@@ -197,7 +235,7 @@ def predict_budget_overrun(user_id, category, month=None, year=None):
     if year is None:
         year = datetime.now().year
     
-    db = get_db()
+    db = get_db(user_id=user_id)
     cursor = db.cursor()
     
     # Get budget
@@ -0,0 +1,26 @@
+# Gunicorn settings - loaded automatically by `gunicorn app:app` from this directory
+from finance_app import server
+
+bind = server.bind_address()
+workers = server.worker_count()
+threads = server.thread_count()
+# Threaded workers: slow exports and uploads hold a thread, not a process
+worker_class = 'gthread'
+
+# Import the app (and build the static manifest) once in the master; workers
+# share those pages copy-on-write and fork without re-running create_app
+preload_app = True
+post_fork = server.post_fork
+
+# TERM/HUP give in-flight requests this long; USR2 reloads code (see server.reload)
+graceful_timeout = 30
+pidfile = server.pidfile()
+# The heartbeat of gthread workers is not blocked by long requests
+timeout = 60
+keepalive = 5
+# Recycle workers now and then; with preload_app a fork is cheap
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = '-'
+errorlog = '-'
@@ -71,8 +71,10 @@ class API {
     }
 
     // Dashboard
-    static async getDashboard() {
-        return this.request('/dashboard');
+    static async getDashboard(options = {}) {
+        const params = new URLSearchParams(options);
+        const query = params.toString();
+        return this.request(query ? `/dashboard?${query}` : '/dashboard');
     }
 
     // Expenses
@@ -126,6 +128,11 @@ class API {
         return this.request('/charts/monthly');
     }
 
+    // Live updates (Server-Sent Events)
+    static eventsUrl(since) {
+        return since === undefined ? `${API_BASE_URL}/events` : `${API_BASE_URL}/events?since=${since}`;
+    }
+
     // Export
     static async exportExpenses() {
         try {
@@ -1,6 +1,109 @@
 // Chart.js initialization and configuration
 // This file handles all chart rendering for the dashboard
-// Note: Charts are now initialized directly in dashboard.js
+// Note: The dashboard renders from the series in /api/dashboard?include=charts
+// with renderCategoryChart/renderMonthlyChart; the init* functions below fetch
+// their own data and are kept for pages that use data-api-url canvases
+
+const CATEGORY_COLORS = [
+    '#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0',
+    '#9966FF', '#FF9F40', '#FF6384', '#C9CBCF',
+    '#4BC0C0', '#FF6384'
+];
+
+/**
+ * Render the category pie chart, updating an existing chart in place
+ * @param {string} canvasId - Canvas element id
+ * @param {{labels: string[], data: number[]}} series - Category chart series
+ * @param {Chart|null} chart - Chart returned by a previous call
+ * @returns {Chart} The rendered chart
+ */
+function renderCategoryChart(canvasId, series, chart = null) {
+    if (chart) {
+        chart.data.labels = series.labels;
+        chart.data.datasets[0].data = series.data;
+        chart.update();
+        return chart;
+    }
+
+    return new Chart(document.getElementById(canvasId).getContext('2d'), {
+        type: 'pie',
+        data: {
+            labels: series.labels,
+            datasets: [{
+                data: series.data,
+                backgroundColor: CATEGORY_COLORS
+            }]
+        },
+        options: {
+            responsive: true,
+            plugins: {
+                legend: {
+                    position: 'right'
+                },
+                tooltip: {
+                    callbacks: {
+                        label: function(context) {
+                            return context.label + ': ' + formatCurrency(context.parsed);
+                        }
+                    }
+                }
+            }
+        }
+    });
+}
+
+/**
+ * Render the monthly trend line chart, updating an existing chart in place
+ * @param {string} canvasId - Canvas element id
+ * @param {{labels: string[], data: number[]}} series - Monthly chart series
+ * @param {Chart|null} chart - Chart returned by a previous call
+ * @returns {Chart} The rendered chart
+ */
+function renderMonthlyChart(canvasId, series, chart = null) {
+    if (chart) {
+        chart.data.labels = series.labels;
+        chart.data.datasets[0].data = series.data;
+        chart.update();
+        return chart;
+    }
+
+    return new Chart(document.getElementById(canvasId).getContext('2d'), {
+        type: 'line',
+        data: {
+            labels: series.labels,
+            datasets: [{
+                label: 'Monthly Spending',
+                data: series.data,
+                borderColor: '#36A2EB',
+                backgroundColor: 'rgba(54, 162, 235, 0.1)',
+                tension: 0.4,
+                fill: true
+            }]
+        },
+        options: {
+            responsive: true,
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    ticks: {
+                        callback: function(value) {
+                            return formatCurrency(value);
+                        }
+                    }
+                }
+            },
+            plugins: {
+                tooltip: {
+                    callbacks: {
+                        label: function(context) {
+                            return 'Monthly Spending: ' + formatCurrency(context.parsed.y);
+                        }
+                    }
+                }
+            }
+        }
+    });
+}
 
 /**
  * Initialize the category pie chart
@@ -1,6 +1,8 @@
 // Dashboard page functionality
 let categoryChart = null;
 let monthlyChart = null;
+// Last dashboard payload, patched in place by live updates
+let dashboardData = null;
 
 document.addEventListener('DOMContentLoaded', async () => {
     // Check authentication
@@ -12,102 +14,19 @@ document.addEventListener('DOMContentLoaded', async () => {
 
     // Load dashboard data
     await loadDashboard();
+
+    // Apply server-sent deltas instead of reloading
+    subscribeToUpdates();
 });
 
 async function loadDashboard() {
     try {
-        const data = await API.getDashboard();
-        
-        // Update summary cards
-        document.getElementById('thisWeek').textContent = formatCurrency(data.this_week);
-        document.getElementById('lastWeek').textContent = formatCurrency(data.last_week);
-        
-        const weekChangeEl = document.getElementById('weekChange');
-        if (data.week_change !== 0) {
-            weekChangeEl.textContent = `${data.week_change.toFixed(1)}% vs last week`;
-            weekChangeEl.className = `change ${data.week_change > 0 ? 'positive' : 'negative'}`;
-            weekChangeEl.style.display = 'block';
-        } else {
-            weekChangeEl.style.display = 'none';
-        }
-        
-        document.getElementById('monthlyTotal').textContent = formatCurrency(data.monthly_total);
-        
-        // Budget alerts
-        if (data.budget_alerts && data.budget_alerts.length > 0) {
-            const alertsDiv = document.getElementById('budgetAlerts');
-            const alertsList = document.getElementById('alertsList');
-            alertsDiv.style.display = 'block';
-            alertsList.innerHTML = '';
-            
-            data.budget_alerts.forEach(alert => {
-                const alertDiv = document.createElement('div');
-                alertDiv.className = `alert ${alert.is_over ? 'alert-danger' : 'alert-warning'}`;
-                alertDiv.innerHTML = `
-                    <strong>${alert.category}:</strong> 
-                    Spent ${formatCurrency(alert.spent)} of ${formatCurrency(alert.budget)} 
-                    (${alert.percentage.toFixed(1)}%)
-                    ${alert.is_over ? 
-                        `- Over budget by ${formatCurrency(Math.abs(alert.remaining))}` : 
-                        `- Warning: ${(100 - alert.percentage).toFixed(1)}% remaining`
-                    }
-                `;
-                alertsList.appendChild(alertDiv);
-            });
-        }
-        
-        // Insights
-        if (data.insights && data.insights.length > 0) {
-            const insightsDiv = document.getElementById('insights');
-            const insightsList = document.getElementById('insightsList');
-            insightsDiv.style.display = 'block';
-            insightsList.innerHTML = '';
-            
-            data.insights.forEach(insight => {
-                const li = document.createElement('li');
-                li.textContent = insight;
-                insightsList.appendChild(li);
-            });
-        }
-        
-        // Recent expenses
-        const recentExpensesDiv = document.getElementById('recentExpenses');
-        if (data.recent_expenses && data.recent_expenses.length > 0) {
-            let html = `
-                <table class="expense-table">
-                    <thead>
-                        <tr>
-                            <th>Date</th>
-                            <th>Description</th>
-                            <th>Category</th>
-                            <th>Amount</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            `;
-            
-            data.recent_expenses.forEach(expense => {
-                html += `
-                    <tr>
-                        <td>${expense.date}</td>
-                        <td>${expense.description}</td>
-                        <td><span class="category-badge">${expense.category}</span></td>
-                        <td>${formatCurrency(expense.amount)}</td>
-                    </tr>
-                `;
-            });
-            
-            html += `
-                    </tbody>
-                </table>
-            `;
-            recentExpensesDiv.innerHTML = html;
-        } else {
-            recentExpensesDiv.innerHTML = '<p>No expenses yet. <a href="/expenses.html">Add your first expense</a>!</p>';
-        }
-        
-        // Load charts
-        await loadCharts();
+        dashboardData = await API.getDashboard({ include: 'charts' });
+        renderSummary(dashboardData);
+        renderBudgetAlerts(dashboardData);
+        renderInsights(dashboardData);
+        renderRecentExpenses(dashboardData);
+        renderCharts(dashboardData.charts);
         
     } catch (error) {
         console.error('Failed to load dashboard:', error);
@@ -115,93 +34,211 @@ async function loadDashboard() {
     }
 }
 
-async function loadCharts() {
-    try {
-        // Category chart
-        const categoryData = await API.getCategoryChart();
-        const categoryCtx = document.getElementById('categoryChart').getContext('2d');
-        
-        if (categoryChart) {
-            categoryChart.destroy();
-        }
+function renderSummary(data) {
+    // Update summary cards
+    document.getElementById('thisWeek').textContent = formatCurrency(data.this_week);
+    document.getElementById('lastWeek').textContent = formatCurrency(data.last_week);
+    
+    const weekChangeEl = document.getElementById('weekChange');
+    if (data.week_change !== 0) {
+        weekChangeEl.textContent = `${data.week_change.toFixed(1)}% vs last week`;
+        weekChangeEl.className = `change ${data.week_change > 0 ? 'positive' : 'negative'}`;
+        weekChangeEl.style.display = 'block';
+    } else {
+        weekChangeEl.style.display = 'none';
+    }
+    
+    document.getElementById('monthlyTotal').textContent = formatCurrency(data.monthly_total);
+}
+
+function renderBudgetAlerts(data) {
+    // Budget alerts
+    const alertsDiv = document.getElementById('budgetAlerts');
+    const alertsList = document.getElementById('alertsList');
+    if (data.budget_alerts && data.budget_alerts.length > 0) {
+        alertsDiv.style.display = 'block';
+        alertsList.innerHTML = '';
         
-        categoryChart = new Chart(categoryCtx, {
-            type: 'pie',
-            data: {
-                labels: categoryData.labels,
-                datasets: [{
-                    data: categoryData.data,
-                    backgroundColor: [
-                        '#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0',
-                        '#9966FF', '#FF9F40', '#FF6384', '#C9CBCF',
-                        '#4BC0C0', '#FF6384'
-                    ]
-                }]
-            },
-            options: {
-                responsive: true,
-                plugins: {
-                    legend: {
-                        position: 'right'
-                    },
-                    tooltip: {
-                        callbacks: {
-                            label: function(context) {
-                                return context.label + ': ' + formatCurrency(context.parsed);
-                            }
-                        }
-                    }
+        data.budget_alerts.forEach(alert => {
+            const alertDiv = document.createElement('div');
+            alertDiv.className = `alert ${alert.is_over ? 'alert-danger' : 'alert-warning'}`;
+            alertDiv.innerHTML = `
+                <strong>${alert.category}:</strong> 
+                Spent ${formatCurrency(alert.spent)} of ${formatCurrency(alert.budget)} 
+                (${alert.percentage.toFixed(1)}%)
+                ${alert.is_over ? 
+                    `- Over budget by ${formatCurrency(Math.abs(alert.remaining))}` : 
+                    `- Warning: ${(100 - alert.percentage).toFixed(1)}% remaining`
                 }
-            }
+            `;
+            alertsList.appendChild(alertDiv);
         });
+    } else {
+        alertsDiv.style.display = 'none';
+    }
+}
+
+function renderInsights(data) {
+    // Insights
+    if (data.insights && data.insights.length > 0) {
+        const insightsDiv = document.getElementById('insights');
+        const insightsList = document.getElementById('insightsList');
+        insightsDiv.style.display = 'block';
+        insightsList.innerHTML = '';
         
-        // Monthly chart
-        const monthlyData = await API.getMonthlyChart();
-        const monthlyCtx = document.getElementById('monthlyChart').getContext('2d');
+        data.insights.forEach(insight => {
+            const li = document.createElement('li');
+            li.textContent = insight;
+            insightsList.appendChild(li);
+        });
+    }
+}
+
+function renderRecentExpenses(data) {
+    // Recent expenses
+    const recentExpensesDiv = document.getElementById('recentExpenses');
+    if (data.recent_expenses && data.recent_expenses.length > 0) {
+        let html = `
+            <table class="expense-table">
+                <thead>
+                    <tr>
+                        <th>Date</th>
+                        <th>Description</th>
+                        <th>Category</th>
+                        <th>Amount</th>
+                    </tr>
+                </thead>
+                <tbody>
+        `;
         
-        if (monthlyChart) {
-            monthlyChart.destroy();
-        }
+        data.recent_expenses.forEach(expense => {
+            html += `
+                <tr>
+                    <td>${expense.date}</td>
+                    <td>${expense.description}</td>
+                    <td><span class="category-badge">${expense.category}</span></td>
+                    <td>${formatCurrency(expense.amount)}</td>
+                </tr>
+            `;
+        });
         
-        monthlyChart = new Chart(monthlyCtx, {
-            type: 'line',
-            data: {
-                labels: monthlyData.labels,
-                datasets: [{
-                    label: 'Monthly Spending',
-                    data: monthlyData.data,
-                    borderColor: '#36A2EB',
-                    backgroundColor: 'rgba(54, 162, 235, 0.1)',
-                    tension: 0.4,
-                    fill: true
-                }]
-            },
-            options: {
-                responsive: true,
-                scales: {
-                    y: {
-                        beginAtZero: true,
-                        ticks: {
-                            callback: function(value) {
-                                return formatCurrency(value);
-                            }
-                        }
-                    }
-                },
-                plugins: {
-                    tooltip: {
-                        callbacks: {
-                            label: function(context) {
-                                return 'Monthly Spending: ' + formatCurrency(context.parsed.y);
-                            }
-                        }
-                    }
-                }
+        html += `
+                </tbody>
+            </table>
+        `;
+        recentExpensesDiv.innerHTML = html;
+    } else {
+        recentExpensesDiv.innerHTML = '<p>No expenses yet. <a href="/expenses.html">Add your first expense</a>!</p>';
+    }
+}
+
+function renderCharts(charts) {
+    // Series come with the dashboard payload, no separate chart requests
+    categoryChart = renderCategoryChart('categoryChart', charts.category, categoryChart);
+    monthlyChart = renderMonthlyChart('monthlyChart', charts.monthly, monthlyChart);
+}
+
+// Live updates: the server pushes small deltas after each write
+
+function subscribeToUpdates() {
+    if (!window.EventSource) {
+        return;
+    }
+
+    // The server answers each poll and closes; the browser polls again with
+    // the last version it saw, and gets 'refresh' if it missed anything
+    const since = dashboardData ? dashboardData.version : undefined;
+    const source = new EventSource(API.eventsUrl(since), { withCredentials: true });
+
+    source.addEventListener('expense', (e) => applyExpenseEvent(JSON.parse(e.data)));
+    source.addEventListener('budget', (e) => applyBudgetEvent(JSON.parse(e.data)));
+    source.addEventListener('refresh', async () => {
+        // The reload may already contain changes after this stream's version;
+        // continue from the reloaded version so none is applied twice
+        source.close();
+        await loadDashboard();
+        subscribeToUpdates();
+    });
+}
+
+function applyExpenseEvent(event) {
+    if (!dashboardData) {
+        return;
+    }
+
+    // Signed amounts, already placed in week/month buckets by the server
+    event.deltas.forEach(delta => {
+        if (delta.this_week) {
+            dashboardData.this_week += delta.amount;
+        }
+        if (delta.last_week) {
+            dashboardData.last_week += delta.amount;
+        }
+        if (delta.this_month) {
+            dashboardData.monthly_total += delta.amount;
+        }
+
+        const totals = dashboardData.category_totals;
+        totals[delta.category] = (totals[delta.category] || 0) + delta.amount;
+        if (Math.abs(totals[delta.category]) < 0.005) {
+            delete totals[delta.category];
+        }
+
+        if (delta.month in dashboardData.monthly_trends) {
+            dashboardData.monthly_trends[delta.month] += delta.amount;
+        }
+
+        const monthly = dashboardData.charts.monthly;
+        monthly.months.forEach((month, i) => {
+            if (month === delta.month) {
+                monthly.data[i] += delta.amount;
             }
         });
-        
-    } catch (error) {
-        console.error('Failed to load charts:', error);
+    });
+    dashboardData.week_change = weekChange(dashboardData.this_week, dashboardData.last_week);
+
+    // Recent expenses: drop the old version, insert the new one in date order
+    const changedId = (event.expense || event.previous).id;
+    let recent = dashboardData.recent_expenses.filter(expense => expense.id !== changedId);
+    if (event.expense) {
+        recent.push(event.expense);
+        recent.sort((a, b) => b.date.localeCompare(a.date) || b.created_at.localeCompare(a.created_at));
+        recent = recent.slice(0, 10);
     }
+    dashboardData.recent_expenses = recent;
+
+    renderSummary(dashboardData);
+    renderRecentExpenses(dashboardData);
+    updateCharts();
 }
 
+function applyBudgetEvent(status) {
+    if (!dashboardData) {
+        return;
+    }
+
+    const alerts = dashboardData.budget_alerts.filter(alert => alert.category !== status.category);
+    if (status.is_over || status.is_warning) {
+        alerts.push(status);
+    }
+    dashboardData.budget_alerts = alerts;
+    renderBudgetAlerts(dashboardData);
+}
+
+function weekChange(thisWeek, lastWeek) {
+    // Same rule as get_weekly_comparison on the server
+    if (lastWeek === 0) {
+        return thisWeek === 0 ? 0 : 100;
+    }
+    return ((thisWeek - lastWeek) / lastWeek) * 100;
+}
+
+function updateCharts() {
+    // Category order follows the totals, as in get_category_totals
+    const entries = Object.entries(dashboardData.category_totals).sort((a, b) => b[1] - a[1]);
+    dashboardData.charts.category = {
+        labels: entries.map(entry => entry[0]),
+        data: entries.map(entry => entry[1])
+    };
+    renderCharts(dashboardData.charts);
+}
@@ -1,4 +1,6 @@
 // Upload page functionality
+const STATEMENT_EXTENSIONS = ['.csv', '.ofx', '.qfx', '.qif', '.xlsx'];
+
 document.addEventListener('DOMContentLoaded', async () => {
     // Check authentication
     const user = await checkAuthentication();
@@ -20,8 +22,9 @@ document.addEventListener('DOMContentLoaded', async () => {
             return;
         }
 
-        if (!file.name.endsWith('.csv')) {
-            showMessage('Please upload a CSV file', 'error');
+        const extension = file.name.slice(file.name.lastIndexOf('.')).toLowerCase();
+        if (!STATEMENT_EXTENSIONS.includes(extension)) {
+            showMessage('Please upload a CSV, OFX, QFX, QIF or XLSX file', 'error');
             return;
         }
 
@@ -0,0 +1,32 @@
+"""
+Shared fixtures: an app against a throwaway database and a logged-in
+client. Run from the repository root with ``python -m pytest``.
+"""
+import pytest
+
+from finance_app import create_app
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', str(tmp_path / 'test.db'))
+    monkeypatch.setenv('ARCHIVE_AFTER_MONTHS', '12')
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+def register(app, username):
+    """A test client logged in as a new user, and the user's id"""
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com',
+        'password': 'password', 'confirm_password': 'password',
+    })
+    assert response.status_code == 201, response.get_json()
+    return client, response.get_json()['user']['id']
+
+
+@pytest.fixture
+def client(app):
+    return register(app, 'tester')[0]
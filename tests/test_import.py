@@ -0,0 +1,65 @@
+"""CSV imports parsed in the request thread and by the process pool store the same rows"""
+import io
+
+import pytest
+
+from finance_app import importer
+from finance_app.database import get_db
+
+from conftest import register
+
+
+def make_csv(count):
+    lines = ['date,description,amount,category']
+    for i in range(count):
+        if i % 5 == 4:
+            # The same expense twice in a day is kept twice
+            lines.append(lines[-1])
+            continue
+        description = ['Coffee', '"Corner shop, ""north"""', '"Two\nlines"', 'Café'][i % 4]
+        lines.append(f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d},{description},{i % 97 + 0.5},{"" if i % 3 else "Food"}')
+    lines.append('not a date,Broken,1.0,Food')
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+@pytest.fixture
+def pool_cleanup():
+    yield
+    if importer._pool is not None:
+        importer._pool.shutdown()
+        importer._pool = None
+
+
+def stored_rows(user_id):
+    return [tuple(row) for row in get_db().execute('''
+        SELECT description, amount, category, date, fingerprint FROM expense WHERE user_id = ? ORDER BY id
+    ''', (user_id,))]
+
+
+def test_parallel_import_matches_serial(app, monkeypatch, pool_cleanup):
+    data = make_csv(3000)
+    _, serial_user = register(app, 'serial')
+    _, parallel_user = register(app, 'parallel')
+    # Small blocks, so records (and quoted newlines) are cut across many of them
+    monkeypatch.setattr(importer, 'PARALLEL_CHUNK_SIZE', 4096)
+
+    with app.app_context():
+        serial = importer.import_file(get_db(), serial_user, 'statement.csv', io.BytesIO(data), workers=1)
+        parallel = importer.import_file(get_db(), parallel_user, 'statement.csv', io.BytesIO(data),
+                                        workers=2, parallel_min_size=0)
+        assert importer._pool is not None
+
+        assert serial.to_dict() | {'rows_per_second': 0} == parallel.to_dict() | {'rows_per_second': 0}
+        assert serial.imported_count == 3000
+        assert len(serial.errors) == 1
+        assert stored_rows(serial_user) == stored_rows(parallel_user)
+
+
+def test_reimport_adds_nothing(app):
+    data = make_csv(200)
+    _, user_id = register(app, 'reimport')
+    with app.app_context():
+        first = importer.import_file(get_db(), user_id, 'statement.csv', io.BytesIO(data))
+        again = importer.import_file(get_db(), user_id, 'statement.csv', io.BytesIO(data))
+    assert (first.imported_count, first.duplicate_count) == (200, 0)
+    assert (again.imported_count, again.duplicate_count) == (0, 200)
@@ -0,0 +1,72 @@
+"""Delta sync after updates, deletes and restores from the archive"""
+from datetime import date
+
+from finance_app import archive
+
+
+def add_expense(client, amount=10.0, day=None):
+    response = client.post('/api/expenses', json={
+        'description': 'Coffee', 'amount': amount, 'category': 'Food',
+        'date': day or date.today().isoformat(),
+    })
+    assert response.status_code == 201
+    return response.get_json()['expense']
+
+
+def version(client):
+    return client.get('/api/sync').get_json()['version']
+
+
+def delta(client, since):
+    changes = client.get(f'/api/sync?since={since}').get_json()
+    assert not changes['full']
+    return changes
+
+
+def test_update_is_sent_as_a_changed_row(client):
+    expense = add_expense(client)
+    since = version(client)
+
+    response = client.put(f"/api/expenses/{expense['id']}", json={
+        'description': 'Coffee', 'amount': 12.5, 'category': 'Food', 'date': expense['date'],
+    })
+    assert response.status_code == 200
+
+    changes = delta(client, since)
+    assert [(e['id'], e['amount']) for e in changes['expenses']] == [(expense['id'], 12.5)]
+    assert changes['deleted'] == {}
+    assert changes['version'] > since
+
+
+def test_delete_is_sent_as_a_tombstone(client):
+    kept = add_expense(client)
+    deleted = add_expense(client)
+    since = version(client)
+
+    assert client.delete(f"/api/expenses/{deleted['id']}").status_code == 200
+
+    changes = delta(client, since)
+    assert changes['expenses'] == []
+    assert changes['deleted'] == {'expense': [deleted['id']]}
+    assert [e['id'] for e in delta(client, 0)['expenses']] == [kept['id']]
+
+
+def test_restore_keeps_the_archived_id(app, client):
+    old = add_expense(client, day='2020-01-15')
+    add_expense(client)
+    with app.app_context():
+        assert sum(archive.archive_all().values()) == 1
+    since = version(client)
+
+    response = client.put(f"/api/expenses/{old['id']}", json={
+        'description': 'Coffee', 'amount': 7.0, 'category': 'Food', 'date': old['date'],
+    })
+    assert response.status_code == 200
+    assert response.get_json()['expense']['id'] == old['id']
+
+    changes = delta(client, since)
+    assert [(e['id'], e['amount']) for e in changes['expenses']] == [(old['id'], 7.0)]
+    assert changes['deleted'] == {}
+    # The full snapshot holds the row once, back in the hot table
+    full = client.get('/api/sync').get_json()
+    assert sorted(e['id'] for e in full['expenses']).count(old['id']) == 1